@@ -12,6 +12,8 @@
                                   :deployment_id           deployment-id
                                   :workflow_id             (:workflow parameters)
                                   :force                   (:force parameters)
+                                  :queue                   (or (:queue parameters) false)
+                                  :dedup_window            (or (:dedup_window parameters) 0)
                                   :allow_custom_parameters (:allow_custom_parameters parameters)
                                   :parameters              (:workflow_parameters parameters)})]
       (clj-http.client/post resource-uri
@@ -0,0 +1,255 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Admission control for the rest service.
+
+Requests are admitted (or rejected with a 429 response and a Retry-After
+header) before they are handled, so that a few clients issuing expensive
+requests (e.g. arbitrary elasticsearch queries through /search and
+/events) fail fast rather than saturating elasticsearch and the rest
+workers, and rather than queueing until they time out.
+
+Each request is matched against the configured rules by its endpoint (the
+lower cased name of the resource class, e.g. 'search', 'blueprintsid')
+and http method. A rule may limit the number of concurrent requests it
+matches (concurrency), their rate (a token bucket refilled at 'rate'
+requests per second, holding up to 'burst' tokens) and assign them a
+priority class. Requests matching no rule are of the 'normal' priority.
+
+Priority classes apply to the total number of requests in progress: a
+request is only admitted while the requests in progress are below its
+class' share of max_concurrent_requests, so low priority requests (e.g.
+searches) are rejected first and capacity is left for critical ones
+(e.g. agents updating node instances).
+
+The state is kept per process, so with pre-forked workers the limits apply
+per worker. Admission control is enabled by the admission_control
+configuration, e.g.:
+
+    admission_control:
+      max_concurrent_requests: 32
+      rules:
+        - endpoint: search
+          priority: low
+          concurrency: 4
+          rate: 10
+          burst: 20
+        - endpoint: nodeinstancesid
+          methods: [PATCH]
+          priority: critical
+
+When no rules are configured, DEFAULT_RULES apply.
+"""
+
+import math
+import time
+import threading
+
+from flask import g, request, jsonify
+
+from manager_rest import config
+from manager_rest import manager_exceptions
+
+PRIORITY_CRITICAL = 'critical'
+PRIORITY_NORMAL = 'normal'
+PRIORITY_LOW = 'low'
+
+# the share of max_concurrent_requests each priority class may use
+PRIORITY_CLASSES = {
+    PRIORITY_CRITICAL: 1.0,
+    PRIORITY_NORMAL: 0.8,
+    PRIORITY_LOW: 0.5
+}
+
+DEFAULT_MAX_CONCURRENT_REQUESTS = 32
+DEFAULT_RETRY_AFTER = 1
+
+DEFAULT_RULES = [
+    {'endpoint': 'search', 'priority': PRIORITY_LOW,
+     'concurrency': 4, 'rate': 10, 'burst': 20},
+    {'endpoint': 'events', 'priority': PRIORITY_LOW,
+     'concurrency': 4, 'rate': 10, 'burst': 20},
+    {'endpoint': 'blueprintsid', 'methods': ['PUT'],
+     'concurrency': 2},
+    {'endpoint': 'blueprintsidarchive', 'concurrency': 4},
+    {'endpoint': 'deploymentsid', 'methods': ['DELETE'],
+     'concurrency': 2},
+    {'endpoint': 'nodeinstancesid', 'priority': PRIORITY_CRITICAL},
+    {'endpoint': 'nodeinstances', 'priority': PRIORITY_CRITICAL},
+    {'endpoint': 'executionsid', 'methods': ['PATCH'],
+     'priority': PRIORITY_CRITICAL},
+]
+
+
+class TokenBucket(object):
+
+    def __init__(self, rate, burst=None, clock=time.time):
+        """
+        :param rate: Tokens added per second.
+        :param burst: Maximum number of tokens (default: rate, but at least
+                      one).
+        """
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.clock = clock
+        self._tokens = self.burst
+        self._updated_at = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def take(self):
+        """
+        :return: 0 if a token was taken, otherwise the number of seconds
+                 until a token is available.
+        """
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+
+class Rule(object):
+
+    def __init__(self, endpoint, methods=None, priority=PRIORITY_NORMAL,
+                 concurrency=None, rate=None, burst=None,
+                 retry_after=DEFAULT_RETRY_AFTER, clock=time.time):
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError('Unknown priority class {0} for endpoint {1} '
+                             '(known classes: {2})'.format(
+                                 priority, endpoint,
+                                 ', '.join(sorted(PRIORITY_CLASSES))))
+        self.endpoint = endpoint
+        self.methods = set(m.upper() for m in methods) if methods else None
+        self.priority = priority
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst, clock) if rate else None
+        self.retry_after = retry_after
+        self.in_progress = 0
+
+    def matches(self, endpoint, method):
+        return self.endpoint == endpoint and \
+            (self.methods is None or method in self.methods)
+
+
+class AdmissionController(object):
+
+    def __init__(self, rules, max_concurrent_requests,
+                 clock=time.time):
+        self.rules = [Rule(clock=clock, **rule) for rule in rules]
+        self.max_concurrent_requests = max_concurrent_requests
+        self.in_progress = 0
+        self._lock = threading.Lock()
+
+    def _rule(self, endpoint, method):
+        for rule in self.rules:
+            if rule.matches(endpoint, method):
+                return rule
+        return None
+
+    def admit(self, endpoint, method):
+        """
+        Admits a request, which must then be released once handled.
+
+        :return: a ticket to release the request with.
+        :raises TooManyRequestsError: if the request is rejected.
+        """
+        rule = self._rule(endpoint, method)
+        priority = rule.priority if rule else PRIORITY_NORMAL
+        with self._lock:
+            share = PRIORITY_CLASSES[priority] * self.max_concurrent_requests
+            if self.in_progress >= share:
+                raise manager_exceptions.TooManyRequestsError(
+                    DEFAULT_RETRY_AFTER,
+                    'Too many requests in progress for {0} priority '
+                    'requests'.format(priority))
+            if rule and rule.concurrency is not None and \
+                    rule.in_progress >= rule.concurrency:
+                raise manager_exceptions.TooManyRequestsError(
+                    rule.retry_after,
+                    'Too many concurrent {0} {1} requests (limit: '
+                    '{2})'.format(method, endpoint, rule.concurrency))
+            if rule and rule.bucket:
+                wait = rule.bucket.take()
+                if wait:
+                    raise manager_exceptions.TooManyRequestsError(
+                        wait,
+                        'Rate limit of {0} {1} requests exceeded (limit: '
+                        '{2} per second)'.format(method, endpoint,
+                                                 rule.bucket.rate))
+            self.in_progress += 1
+            if rule:
+                rule.in_progress += 1
+        return rule
+
+    def release(self, rule):
+        with self._lock:
+            self.in_progress -= 1
+            if rule:
+                rule.in_progress -= 1
+
+
+def _controller_from_config():
+    admission_config = config.instance().admission_control
+    if not admission_config:
+        return None
+    return AdmissionController(
+        admission_config.get('rules') or DEFAULT_RULES,
+        admission_config.get('max_concurrent_requests',
+                             DEFAULT_MAX_CONCURRENT_REQUESTS))
+
+
+def init_app(app):
+    """
+    Enables admission control for the app, if configured.
+    """
+    controller = _controller_from_config()
+    if controller is None:
+        return
+
+    def admit():
+        if request.endpoint is None:
+            return None
+        try:
+            g.admission_ticket = controller.admit(request.endpoint,
+                                                  request.method)
+        except manager_exceptions.TooManyRequestsError, e:
+            app.logger.info('{0}: {1}'.format(type(e).__name__, str(e)))
+            return too_many_requests_response(e)
+        g.admitted = True
+
+    def release(exc=None):
+        if getattr(g, 'admitted', False):
+            g.admitted = False
+            controller.release(g.admission_ticket)
+
+    app.before_request(admit)
+    app.teardown_request(release)
+    app.admission_controller = controller
+
+
+def too_many_requests_response(error):
+    response = jsonify({'message': str(error),
+                        'error_code': error.error_code,
+                        'server_traceback': None})
+    response.status_code = error.http_code
+    response.headers['Retry-After'] = str(
+        int(math.ceil(error.retry_after)))
+    return response
@@ -0,0 +1,143 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Logging off the request threads.
+
+AsyncHandler queues the records logged through it, and a background
+thread writes them with the handler it wraps (e.g. a RotatingFileHandler),
+so requests do not wait for the log file to be written (and rotated).
+The queue is bounded: when the writer falls behind, records are dropped
+(and counted) rather than blocking requests. Once it catches up, the
+writer logs the number of records dropped, at most every
+dropped_report_interval seconds. Queued records are written before the
+process exits.
+"""
+
+import os
+import time
+import Queue
+import logging
+import threading
+
+DEFAULT_MAX_QUEUED_RECORDS = 10000
+DEFAULT_DROPPED_REPORT_INTERVAL = 60
+
+
+class AsyncHandler(logging.Handler):
+
+    def __init__(self, handler,
+                 max_queued_records=DEFAULT_MAX_QUEUED_RECORDS,
+                 dropped_report_interval=DEFAULT_DROPPED_REPORT_INTERVAL):
+        """
+        :param handler: The handler writing the records.
+        :param max_queued_records: Maximum number of records waiting to be
+                                   written.
+        :param dropped_report_interval: Minimum seconds between reports of
+                                        dropped records.
+        """
+        logging.Handler.__init__(self)
+        self.handler = handler
+        self.dropped_report_interval = dropped_report_interval
+        self.dropped = 0
+        # records are dropped by any of the logging threads
+        self._dropped_lock = threading.Lock()
+        self._reported_dropped = 0
+        self._reported_at = None
+        self._queue = Queue.Queue(max_queued_records)
+        self._writer = None
+        self._writer_pid = None
+        self._writer_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        logging.Handler.setFormatter(self, fmt)
+        self.handler.setFormatter(fmt)
+
+    def emit(self, record):
+        self._start_writer()
+        try:
+            self._queue.put_nowait(self._prepare(record))
+        except Queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def _prepare(self, record):
+        # the message arguments and traceback are rendered right away, as
+        # they may change (or be gone) by the time the record is written
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            formatter = self.handler.formatter or logging.Formatter()
+            record.exc_text = formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def _start_writer(self):
+        # a forked worker does not inherit the writer thread
+        if self._writer_pid == os.getpid():
+            return
+        with self._writer_lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._writer = threading.Thread(target=self._write,
+                                            name='async-log-writer')
+            self._writer.daemon = True
+            self._writer.start()
+            self._writer_pid = os.getpid()
+
+    def _write(self):
+        while True:
+            try:
+                record = self._queue.get(
+                    timeout=self.dropped_report_interval)
+            except Queue.Empty:
+                self._report_dropped()
+                continue
+            if record is None:
+                self._report_dropped(rate_limited=False)
+                return
+            try:
+                self.handler.handle(record)
+            except Exception:
+                self.handleError(record)
+            if self._queue.empty():
+                self._report_dropped()
+
+    def _report_dropped(self, rate_limited=True):
+        dropped = self.dropped - self._reported_dropped
+        if not dropped:
+            return
+        now = time.time()
+        if rate_limited and self._reported_at is not None and \
+                now - self._reported_at < self.dropped_report_interval:
+            return
+        self._reported_dropped += dropped
+        self._reported_at = now
+        record = logging.LogRecord(
+            __name__, logging.WARNING, __file__, 0,
+            'Dropped {0} log records, logged faster than they could be '
+            'written'.format(dropped), None, None)
+        try:
+            self.handler.handle(record)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        # called by logging.shutdown on exit, writing the queued records
+        if self._writer_pid == os.getpid() and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        self.handler.close()
+        logging.Handler.close(self)
@@ -13,7 +13,10 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
+import json
+import time
 import uuid
+import functools
 from datetime import datetime
 
 from flask import g, current_app
@@ -25,10 +28,20 @@ from dsl_parser.constants import DEPLOYMENT_PLUGINS_TO_INSTALL
 from manager_rest import models
 from manager_rest import manager_exceptions
 from manager_rest.workflow_client import workflow_client
+from manager_rest.execution_scheduler import (ExecutionScheduler,
+                                              execution_age)
 from manager_rest.storage_manager import get_storage_manager
 from manager_rest.utils import maybe_register_teardown
 from manager_rest.celery_client import celery_client
 
+# the number of offending ids listed in validation error messages
+REPORTED_IDS_LIMIT = 10
+
+# namespace of the ids of executions requested with an idempotency key or a
+# dedup window, which are derived from the request
+IDEMPOTENT_EXECUTION_NAMESPACE = uuid.UUID(
+    '5b0e4a3c-2f4e-4d1a-9b53-0c7a4f3d9e21')
+
 
 class DslParseException(Exception):
     pass
@@ -40,12 +53,44 @@ class BlueprintAlreadyExistsException(Exception):
         self.blueprint_id = blueprint_id
 
 
+def _idempotent_execution_id(*parts):
+    return str(uuid.uuid5(IDEMPOTENT_EXECUTION_NAMESPACE,
+                          json.dumps(parts, sort_keys=True)))
+
+
+def _format_ids(count, ids):
+    formatted = ','.join(ids)
+    if count > len(ids):
+        formatted += ' (and {0} more)'.format(count - len(ids))
+    return formatted
+
+
+def transactional(func):
+    """
+    Runs the decorated BlueprintsManager method in a single storage
+    transaction (for storage backends that support transactions).
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.sm.transaction():
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
 class BlueprintsManager(object):
 
     @property
     def sm(self):
         return get_storage_manager()
 
+    @property
+    def scheduler(self):
+        return ExecutionScheduler(self)
+
+    @property
+    def status_writer(self):
+        return current_app.execution_status_writer
+
     def blueprints_list(self, include=None):
         return self.sm.blueprints_list(include=include)
 
@@ -53,8 +98,9 @@ class BlueprintsManager(object):
         return self.sm.deployments_list(include=include)
 
     def executions_list(self, deployment_id=None, include=None):
-        return self.sm.executions_list(deployment_id=deployment_id,
-                                       include=include)
+        return [self.status_writer.overlay(execution) for execution in
+                self.sm.executions_list(deployment_id=deployment_id,
+                                        include=include)]
 
     def get_blueprint(self, blueprint_id, include=None):
         return self.sm.get_blueprint(blueprint_id, include=include)
@@ -64,7 +110,8 @@ class BlueprintsManager(object):
                                       include=include)
 
     def get_execution(self, execution_id, include=None):
-        return self.sm.get_execution(execution_id, include=include)
+        return self.status_writer.overlay(
+            self.sm.get_execution(execution_id, include=include))
 
     def publish_blueprint(self, dsl_location,
                           resources_base_url, blueprint_id):
@@ -83,56 +130,70 @@ class BlueprintsManager(object):
         return new_blueprint
 
     def delete_blueprint(self, blueprint_id):
-        blueprint_deployments = self.sm.get_blueprint_deployments(blueprint_id)
+        count, deployment_ids = self.sm.deployments_count(
+            blueprint_id=blueprint_id, ids_limit=REPORTED_IDS_LIMIT)
 
-        if len(blueprint_deployments) > 0:
+        if count > 0:
             raise manager_exceptions.DependentExistsError(
                 "Can't delete blueprint {0} - There exist "
                 "deployments for this blueprint; Deployments ids: {1}"
-                .format(blueprint_id,
-                        ','.join([dep.id for dep
-                                  in blueprint_deployments])))
+                .format(blueprint_id, _format_ids(count, deployment_ids)))
 
         return self.sm.delete_blueprint(blueprint_id)
 
     def delete_deployment(self, deployment_id, ignore_live_nodes=False):
         # Verify deployment exists.
-        self.sm.get_deployment(deployment_id)
+        self.sm.get_deployment(deployment_id, include=['id'])
 
         # validate there are no running executions for this deployment
-        executions = self.sm.executions_list(deployment_id=deployment_id)
-        if any(execution.status not in models.Execution.END_STATES for
-           execution in executions):
+        count, execution_ids = self.sm.executions_count(
+            deployment_id=deployment_id,
+            exclude_statuses=models.Execution.END_STATES,
+            ids_limit=REPORTED_IDS_LIMIT)
+        if count > 0:
             raise manager_exceptions.DependentExistsError(
                 "Can't delete deployment {0} - There are running "
                 "executions for this deployment. Running executions ids: {1}"
-                .format(
-                    deployment_id,
-                    ','.join([execution.id for execution in
-                              executions if execution.status not
-                              in models.Execution.END_STATES])))
+                .format(deployment_id, _format_ids(count, execution_ids)))
 
         if not ignore_live_nodes:
-            node_instances = self.sm.get_node_instances(
-                deployment_id=deployment_id)
             # validate either all nodes for this deployment are still
             # uninitialized or have been deleted
-            if any(node.state not in ('uninitialized', 'deleted') for node in
-                   node_instances):
+            count, node_instance_ids = self.sm.node_instances_count(
+                deployment_id=deployment_id,
+                exclude_states=('uninitialized', 'deleted'),
+                ids_limit=REPORTED_IDS_LIMIT)
+            if count > 0:
                 raise manager_exceptions.DependentExistsError(
                     "Can't delete deployment {0} - There are live nodes for "
                     "this deployment. Live nodes ids: {1}"
                     .format(deployment_id,
-                            ','.join([node.id for node in node_instances
-                                     if node.state not in
-                                     ('uninitialized', 'deleted')])))
+                            _format_ids(count, node_instance_ids)))
 
         self._delete_deployment_environment(deployment_id)
         return self.sm.delete_deployment(deployment_id)
 
     def execute_workflow(self, deployment_id, workflow_id,
                          parameters=None,
-                         allow_custom_parameters=False, force=False):
+                         allow_custom_parameters=False, force=False,
+                         queue=False, idempotency_key=None,
+                         dedup_window=None):
+        """
+        :param force: Whether to start the execution even though other
+                      executions of the deployment are in progress.
+        :param queue: Whether to queue the execution if other executions of
+                      the deployment are in progress (or queued), rather
+                      than to fail, so it is started once they end (see
+                      execution_scheduler). Forced executions are neither
+                      queued nor subject to the manager wide limits.
+        :param idempotency_key: A key identifying the request; repeating a
+                                request with the same key (for the same
+                                deployment) returns the execution it
+                                created rather than creating another one.
+        :param dedup_window: Seconds within which an execution of the same
+                             workflow, with the same parameters, is
+                             returned rather than creating another one.
+        """
         deployment = self.get_deployment(deployment_id)
 
         if workflow_id not in deployment.workflows:
@@ -141,41 +202,79 @@ class BlueprintsManager(object):
                     workflow_id, deployment_id))
         workflow = deployment.workflows[workflow_id]
 
-        self._verify_deployment_environment_created_successfully(deployment_id)
+        self._verify_deployment_environment_created_successfully(deployment)
+
+        execution_parameters = \
+            BlueprintsManager._merge_and_validate_execution_parameters(
+                workflow, workflow_id, parameters, allow_custom_parameters)
+        user_parameters = self._get_only_user_execution_parameters(
+            execution_parameters)
+
+        # a duplicate request returns the execution of the original one
+        if idempotency_key:
+            execution_id = _idempotent_execution_id(
+                deployment_id, 'key', idempotency_key)
+        elif dedup_window:
+            duplicate = self._recent_duplicate_execution(
+                deployment_id, workflow_id, user_parameters, dedup_window)
+            if duplicate is not None:
+                return duplicate
+            # concurrent duplicates (within the same window period) derive
+            # the same id, so only one of them creates an execution
+            execution_id = _idempotent_execution_id(
+                deployment_id, 'window', workflow_id, user_parameters,
+                int(time.time() // dedup_window))
+        else:
+            execution_id = None
+        if execution_id:
+            try:
+                return self.get_execution(execution_id)
+            except manager_exceptions.NotFoundError:
+                pass
+        else:
+            execution_id = str(uuid.uuid4())
 
         # validate no execution is currently in progress
+        status = models.Execution.PENDING
         if not force:
-            executions = self.sm.executions_list(
-                deployment_id=deployment_id)
-            running = [
-                e.id for e in executions if
-                self.sm.get_execution(e.id).status
-                not in models.Execution.END_STATES]
-            if len(running) > 0:
+            count, running = self.sm.executions_count(
+                deployment_id=deployment_id,
+                exclude_statuses=models.Execution.END_STATES,
+                ids_limit=REPORTED_IDS_LIMIT)
+            if count > 0 and not queue:
                 raise manager_exceptions.ExistingRunningExecutionError(
                     'The following executions are currently running for this '
                     'deployment: {0}. To execute this workflow anyway, pass '
                     '"force=true" as a query parameter to this request'.format(
-                        running))
-
-        execution_parameters = \
-            BlueprintsManager._merge_and_validate_execution_parameters(
-                workflow, workflow_id, parameters, allow_custom_parameters)
-
-        execution_id = str(uuid.uuid4())
+                        _format_ids(count, running)))
+            # with manager wide limits, executions are started by the
+            # scheduler once the limits allow
+            if count > 0 or self.scheduler.limited:
+                status = models.Execution.QUEUED
 
         new_execution = models.Execution(
             id=execution_id,
-            status=models.Execution.PENDING,
+            status=status,
             created_at=str(datetime.now()),
             blueprint_id=deployment.blueprint_id,
             workflow_id=workflow_id,
             deployment_id=deployment_id,
             error='',
-            parameters=self._get_only_user_execution_parameters(
-                execution_parameters))
+            parameters=user_parameters)
 
-        self.sm.put_execution(new_execution.id, new_execution)
+        try:
+            self.sm.put_execution(new_execution.id, new_execution)
+        except manager_exceptions.ConflictError:
+            if not (idempotency_key or dedup_window):
+                raise
+            # created by a concurrent duplicate request
+            return self.get_execution(execution_id)
+
+        if status == models.Execution.QUEUED:
+            # started right away if the deployment's executions ended
+            # meanwhile (or the limits allow)
+            self.scheduler.dispatch(deployment_id)
+            return self.get_execution(execution_id)
 
         workflow_client().execute_workflow(
             workflow_id,
@@ -187,6 +286,26 @@ class BlueprintsManager(object):
 
         return new_execution
 
+    def _recent_duplicate_execution(self, deployment_id, workflow_id,
+                                    parameters, window):
+        """
+        :return: the latest execution of the workflow with the given
+                 parameters, created within the last window seconds, or
+                 None.
+        """
+        now = datetime.now()
+        duplicates = [
+            execution for execution in self.sm.executions_list(
+                deployment_id=deployment_id,
+                include=['id', 'workflow_id', 'parameters', 'created_at'])
+            if execution.workflow_id == workflow_id and
+            execution.parameters == parameters and
+            execution_age(execution, now) < window]
+        if not duplicates:
+            return None
+        latest = max(duplicates, key=lambda e: e.created_at)
+        return self.get_execution(latest.id)
+
     def cancel_execution(self, execution_id, force=False):
         """
         Cancel an execution by its id
@@ -215,6 +334,14 @@ class BlueprintsManager(object):
         """
 
         execution = self.get_execution(execution_id)
+        if execution.status == models.Execution.QUEUED:
+            # a queued execution is cancelled right away, unless it has
+            # been started meanwhile
+            if self.sm.transition_execution_status(
+                    execution_id, models.Execution.QUEUED,
+                    models.Execution.CANCELLED):
+                return self.get_execution(execution_id)
+            execution = self.get_execution(execution_id)
         if execution.status not in (models.Execution.PENDING,
                                     models.Execution.STARTED) and \
                 (not force or execution.status != models.Execution
@@ -228,10 +355,25 @@ class BlueprintsManager(object):
 
         new_status = models.Execution.CANCELLING if not force \
             else models.Execution.FORCE_CANCELLING
-        self.sm.update_execution_status(
-            execution_id, new_status, '')
+        # written synchronously, superseding a buffered update
+        self.status_writer.write(execution_id, new_status, '')
         return self.get_execution(execution_id)
 
+    def execution_queue_summary(self):
+        # starts queued executions whose predecessors ended without a
+        # status update dispatching them
+        self.scheduler.dispatch()
+        return self.scheduler.summary()
+
+    def update_execution_status(self, execution_id, status, error):
+        self.status_writer.update(execution_id, status, error)
+        # reflects a buffered update, which is yet to be written
+        execution = self.get_execution(execution_id)
+        if status in models.Execution.END_STATES:
+            # the deployment's queued executions may start
+            self.scheduler.dispatch(execution.deployment_id)
+        return execution
+
     def create_deployment(self, blueprint_id, deployment_id, inputs=None):
         blueprint = self.get_blueprint(blueprint_id)
         plan = blueprint.plan
@@ -252,7 +394,8 @@ class BlueprintsManager(object):
             policy_types=deployment_plan['policy_types'],
             policy_triggers=deployment_plan['policy_triggers'],
             groups=deployment_plan['groups'],
-            outputs=deployment_plan['outputs'])
+            outputs=deployment_plan['outputs'],
+            environment_status=models.Execution.PENDING)
 
         self.sm.put_deployment(deployment_id, new_deployment)
         self._create_deployment_nodes(blueprint_id,
@@ -266,6 +409,7 @@ class BlueprintsManager(object):
                                             now)
         return new_deployment
 
+    @transactional
     def start_deployment_modification(self,
                                       deployment_id,
                                       modified_nodes,
@@ -273,18 +417,18 @@ class BlueprintsManager(object):
         # verify deployment exists
         self.sm.get_deployment(deployment_id, include=['id'])
 
-        existing_modifications = self.sm.deployment_modifications_list(
-            deployment_id=deployment_id, include=['id', 'status'])
-        active_modifications = [
-            m.id for m in existing_modifications
-            if m.status == models.DeploymentModification.STARTED]
-        if active_modifications:
+        count, active_modifications = \
+            self.sm.deployment_modifications_count(
+                deployment_id=deployment_id,
+                status=models.DeploymentModification.STARTED,
+                ids_limit=REPORTED_IDS_LIMIT)
+        if count > 0:
             raise \
                 manager_exceptions.ExistingStartedDeploymentModificationError(
                     'Cannot start deployment modification while there are '
                     'existing started deployment modifications. Currently '
                     'started deployment modifications: {0}'
-                    .format(active_modifications))
+                    .format(_format_ids(count, active_modifications)))
 
         nodes = [node.to_dict() for node in self.sm.get_nodes(deployment_id)]
         node_instances = [instance.to_dict() for instance
@@ -337,6 +481,7 @@ class BlueprintsManager(object):
                                                added_node_instances)
         return modification
 
+    @transactional
     def finish_deployment_modification(self, modification_id):
         modification = self.sm.get_deployment_modification(modification_id)
 
@@ -394,6 +539,7 @@ class BlueprintsManager(object):
             node_instances=None,
             context=None)
 
+    @transactional
     def rollback_deployment_modification(self, modification_id):
         modification = self.sm.get_deployment_modification(modification_id)
 
@@ -601,18 +747,27 @@ class BlueprintsManager(object):
         return prepared_relationships
 
     def _verify_deployment_environment_created_successfully(self,
-                                                            deployment_id):
-        env_creation = next(
-            (execution for execution in
-             self.sm.executions_list(deployment_id=deployment_id)
-             if execution.workflow_id == 'create_deployment_environment'),
-            None)
-
-        if not env_creation:
-            raise RuntimeError('Failed to find "create_deployment_environment"'
-                               ' execution for deployment {0}'.format(
-                                   deployment_id))
-        status = env_creation.status
+                                                            deployment):
+        deployment_id = deployment.id
+        status = deployment.environment_status
+        error = deployment.environment_error
+        if status is None:
+            # deployments stored by older versions do not hold their
+            # environment status; it is taken from the execution itself
+            env_creation = next(
+                (execution for execution in self.sm.executions_list(
+                    deployment_id=deployment_id,
+                    include=['workflow_id', 'status', 'error'])
+                 if execution.workflow_id ==
+                    models.Execution.CREATE_DEPLOYMENT_ENVIRONMENT),
+                None)
+
+            if not env_creation:
+                raise RuntimeError(
+                    'Failed to find "create_deployment_environment" '
+                    'execution for deployment {0}'.format(deployment_id))
+            status = env_creation.status
+            error = env_creation.error
         if status == models.Execution.TERMINATED:
             return
         elif status == models.Execution.PENDING:
@@ -629,7 +784,7 @@ class BlueprintsManager(object):
             raise RuntimeError(
                 "Can't launch executions since environment creation for "
                 "deployment {0} has failed: {1}".format(
-                    deployment_id, env_creation.error))
+                    deployment_id, error))
         elif status in (
             models.Execution.CANCELLED, models.Execution.CANCELLING,
                 models.Execution.FORCE_CANCELLING):
@@ -644,7 +799,7 @@ class BlueprintsManager(object):
 
     def _create_deployment_environment(self, deployment, deployment_plan, now):
         deployment_env_creation_task_id = str(uuid.uuid4())
-        wf_id = 'create_deployment_environment'
+        wf_id = models.Execution.CREATE_DEPLOYMENT_ENVIRONMENT
         deployment_env_creation_task_name = \
             'cloudify_system_workflows.deployment_environment.create'
 
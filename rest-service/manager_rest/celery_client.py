@@ -14,8 +14,12 @@
 #    * limitations under the License.
 
 
+import os
+import threading
+
 from celery import Celery
 from manager_rest import config
+from manager_rest import utils
 
 TASK_STATE_PENDING = 'PENDING'
 TASK_STATE_STARTED = 'STARTED'
@@ -30,6 +34,15 @@ class CeleryClient(object):
         amqp_uri = 'amqp://{0}'.format(config.instance().amqp_address)
         self.celery = Celery(broker=amqp_uri, backend=amqp_uri)
         self.celery.conf.update(CELERY_TASK_SERIALIZER="json")
+        if utils.cooperative_mode():
+            # the pure python amqp client goes through the (patched)
+            # socket module, so waiting for a task result yields to other
+            # requests (the librabbitmq C client would block the worker).
+            # Connections are not pooled, as every request waiting for a
+            # result holds its connection for the duration of the wait.
+            self.celery.conf.update(BROKER_TRANSPORT='pyamqp',
+                                    BROKER_POOL_LIMIT=None)
+        self.pid = os.getpid()
 
     def execute_task(self, task_name, task_queue, task_id=None, kwargs=None):
         """
@@ -68,9 +81,35 @@ class CeleryClient(object):
         return async_result.result
 
 
+# clients are reused by the requests a thread serves, rather than opening
+# a new broker connection per request. The amqp result backend is not
+# thread safe, hence a client per thread; clients inherited from the
+# parent of a forked process are never used. In cooperative mode, where
+# every request runs in its own greenlet, a single (unpooled) client is
+# shared by the process.
+_local = threading.local()
+_shared_client = None
+
+
+def reset():
+    global _shared_client
+    _local.client = None
+    _shared_client = None
+
+
 def celery_client():
+    global _shared_client
     if config.instance().test_mode:
         from test.mocks import MockCeleryClient
         return MockCeleryClient()
+    if utils.cooperative_mode():
+        client = _shared_client
     else:
-        return CeleryClient()
+        client = getattr(_local, 'client', None)
+    if client is None or client.pid != os.getpid():
+        client = CeleryClient()
+        if utils.cooperative_mode():
+            _shared_client = client
+        else:
+            _local.client = client
+    return client
@@ -39,6 +39,19 @@ class Config(object):
         self._securest_log_files_backup_count = None
         self._securest_userstore_driver = None
         self._securest_authentication_providers = []
+        self._storage_manager_module_name = None
+        self._memory_storage_snapshot_path = None
+        self._memory_storage_snapshot_interval = None
+        self._file_storage_path = None
+        self._sqlite_storage_path = None
+        self._es_index_per_type = False
+        self._admission_control = None
+        self._query_cache_ttl = 1
+        self._query_cache_size = 256
+        self._execution_scheduling = None
+        self._execution_status_flush_interval = 0
+        self._request_profiling = None
+        self._status_refresh_interval = 10
 
     @property
     def db_address(self):
@@ -216,6 +229,110 @@ class Config(object):
     def securest_userstore_driver(self, value):
         self._securest_userstore_driver = value
 
+    @property
+    def storage_manager_module_name(self):
+        return self._storage_manager_module_name
+
+    @storage_manager_module_name.setter
+    def storage_manager_module_name(self, value):
+        self._storage_manager_module_name = value
+
+    @property
+    def memory_storage_snapshot_path(self):
+        return self._memory_storage_snapshot_path
+
+    @memory_storage_snapshot_path.setter
+    def memory_storage_snapshot_path(self, value):
+        self._memory_storage_snapshot_path = value
+
+    @property
+    def memory_storage_snapshot_interval(self):
+        return self._memory_storage_snapshot_interval
+
+    @memory_storage_snapshot_interval.setter
+    def memory_storage_snapshot_interval(self, value):
+        self._memory_storage_snapshot_interval = value
+
+    @property
+    def file_storage_path(self):
+        return self._file_storage_path
+
+    @file_storage_path.setter
+    def file_storage_path(self, value):
+        self._file_storage_path = value
+
+    @property
+    def sqlite_storage_path(self):
+        return self._sqlite_storage_path
+
+    @sqlite_storage_path.setter
+    def sqlite_storage_path(self, value):
+        self._sqlite_storage_path = value
+
+    @property
+    def es_index_per_type(self):
+        return self._es_index_per_type
+
+    @es_index_per_type.setter
+    def es_index_per_type(self, value):
+        self._es_index_per_type = value
+
+    @property
+    def admission_control(self):
+        return self._admission_control
+
+    @admission_control.setter
+    def admission_control(self, value):
+        self._admission_control = value
+
+    @property
+    def query_cache_ttl(self):
+        return self._query_cache_ttl
+
+    @query_cache_ttl.setter
+    def query_cache_ttl(self, value):
+        self._query_cache_ttl = value
+
+    @property
+    def query_cache_size(self):
+        return self._query_cache_size
+
+    @query_cache_size.setter
+    def query_cache_size(self, value):
+        self._query_cache_size = value
+
+    @property
+    def execution_scheduling(self):
+        return self._execution_scheduling
+
+    @execution_scheduling.setter
+    def execution_scheduling(self, value):
+        self._execution_scheduling = value
+
+    @property
+    def execution_status_flush_interval(self):
+        return self._execution_status_flush_interval
+
+    @execution_status_flush_interval.setter
+    def execution_status_flush_interval(self, value):
+        self._execution_status_flush_interval = value
+
+    @property
+    def request_profiling(self):
+        return self._request_profiling
+
+    @request_profiling.setter
+    def request_profiling(self, value):
+        self._request_profiling = value
+
+    @property
+    def status_refresh_interval(self):
+        return self._status_refresh_interval
+
+    @status_refresh_interval.setter
+    def status_refresh_interval(self, value):
+        self._status_refresh_interval = value
+
 
 _instance = Config()
 
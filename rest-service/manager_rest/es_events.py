@@ -0,0 +1,357 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Time partitioned Elasticsearch indices for events and logs.
+
+Events are written to a daily index (e.g. 'cloudify_events-2015.06.01',
+logstash: index => "cloudify_events-%{+YYYY.MM.dd}"). An index template
+adds every daily index to the 'cloudify_events' alias as it is created, so
+queries of the alias see all events, while queries for a time range only
+need to touch the indices of the days in that range. Retention is applied
+by deleting whole daily indices, which is much cheaper than deleting
+documents.
+
+Usage example (e.g. daily, from cron):
+
+    python -m manager_rest.es_events --host localhost retention --days 30
+"""
+
+import re
+import sys
+import time
+import logging
+import argparse
+import datetime
+
+import elasticsearch
+import elasticsearch.helpers
+
+logger = logging.getLogger(__name__)
+
+EVENTS_ALIAS = 'cloudify_events'
+INDEX_PREFIX = '{0}-'.format(EVENTS_ALIAS)
+INDEX_DATE_FORMAT = '%Y.%m.%d'
+TEMPLATE_NAME = EVENTS_ALIAS
+
+DEFAULT_NUMBER_OF_SHARDS = 1
+DEFAULT_NUMBER_OF_REPLICAS = 0
+DEFAULT_REFRESH_INTERVAL = '5s'
+DEFAULT_RETENTION_DAYS = 30
+
+TIMESTAMP_FIELDS = ('@timestamp', 'timestamp')
+# date math supported in range bounds, e.g. 'now-7d' or 'now-12h/d'
+NOW_PATTERN = re.compile(r'^now(?:-(\d+)([wdhms]))?(?:/[wdhms])?$')
+NOW_UNITS = {'w': 'weeks', 'd': 'days', 'h': 'hours', 'm': 'minutes',
+             's': 'seconds'}
+LOWER_BOUNDS = ('gt', 'gte', 'from')
+UPPER_BOUNDS = ('lt', 'lte', 'to')
+
+
+def index_name(day):
+    return '{0}{1}'.format(INDEX_PREFIX, day.strftime(INDEX_DATE_FORMAT))
+
+
+def index_day(index):
+    """
+    :return: the day of a daily events index, or None for other indices.
+    """
+    if not index.startswith(INDEX_PREFIX):
+        return None
+    try:
+        return datetime.datetime.strptime(index[len(INDEX_PREFIX):],
+                                          INDEX_DATE_FORMAT).date()
+    except ValueError:
+        return None
+
+
+def _utc_today():
+    return datetime.datetime.utcnow().date()
+
+
+def parse_day(value, now=None):
+    """
+    Parses a range bound (epoch millis, ISO 8601 date/time or 'now' based
+    date math) to the UTC day it falls on.
+
+    :return: the day, or None if the value is not understood.
+    """
+    now = now or datetime.datetime.utcnow()
+    if isinstance(value, (int, long, float)):
+        return datetime.datetime.utcfromtimestamp(value / 1000.0).date()
+    if not isinstance(value, basestring):
+        return None
+    match = NOW_PATTERN.match(value)
+    if match:
+        amount, unit = match.groups()
+        if amount:
+            now -= datetime.timedelta(**{NOW_UNITS[unit]: int(amount)})
+        return now.date()
+    try:
+        return datetime.datetime.strptime(value[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def _conjuncts(clause):
+    """
+    Yields the clauses which every hit of the given query/filter clause
+    must match (clauses under should/must_not/not/or are skipped, as they
+    do not restrict the hits to their range).
+    """
+    if isinstance(clause, list):
+        for item in clause:
+            for conjunct in _conjuncts(item):
+                yield conjunct
+        return
+    if not isinstance(clause, dict):
+        return
+    yield clause
+    for key in ('query', 'filter', 'filtered', 'constant_score', 'and',
+                'filters'):
+        if key in clause:
+            for conjunct in _conjuncts(clause[key]):
+                yield conjunct
+    if 'bool' in clause:
+        for conjunct in _conjuncts(clause['bool'].get('must')):
+            yield conjunct
+
+
+def time_range(query, now=None):
+    """
+    :return: (first day, last day) of the events the query may match, by
+             its range clauses on the timestamp fields. Either may be None
+             if the query does not bound it.
+    """
+    first_day = last_day = None
+    # post filters (a top level 'filter') do not restrict aggregations
+    clauses = _conjuncts((query or {}).get('query'))
+    for clause in clauses:
+        for field, bounds in clause.get('range', {}).items():
+            if field not in TIMESTAMP_FIELDS or not isinstance(bounds,
+                                                               dict):
+                continue
+            for bound, value in bounds.items():
+                day = parse_day(value, now)
+                if day is None:
+                    continue
+                # widened by a day, as bounds may be in another timezone
+                if bound in LOWER_BOUNDS:
+                    day -= datetime.timedelta(days=1)
+                    first_day = max(first_day, day) if first_day else day
+                elif bound in UPPER_BOUNDS:
+                    day += datetime.timedelta(days=1)
+                    last_day = min(last_day, day) if last_day else day
+    return first_day, last_day
+
+
+def daily_indices(es):
+    """
+    :return: the indices behind the events alias mapped to their days, or
+             None if events are stored in a single (legacy) index.
+    """
+    if not es.indices.exists_alias(name=EVENTS_ALIAS):
+        return None
+    return dict((index, index_day(index))
+                for index in es.indices.get_alias(name=EVENTS_ALIAS))
+
+
+def indices_for_query(es, query, now=None):
+    """
+    :return: the events indices the query needs to search.
+    """
+    first_day, last_day = time_range(query, now)
+    if first_day is None and last_day is None:
+        return [EVENTS_ALIAS]
+    indices = daily_indices(es)
+    if indices is None:
+        return [EVENTS_ALIAS]
+    return sorted(index for index, day in indices.items()
+                  if day is None or
+                  ((first_day is None or day >= first_day) and
+                   (last_day is None or day <= last_day)))
+
+
+def empty_result():
+    """
+    :return: a search response with no hits, for queries whose time range
+             does not overlap any events index.
+    """
+    return {'took': 0,
+            'timed_out': False,
+            '_shards': {'total': 0, 'successful': 0, 'failed': 0},
+            'hits': {'total': 0, 'max_score': None, 'hits': []}}
+
+
+def index_settings(number_of_shards=DEFAULT_NUMBER_OF_SHARDS,
+                   number_of_replicas=DEFAULT_NUMBER_OF_REPLICAS,
+                   refresh_interval=DEFAULT_REFRESH_INTERVAL):
+    return {
+        'number_of_shards': number_of_shards,
+        'number_of_replicas': number_of_replicas,
+        'refresh_interval': refresh_interval
+    }
+
+
+def _event_day(source):
+    for field in TIMESTAMP_FIELDS:
+        if field in source:
+            day = parse_day(source[field])
+            if day is not None:
+                return day
+    return _utc_today()
+
+
+def migrate_legacy_index(es, settings, chunk_size=500):
+    """
+    Moves the events of a single (pre time partitioning) 'cloudify_events'
+    index into daily indices. The legacy index is deleted once its events
+    are copied, as the alias can only be created after it is gone.
+
+    The events are copied while the legacy index is still written to, then
+    the legacy index is made read-only and the events written during the
+    copy are copied as well, so no event is lost: events written to the
+    legacy index after that fail, until it is replaced by the alias.
+
+    :return: the number of events moved.
+    """
+    if es.indices.exists_alias(name=EVENTS_ALIAS) or \
+            not es.indices.exists(index=EVENTS_ALIAS):
+        return 0
+    created = set()
+    moved_ids = set()
+
+    def actions():
+        for hit in elasticsearch.helpers.scan(es, index=EVENTS_ALIAS):
+            # events are not modified once written
+            if (hit['_type'], hit['_id']) in moved_ids:
+                continue
+            moved_ids.add((hit['_type'], hit['_id']))
+            target_index = index_name(_event_day(hit['_source']))
+            if target_index not in created:
+                if not es.indices.exists(index=target_index):
+                    es.indices.create(index=target_index,
+                                      body={'settings': settings})
+                created.add(target_index)
+            yield {'_index': target_index,
+                   '_type': hit['_type'],
+                   '_id': hit['_id'],
+                   '_source': hit['_source']}
+
+    def move():
+        moved, errors = elasticsearch.helpers.bulk(es, actions(),
+                                                   chunk_size=chunk_size)
+        if errors:
+            raise RuntimeError('Failed moving events: {0}'.format(errors))
+        return moved
+
+    moved = move()
+    es.indices.put_settings(index=EVENTS_ALIAS,
+                            body={'index.blocks.write': True})
+    try:
+        es.indices.refresh(index=EVENTS_ALIAS)
+        moved += move()
+    except Exception:
+        exc_info = sys.exc_info()
+        es.indices.put_settings(index=EVENTS_ALIAS,
+                                body={'index.blocks.write': False})
+        raise exc_info[0], exc_info[1], exc_info[2]
+    es.indices.delete(index=EVENTS_ALIAS)
+    return moved
+
+
+def setup(es, **settings):
+    """
+    Installs the daily indices template, migrating a legacy events index
+    if there is one, and adds existing daily indices to the events alias.
+    """
+    settings = index_settings(**settings)
+    moved = migrate_legacy_index(es, settings)
+    if moved:
+        logger.info('Moved {0} events to daily indices'.format(moved))
+    es.indices.put_template(name=TEMPLATE_NAME, body={
+        'template': '{0}*'.format(INDEX_PREFIX),
+        'settings': settings,
+        'aliases': {EVENTS_ALIAS: {}}
+    })
+    existing = [index for index in
+                es.indices.get_settings(index='{0}*'.format(INDEX_PREFIX))
+                if index_day(index) is not None]
+    if existing:
+        es.indices.update_aliases(body={'actions': [
+            {'add': {'index': index, 'alias': EVENTS_ALIAS}}
+            for index in existing]})
+
+
+def apply_retention(es, retention_days, today=None):
+    """
+    Deletes the daily events indices older than the retention period.
+
+    :return: the deleted indices.
+    """
+    cutoff = (today or _utc_today()) - datetime.timedelta(
+        days=retention_days)
+    expired = sorted(index for index, day in
+                     (daily_indices(es) or {}).items()
+                     if day is not None and day < cutoff)
+    if expired:
+        es.indices.delete(index=','.join(expired))
+        logger.info('Deleted expired events indices: {0}'.format(expired))
+    return expired
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description='Manage the manager Elasticsearch events indices')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9200)
+    subparsers = parser.add_subparsers(dest='command')
+    setup_parser = subparsers.add_parser(
+        'setup', help='install the daily indices template (moving events '
+                      'of a legacy events index to daily indices)')
+    setup_parser.add_argument('--shards', type=int,
+                              default=DEFAULT_NUMBER_OF_SHARDS)
+    setup_parser.add_argument('--replicas', type=int,
+                              default=DEFAULT_NUMBER_OF_REPLICAS)
+    setup_parser.add_argument('--refresh-interval',
+                              default=DEFAULT_REFRESH_INTERVAL)
+    retention_parser = subparsers.add_parser(
+        'retention', help='delete daily indices older than the retention '
+                          'period')
+    retention_parser.add_argument('--days', type=int,
+                                  default=DEFAULT_RETENTION_DAYS,
+                                  help='number of days to keep events for')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = parse_arguments(argv if argv is not None else sys.argv[1:])
+    es = elasticsearch.Elasticsearch(hosts=[{'host': args.host,
+                                             'port': args.port}])
+    start = time.time()
+    if args.command == 'setup':
+        setup(es,
+              number_of_shards=args.shards,
+              number_of_replicas=args.replicas,
+              refresh_interval=args.refresh_interval)
+    else:
+        apply_retention(es, args.days)
+    logger.info('Done in {0:.2f} seconds'.format(time.time() - start))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,489 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Elasticsearch storage index schema, and a command for creating the
+storage index or migrating an existing one to the current schema.
+
+The storage is accessed through the 'cloudify_storage' alias, which points
+at a versioned index (e.g. 'cloudify_storage_20150601120000'), or, with an
+index per document type, through an alias per type (e.g.
+'cloudify_storage_node_instance'). Migrating creates new indices with the
+current schema, copies all documents into them (preserving their versions)
+and then atomically switches the aliases over to the new indices, so the
+storage remains readable during the migration (and writable until the
+final catch-up copy). Migrating between the two layouts is done the same
+way. Migrating a storage created by older versions (a concrete
+'cloudify_storage' index) requires the rest service to be stopped.
+
+Usage example:
+
+    python -m manager_rest.es_schema --host localhost --port 9200 \\
+        --index-per-type migrate
+"""
+
+import sys
+import time
+import logging
+import argparse
+from collections import OrderedDict
+
+import elasticsearch
+import elasticsearch.helpers
+
+from manager_rest.es_storage_manager import (STORAGE_INDEX_NAME,
+                                             STORAGE_TYPES,
+                                             ROUTED_TYPES,
+                                             ROUTING_FIELD,
+                                             type_index_name,
+                                             NODE_TYPE,
+                                             NODE_INSTANCE_TYPE,
+                                             BLUEPRINT_TYPE,
+                                             DEPLOYMENT_TYPE,
+                                             DEPLOYMENT_MODIFICATION_TYPE,
+                                             EXECUTION_TYPE,
+                                             PROVIDER_CONTEXT_TYPE)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NUMBER_OF_SHARDS = 1
+DEFAULT_NUMBER_OF_REPLICAS = 0
+# the storage manager refreshes the index on every mutation, so periodic
+# refreshes are not needed for read-your-writes
+DEFAULT_REFRESH_INTERVAL = '5s'
+
+# conflicts are expected when copying documents which were already copied
+VERSION_CONFLICT_STATUS = 409
+
+# exact-match string, used for ids, names and statuses
+KEYWORD = {'type': 'string', 'index': 'not_analyzed'}
+# stored (returned in _source) but neither parsed nor indexed
+DISABLED = {'type': 'object', 'enabled': False}
+NOT_INDEXED = {'type': 'string', 'index': 'no'}
+COUNT = {'type': 'long'}
+
+
+def _mapping(**properties):
+    return {
+        # strings which are not explicitly mapped are keywords as well
+        'dynamic_templates': [{
+            'keywords': {
+                'match_mapping_type': 'string',
+                'mapping': KEYWORD
+            }
+        }],
+        '_all': {'enabled': False},
+        'properties': properties
+    }
+
+
+MAPPINGS = {
+    BLUEPRINT_TYPE: _mapping(
+        id=KEYWORD,
+        created_at=KEYWORD,
+        updated_at=KEYWORD,
+        plan=DISABLED),
+    DEPLOYMENT_TYPE: _mapping(
+        id=KEYWORD,
+        created_at=KEYWORD,
+        updated_at=KEYWORD,
+        blueprint_id=KEYWORD,
+        permalink=KEYWORD,
+        workflows=DISABLED,
+        inputs=DISABLED,
+        outputs=DISABLED,
+        groups=DISABLED,
+        policy_types=DISABLED,
+        policy_triggers=DISABLED,
+        environment_status=KEYWORD,
+        environment_error=NOT_INDEXED),
+    EXECUTION_TYPE: _mapping(
+        id=KEYWORD,
+        status=KEYWORD,
+        deployment_id=KEYWORD,
+        workflow_id=KEYWORD,
+        blueprint_id=KEYWORD,
+        created_at=KEYWORD,
+        error=NOT_INDEXED,
+        parameters=DISABLED),
+    NODE_TYPE: _mapping(
+        id=KEYWORD,
+        deployment_id=KEYWORD,
+        blueprint_id=KEYWORD,
+        type=KEYWORD,
+        type_hierarchy=KEYWORD,
+        host_id=KEYWORD,
+        number_of_instances=COUNT,
+        planned_number_of_instances=COUNT,
+        deploy_number_of_instances=COUNT,
+        properties=DISABLED,
+        operations=DISABLED,
+        plugins=DISABLED,
+        plugins_to_install=DISABLED,
+        relationships=DISABLED),
+    NODE_INSTANCE_TYPE: _mapping(
+        id=KEYWORD,
+        node_id=KEYWORD,
+        deployment_id=KEYWORD,
+        host_id=KEYWORD,
+        state=KEYWORD,
+        runtime_properties=DISABLED,
+        relationships=DISABLED),
+    DEPLOYMENT_MODIFICATION_TYPE: _mapping(
+        id=KEYWORD,
+        deployment_id=KEYWORD,
+        status=KEYWORD,
+        created_at=KEYWORD,
+        ended_at=KEYWORD,
+        modified_nodes=DISABLED,
+        node_instances=DISABLED,
+        context=DISABLED),
+    PROVIDER_CONTEXT_TYPE: _mapping(
+        name=KEYWORD,
+        context=DISABLED),
+}
+
+
+def index_settings(number_of_shards=DEFAULT_NUMBER_OF_SHARDS,
+                   number_of_replicas=DEFAULT_NUMBER_OF_REPLICAS,
+                   refresh_interval=DEFAULT_REFRESH_INTERVAL):
+    return {
+        'number_of_shards': number_of_shards,
+        'number_of_replicas': number_of_replicas,
+        'refresh_interval': refresh_interval
+    }
+
+
+def new_index_name(es, alias):
+    name = '{0}_{1}'.format(alias, time.strftime('%Y%m%d%H%M%S'))
+    candidate = name
+    suffix = 1
+    while es.indices.exists(index=candidate):
+        candidate = '{0}_{1}'.format(name, suffix)
+        suffix += 1
+    return candidate
+
+
+def storage_layout(index_per_type=False):
+    """
+    :return: the storage aliases mapped to the document types each of
+             them holds.
+    """
+    if index_per_type:
+        return OrderedDict((type_index_name(doc_type), (doc_type,))
+                           for doc_type in STORAGE_TYPES)
+    return OrderedDict([(STORAGE_INDEX_NAME, STORAGE_TYPES)])
+
+
+def _routing_field(doc_type, index_per_type):
+    if index_per_type and doc_type in ROUTED_TYPES:
+        return ROUTING_FIELD
+    return None
+
+
+def index_mappings(doc_types, index_per_type=False):
+    mappings = {}
+    for doc_type in doc_types:
+        mappings[doc_type] = dict(MAPPINGS[doc_type])
+        if _routing_field(doc_type, index_per_type):
+            # fail writes and gets which are missing the routing, rather
+            # than placing documents where routed reads will miss them
+            mappings[doc_type]['_routing'] = {'required': True}
+    return mappings
+
+
+def create_index(es, index, settings=None, mappings=None):
+    es.indices.create(index=index, body={
+        'settings': settings or index_settings(),
+        'mappings': mappings or MAPPINGS
+    })
+
+
+def create(es, index_per_type=False, **settings):
+    """
+    Creates new storage indices and points the storage aliases at them.
+
+    :return: the storage aliases mapped to the created indices.
+    """
+    indices = OrderedDict()
+    for alias, doc_types in storage_layout(index_per_type).items():
+        indices[alias] = new_index_name(es, alias)
+        create_index(es, indices[alias], index_settings(**settings),
+                     index_mappings(doc_types, index_per_type))
+    es.indices.update_aliases(body={'actions': [
+        {'add': {'index': index, 'alias': alias}}
+        for alias, index in indices.items()]})
+    return indices
+
+
+def _current_index(es, alias):
+    """
+    :return: the index the alias points at, the alias itself if it is a
+             (pre-alias) concrete index, or None if there is no such index.
+    """
+    if es.indices.exists_alias(name=alias):
+        return es.indices.get_alias(name=alias).keys()[0]
+    if es.indices.exists(index=alias):
+        return alias
+    return None
+
+
+def _current_sources(es):
+    """
+    :return: the document types mapped to the index currently holding
+             them, in either layout.
+    """
+    single_index = _current_index(es, STORAGE_INDEX_NAME)
+    return dict((doc_type,
+                 _current_index(es, type_index_name(doc_type)) or
+                 single_index)
+                for doc_type in STORAGE_TYPES)
+
+
+def _routing(hit, routing_field):
+    if routing_field:
+        return hit['_source'].get(routing_field)
+    return None
+
+
+def _copy_action(hit, target_index, routing_field=None):
+    # external versioning keeps the source versions (the storage relies on
+    # node instance versions) and makes copying a document which was
+    # already copied a no-op
+    action = {
+        '_index': target_index,
+        '_type': hit['_type'],
+        '_id': hit['_id'],
+        '_version': hit['_version'],
+        '_version_type': 'external'
+    }
+    routing = _routing(hit, routing_field)
+    if routing:
+        action['_routing'] = routing
+    return {'index': action}, hit['_source']
+
+
+def copy_documents(es, source_index, target_index, doc_type=None,
+                   routing_field=None, chunk_size=500):
+    """
+    Copies all documents (of the given type) of the source index to the
+    target index, keeping their versions and routing them by the given
+    field. May be called repeatedly to copy documents which were created or
+    modified since the previous call.
+
+    :return: the set of (doc type, id) of the source documents.
+    """
+    source_ids = set()
+
+    def actions():
+        for hit in elasticsearch.helpers.scan(es,
+                                              index=source_index,
+                                              doc_type=doc_type,
+                                              version=True):
+            source_ids.add((hit['_type'], hit['_id']))
+            yield hit
+
+    for ok, item in elasticsearch.helpers.streaming_bulk(
+            es, actions(), chunk_size=chunk_size,
+            expand_action_callback=lambda hit: _copy_action(
+                hit, target_index, routing_field)):
+        result = item.values()[0]
+        if not ok and result.get('status') != VERSION_CONFLICT_STATUS:
+            raise RuntimeError('Failed copying document {0}/{1}: {2}'.format(
+                result.get('_type'), result.get('_id'), result))
+    return source_ids
+
+
+def delete_stale_documents(es, target_index, source_ids, doc_type=None,
+                           routing_field=None, chunk_size=500):
+    """
+    Deletes documents (of the given type) of the target index which are
+    not in source_ids (i.e. were deleted from the source index while it was
+    being copied).
+    """
+    stale = (hit for hit in elasticsearch.helpers.scan(es,
+                                                       index=target_index,
+                                                       doc_type=doc_type)
+             if (hit['_type'], hit['_id']) not in source_ids)
+
+    def action(hit):
+        action = {'_op_type': 'delete',
+                  '_index': target_index,
+                  '_type': hit['_type'],
+                  '_id': hit['_id']}
+        routing = _routing(hit, routing_field)
+        if routing:
+            action['_routing'] = routing
+        return action
+
+    elasticsearch.helpers.bulk(es, (action(hit) for hit in stale),
+                               chunk_size=chunk_size)
+
+
+def _block_writes(es, indices, blocked):
+    for index in indices:
+        es.indices.put_settings(index=index,
+                                body={'index.blocks.write': blocked})
+
+
+def migrate(es, index_per_type=False, keep_old_index=False, **settings):
+    """
+    Migrates the storage to new indices with the current schema, in the
+    given layout (a single index, or an index per document type with
+    documents routed by deployment id).
+
+    Documents are copied while the old indices keep serving requests. The
+    old indices are then made read-only (writes to them fail, rather than
+    being lost), documents modified during the copy are copied again and
+    the aliases are switched atomically. Kept old indices remain
+    read-only.
+
+    If the storage is a concrete index named after the alias (as created
+    by older versions), it must be deleted before the alias is created, and
+    a write made in between would recreate it as an empty index: the rest
+    service must be stopped while migrating such a storage.
+
+    :return: the storage aliases mapped to the new indices.
+    """
+    sources = _current_sources(es)
+    if not any(sources.values()):
+        logger.info('No existing storage found; creating it')
+        return create(es, index_per_type, **settings)
+
+    layout = storage_layout(index_per_type)
+    target_settings = index_settings(**settings)
+    targets = OrderedDict()
+    for alias, doc_types in layout.items():
+        targets[alias] = new_index_name(es, alias)
+        # bulk loading settings: no periodic refreshes and no replicas
+        # while the documents are copied
+        create_index(es, targets[alias],
+                     dict(target_settings,
+                          refresh_interval='-1',
+                          number_of_replicas=0),
+                     index_mappings(doc_types, index_per_type))
+
+    def copy_all():
+        copied = {}
+        for alias, doc_types in layout.items():
+            for doc_type in doc_types:
+                if sources[doc_type] is None:
+                    continue
+                logger.info('Copying {0} documents from {1} to {2}'.format(
+                    doc_type, sources[doc_type], targets[alias]))
+                copied[doc_type] = copy_documents(
+                    es, sources[doc_type], targets[alias], doc_type,
+                    _routing_field(doc_type, index_per_type))
+        return copied
+
+    copy_all()
+    for target_index in targets.values():
+        es.indices.put_settings(index=target_index, body={
+            'refresh_interval': target_settings['refresh_interval'],
+            'number_of_replicas': target_settings['number_of_replicas']
+        })
+
+    # catch up with modifications made during the copy, with no further
+    # modifications made to the old indices
+    old_indices = set(index for index in sources.values() if index)
+    _block_writes(es, old_indices, True)
+    try:
+        for index in old_indices:
+            es.indices.refresh(index=index)
+        copied = copy_all()
+        for alias, doc_types in layout.items():
+            es.indices.refresh(index=targets[alias])
+            for doc_type in doc_types:
+                delete_stale_documents(
+                    es, targets[alias], copied.get(doc_type, set()),
+                    doc_type, _routing_field(doc_type, index_per_type))
+            es.indices.refresh(index=targets[alias])
+
+        actions = []
+        for alias in storage_layout(False).keys() + \
+                storage_layout(True).keys():
+            if es.indices.exists_alias(name=alias):
+                actions.extend({'remove': {'index': index, 'alias': alias}}
+                               for index in es.indices.get_alias(name=alias))
+            elif alias in old_indices and alias in targets:
+                # a concrete index can not be replaced by an alias
+                # atomically
+                es.indices.delete(index=alias)
+                old_indices.remove(alias)
+        actions.extend({'add': {'index': index, 'alias': alias}}
+                       for alias, index in targets.items())
+        es.indices.update_aliases(body={'actions': actions})
+    except Exception:
+        # the old indices keep serving the storage
+        exc_info = sys.exc_info()
+        _block_writes(es, old_indices, False)
+        raise exc_info[0], exc_info[1], exc_info[2]
+    if not keep_old_index:
+        for index in old_indices:
+            es.indices.delete(index=index)
+    for alias, index in targets.items():
+        logger.info('Storage alias {0} now points at {1}'.format(alias,
+                                                                 index))
+    return targets
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description='Create or migrate the manager Elasticsearch storage')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument('--shards', type=int,
+                        default=DEFAULT_NUMBER_OF_SHARDS,
+                        help='number of shards of each new index')
+    parser.add_argument('--replicas', type=int,
+                        default=DEFAULT_NUMBER_OF_REPLICAS,
+                        help='number of replicas of each new index')
+    parser.add_argument('--refresh-interval',
+                        default=DEFAULT_REFRESH_INTERVAL,
+                        help='refresh interval of each new index')
+    parser.add_argument('--index-per-type', action='store_true',
+                        help='use an index per document type, routing '
+                             'documents by deployment id (the rest service '
+                             'must be configured with es_index_per_type)')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('create', help='create an empty storage')
+    migrate_parser = subparsers.add_parser(
+        'migrate', help='migrate the existing storage (or create it if it '
+                        'does not exist) to the current schema and layout')
+    migrate_parser.add_argument('--keep-old-index', action='store_true',
+                                help='do not delete the previous indices')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = parse_arguments(argv if argv is not None else sys.argv[1:])
+    es = elasticsearch.Elasticsearch(hosts=[{'host': args.host,
+                                             'port': args.port}])
+    settings = {'number_of_shards': args.shards,
+                'number_of_replicas': args.replicas,
+                'refresh_interval': args.refresh_interval}
+    if args.command == 'create':
+        indices = create(es, args.index_per_type, **settings)
+    else:
+        indices = migrate(es, args.index_per_type,
+                          keep_old_index=args.keep_old_index, **settings)
+    for alias, index in indices.items():
+        print '{0} -> {1}'.format(alias, index)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,11 +14,17 @@
 #  * limitations under the License.
 
 
+import os
+import contextlib
+
 import elasticsearch.exceptions
+import elasticsearch.helpers
 from elasticsearch import Elasticsearch
 
 from manager_rest import config
 from manager_rest import manager_exceptions
+from manager_rest.profiling import TracingTransport
+from manager_rest import memory_storage_manager
 from manager_rest.models import (BlueprintState,
                                  Deployment,
                                  DeploymentModification,
@@ -43,25 +49,126 @@ MUTATE_PARAMS = {
     'refresh': True
 }
 
+STORAGE_TYPES = (BLUEPRINT_TYPE,
+                 DEPLOYMENT_TYPE,
+                 DEPLOYMENT_MODIFICATION_TYPE,
+                 EXECUTION_TYPE,
+                 NODE_TYPE,
+                 NODE_INSTANCE_TYPE,
+                 PROVIDER_CONTEXT_TYPE)
+
+# with an index per type, documents of these types are routed by their
+# deployment id, so reading or deleting the documents of a deployment
+# touches a single shard (deployments themselves are routed by their id,
+# which is the default routing)
+ROUTED_TYPES = frozenset([DEPLOYMENT_MODIFICATION_TYPE,
+                          EXECUTION_TYPE,
+                          NODE_TYPE,
+                          NODE_INSTANCE_TYPE])
+ROUTING_FIELD = 'deployment_id'
+
+# the document types of the storage types which are exported and imported
+# by the storage managers (see export_docs and import_docs)
+EXPORTED_TYPES = {
+    memory_storage_manager.NODES: NODE_TYPE,
+    memory_storage_manager.NODE_INSTANCES: NODE_INSTANCE_TYPE,
+    memory_storage_manager.BLUEPRINTS: BLUEPRINT_TYPE,
+    memory_storage_manager.DEPLOYMENTS: DEPLOYMENT_TYPE,
+    memory_storage_manager.DEPLOYMENT_MODIFICATIONS:
+        DEPLOYMENT_MODIFICATION_TYPE,
+    memory_storage_manager.EXECUTIONS: EXECUTION_TYPE,
+    memory_storage_manager.PROVIDER_CONTEXT: PROVIDER_CONTEXT_TYPE
+}
+
+# the number of failed document ids listed in import error messages
+REPORTED_IDS_LIMIT = 10
+
+
+def type_index_name(doc_type):
+    return '{0}_{1}'.format(STORAGE_INDEX_NAME, doc_type)
+
+
+def storage_index_names(index_per_type=False):
+    """
+    :return: the names (aliases) of the indices holding the storage.
+    """
+    if index_per_type:
+        return [type_index_name(doc_type) for doc_type in STORAGE_TYPES]
+    return [STORAGE_INDEX_NAME]
+
 
 class ESStorageManager(object):
 
-    def __init__(self, host, port):
+    def __init__(self, host, port, index_per_type=False):
         self.es_host = host
         self.es_port = port
+        self.index_per_type = index_per_type
+        self._client = None
+        self._client_pid = None
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # elasticsearch has no transactions; operations are applied one
+        # by one
+        yield
 
     @property
     def _connection(self):
-        return Elasticsearch(hosts=[{'host': self.es_host,
-                                     'port': self.es_port}])
-
-    def _list_docs(self, doc_type, model_class, query=None, fields=None):
+        # the (thread safe) client keeps a pool of http connections, which
+        # is reused across requests but never shared with forked processes
+        if self._client is None or self._client_pid != os.getpid():
+            self._client = Elasticsearch(hosts=[{'host': self.es_host,
+                                                 'port': self.es_port}],
+                                         transport_class=TracingTransport)
+            self._client_pid = os.getpid()
+        return self._client
+
+    def _index(self, doc_type):
+        if self.index_per_type:
+            return type_index_name(doc_type)
+        return STORAGE_INDEX_NAME
+
+    def _routing(self, doc_type, deployment_id):
+        if self.index_per_type and doc_type in ROUTED_TYPES and \
+                deployment_id:
+            return {'routing': deployment_id}
+        return {}
+
+    def _doc_routing(self, doc_type, doc_id):
+        """
+        Routing parameters for accessing a document of which the deployment
+        id is not known, looking it up if the document type is routed.
+        """
+        if not self.index_per_type or doc_type not in ROUTED_TYPES:
+            return {}
+        hit = self._find_doc(doc_type, doc_id, fields=[ROUTING_FIELD])
+        return self._routing(doc_type, hit['_source'].get(ROUTING_FIELD))
+
+    def _find_doc(self, doc_type, doc_id, fields=None):
+        # a routed document can only be fetched by id given its routing,
+        # otherwise it is looked up in all shards of its index
+        search_result = self._connection.search(
+            index=self._index(doc_type),
+            doc_type=doc_type,
+            body={'query': {'ids': {'values': [doc_id]}}},
+            version=True,
+            _source=list(fields) if fields else True)
+        hits = search_result['hits']['hits']
+        if not hits:
+            raise elasticsearch.exceptions.NotFoundError(
+                404, '{0} {1} not found'.format(doc_type, doc_id))
+        return hits[0]
+
+    def _list_docs(self, doc_type, model_class, query=None, fields=None,
+                   deployment_id=None):
         include = list(fields) if fields else True
-        search_result = self._connection.search(index=STORAGE_INDEX_NAME,
-                                                doc_type=doc_type,
-                                                size=DEFAULT_SEARCH_SIZE,
-                                                body=query,
-                                                _source=include)
+        search_result = self._connection.search(
+            index=self._index(doc_type),
+            doc_type=doc_type,
+            size=DEFAULT_SEARCH_SIZE,
+            body=query,
+            _source=include,
+            **self._routing(doc_type, deployment_id))
         docs = map(lambda hit: hit['_source'], search_result['hits']['hits'])
 
         # ES doesn't return _version if using its search API.
@@ -71,51 +178,55 @@ class ESStorageManager(object):
         return [self._fill_missing_fields_and_deserialize(doc, model_class)
                 for doc in docs]
 
-    def _get_doc(self, doc_type, doc_id, fields=None):
+    def _get_doc(self, doc_type, doc_id, fields=None, deployment_id=None):
         try:
+            if doc_type in ROUTED_TYPES and self.index_per_type and \
+                    not deployment_id:
+                return self._find_doc(doc_type, doc_id, fields)
+            routing = self._routing(doc_type, deployment_id)
             if fields:
-                return self._connection.get(index=STORAGE_INDEX_NAME,
+                return self._connection.get(index=self._index(doc_type),
                                             doc_type=doc_type,
                                             id=doc_id,
-                                            _source=[f for f in fields])
+                                            _source=[f for f in fields],
+                                            **routing)
             else:
-                return self._connection.get(index=STORAGE_INDEX_NAME,
+                return self._connection.get(index=self._index(doc_type),
                                             doc_type=doc_type,
-                                            id=doc_id)
+                                            id=doc_id,
+                                            **routing)
         except elasticsearch.exceptions.NotFoundError:
             raise manager_exceptions.NotFoundError(
                 '{0} {1} not found'.format(doc_type, doc_id))
 
     def _get_doc_and_deserialize(self, doc_type, doc_id, model_class,
-                                 fields=None):
-        doc = self._get_doc(doc_type, doc_id, fields)
+                                 fields=None, deployment_id=None):
+        doc = self._get_doc(doc_type, doc_id, fields, deployment_id)
         if not fields:
             return model_class(**doc['_source'])
         else:
-            if len(fields) != len(doc['_source']):
-                missing_fields = [field for field in fields if field not
-                                  in doc['_source']]
-                raise RuntimeError('Some or all fields specified for query '
-                                   'were missing: {0}'.format(missing_fields))
+            # documents stored by older versions may not have every field
             fields_data = doc['_source']
             return self._fill_missing_fields_and_deserialize(fields_data,
                                                              model_class)
 
     def _put_doc_if_not_exists(self, doc_type, doc_id, value):
         try:
-            self._connection.create(index=STORAGE_INDEX_NAME,
+            self._connection.create(index=self._index(doc_type),
                                     doc_type=doc_type, id=doc_id,
                                     body=value,
-                                    **MUTATE_PARAMS)
+                                    **dict(MUTATE_PARAMS, **self._routing(
+                                        doc_type, value.get(ROUTING_FIELD))))
         except elasticsearch.exceptions.ConflictError:
             raise manager_exceptions.ConflictError(
                 '{0} {1} already exists'.format(doc_type, doc_id))
 
     def _delete_doc(self, doc_type, doc_id, model_class, id_field='id'):
         try:
-            res = self._connection.delete(STORAGE_INDEX_NAME, doc_type,
+            routing = self._doc_routing(doc_type, doc_id)
+            res = self._connection.delete(self._index(doc_type), doc_type,
                                           doc_id,
-                                          **MUTATE_PARAMS)
+                                          **dict(MUTATE_PARAMS, **routing))
         except elasticsearch.exceptions.NotFoundError:
             raise manager_exceptions.NotFoundError(
                 "{0} {1} not found".format(doc_type, doc_id))
@@ -126,10 +237,12 @@ class ESStorageManager(object):
         return self._fill_missing_fields_and_deserialize(fields_data,
                                                          model_class)
 
-    def _delete_doc_by_query(self, doc_type, query):
-        self._connection.delete_by_query(index=STORAGE_INDEX_NAME,
-                                         doc_type=doc_type,
-                                         body=query)
+    def _delete_doc_by_query(self, doc_type, query, deployment_id=None):
+        self._connection.delete_by_query(
+            index=self._index(doc_type),
+            doc_type=doc_type,
+            body=query,
+            **self._routing(doc_type, deployment_id))
 
     @staticmethod
     def _fill_missing_fields_and_deserialize(fields_data, model_class):
@@ -160,17 +273,100 @@ class ESStorageManager(object):
         }
 
     def node_instances_list(self, include=None):
-        search_result = self._connection.search(index=STORAGE_INDEX_NAME,
-                                                doc_type=NODE_INSTANCE_TYPE,
-                                                size=DEFAULT_SEARCH_SIZE,
-                                                _source=include or True)
-        docs_with_versions = \
-            map(lambda hit: (hit['_source'], hit['_version']),
-                search_result['hits']['hits'])
-        return map(
-            lambda doc_with_version: DeploymentNodeInstance(
-                version=doc_with_version[1], **doc_with_version[0]),
-            docs_with_versions)
+        search_result = self._connection.search(
+            index=self._index(NODE_INSTANCE_TYPE),
+            doc_type=NODE_INSTANCE_TYPE,
+            size=DEFAULT_SEARCH_SIZE,
+            version=True,
+            _source=include or True)
+        return [self._deserialize_node_instance(hit['_source'],
+                                                hit['_version'])
+                for hit in search_result['hits']['hits']]
+
+    def _summarize(self, doc_type, group_by, deployment_id=None):
+        # nested terms aggregations, one level per group by field; only
+        # the counts are returned, no documents
+        aggregations = None
+        for field in reversed(group_by):
+            aggregation = {'terms': {'field': field, 'size': 0}}
+            if aggregations:
+                aggregation['aggs'] = aggregations
+            aggregations = {field: aggregation}
+        body = {'aggs': aggregations}
+        if deployment_id:
+            body.update(self._build_field_value_filter('deployment_id',
+                                                       deployment_id))
+        search_result = self._connection.search(
+            index=self._index(doc_type),
+            doc_type=doc_type,
+            search_type='count',
+            body=body,
+            **self._routing(doc_type, deployment_id))
+        return self._summary_rows(search_result['aggregations'], group_by)
+
+    @classmethod
+    def _summary_rows(cls, aggregations, group_by, depth=0, key=()):
+        rows = []
+        for bucket in aggregations[group_by[depth]]['buckets']:
+            bucket_key = key + (bucket['key'],)
+            if depth + 1 < len(group_by):
+                rows.extend(cls._summary_rows(bucket, group_by, depth + 1,
+                                              bucket_key))
+            else:
+                rows.append(dict(zip(group_by, bucket_key),
+                                 count=bucket['doc_count']))
+        return rows
+
+    def _count(self, doc_type, ids_limit=0, exclude=None, **filters):
+        # a filter only query returning the total and, at most, ids_limit
+        # hits without their source (with ids_limit=0, just the total)
+        filters = dict((field, value) for field, value in filters.iteritems()
+                       if value is not None)
+        query = {'bool': {
+            'must': [{'term': {field: value}}
+                     for field, value in filters.iteritems()] or
+                    [{'match_all': {}}],
+            'must_not': [{'terms': {field: list(values)}}
+                         for field, values in (exclude or {}).iteritems()
+                         if values]}}
+        search_result = self._connection.search(
+            index=self._index(doc_type),
+            doc_type=doc_type,
+            size=ids_limit,
+            _source=False,
+            body={'query': {'constant_score': {'filter': query}}},
+            **self._routing(doc_type, filters.get(ROUTING_FIELD)))
+        hits = search_result['hits']
+        return hits['total'], [hit['_id'] for hit in hits['hits']]
+
+    def node_instances_count(self, deployment_id=None,
+                             exclude_states=None, ids_limit=0):
+        return self._count(NODE_INSTANCE_TYPE, ids_limit,
+                           exclude={'state': exclude_states},
+                           deployment_id=deployment_id)
+
+    def executions_count(self, deployment_id=None, status=None,
+                         exclude_statuses=None, ids_limit=0):
+        return self._count(EXECUTION_TYPE, ids_limit,
+                           exclude={'status': exclude_statuses},
+                           deployment_id=deployment_id,
+                           status=status)
+
+    def deployments_count(self, blueprint_id=None, ids_limit=0):
+        return self._count(DEPLOYMENT_TYPE, ids_limit,
+                           blueprint_id=blueprint_id)
+
+    def deployment_modifications_count(self, deployment_id=None,
+                                       status=None, ids_limit=0):
+        return self._count(DEPLOYMENT_MODIFICATION_TYPE, ids_limit,
+                           deployment_id=deployment_id,
+                           status=status)
+
+    def node_instances_summary(self, group_by, deployment_id=None):
+        return self._summarize(NODE_INSTANCE_TYPE, group_by, deployment_id)
+
+    def executions_summary(self, group_by, deployment_id=None):
+        return self._summarize(EXECUTION_TYPE, group_by, deployment_id)
 
     def blueprints_list(self, include=None):
         return self._list_docs(BLUEPRINT_TYPE, BlueprintState, fields=include)
@@ -178,13 +374,19 @@ class ESStorageManager(object):
     def deployments_list(self, include=None):
         return self._list_docs(DEPLOYMENT_TYPE, Deployment, fields=include)
 
-    def executions_list(self, deployment_id=None, include=None):
+    def executions_list(self, deployment_id=None, include=None,
+                        status=None):
         query = None
-        if deployment_id:
-            query = self._build_field_value_filter('deployment_id',
-                                                   deployment_id)
+        if deployment_id or status:
+            terms = []
+            if deployment_id:
+                terms.append({'term': {'deployment_id': deployment_id}})
+            if status:
+                terms.append({'term': {'status': status}})
+            query = {'query': {'bool': {'must': terms}}}
         return self._list_docs(EXECUTION_TYPE, Execution,
-                               query=query, fields=include)
+                               query=query, fields=include,
+                               deployment_id=deployment_id)
 
     def get_blueprint_deployments(self, blueprint_id, include=None):
         return self._list_docs(DEPLOYMENT_TYPE, Deployment,
@@ -196,16 +398,22 @@ class ESStorageManager(object):
         doc = self._get_doc(NODE_INSTANCE_TYPE,
                             node_instance_id,
                             fields=include)
-        node = DeploymentNodeInstance(version=doc['_version'],
-                                      **doc['_source'])
-        return node
+        return self._deserialize_node_instance(doc['_source'],
+                                               doc['_version'])
+
+    def _deserialize_node_instance(self, source, version):
+        # the source may hold only some of the fields (see 'include')
+        source['version'] = version
+        return self._fill_missing_fields_and_deserialize(
+            source, DeploymentNodeInstance)
 
     def get_node(self, deployment_id, node_id, include=None):
         storage_node_id = self._storage_node_id(deployment_id, node_id)
         return self._get_doc_and_deserialize(doc_id=storage_node_id,
                                              doc_type=NODE_TYPE,
                                              model_class=DeploymentNode,
-                                             fields=include)
+                                             fields=include,
+                                             deployment_id=deployment_id)
 
     def get_node_instances(self, deployment_id, node_id=None, include=None):
         query = None
@@ -219,7 +427,8 @@ class ESStorageManager(object):
         return self._list_docs(NODE_INSTANCE_TYPE,
                                DeploymentNodeInstance,
                                query=query,
-                               fields=include)
+                               fields=include,
+                               deployment_id=deployment_id)
 
     def get_nodes(self, deployment_id=None, include=None):
         query = None
@@ -228,7 +437,8 @@ class ESStorageManager(object):
         return self._list_docs(NODE_TYPE,
                                DeploymentNode,
                                query=query,
-                               fields=include)
+                               fields=include,
+                               deployment_id=deployment_id)
 
     def get_blueprint(self, blueprint_id, include=None):
         return self._get_doc_and_deserialize(BLUEPRINT_TYPE,
@@ -264,6 +474,7 @@ class ESStorageManager(object):
         storage_node_id = self._storage_node_id(node.deployment_id, node.id)
         doc_data = node.to_dict()
         self._put_doc_if_not_exists(NODE_TYPE, storage_node_id, doc_data)
+        return 1
 
     def put_node_instance(self, node_instance):
         node_instance_id = node_instance.id
@@ -284,19 +495,106 @@ class ESStorageManager(object):
         update_doc = {'doc': update_doc_data}
 
         try:
-            self._connection.update(index=STORAGE_INDEX_NAME,
+            # the deployment id is needed for routing anyway, and the
+            # workflow id tells whether the deployment's environment status
+            # needs to be updated as well
+            execution = self._get_doc(
+                EXECUTION_TYPE, str(execution_id),
+                fields=['deployment_id', 'workflow_id'])['_source']
+            deployment_id = execution.get('deployment_id')
+            self._connection.update(index=self._index(EXECUTION_TYPE),
                                     doc_type=EXECUTION_TYPE,
                                     id=str(execution_id),
                                     body=update_doc,
-                                    **MUTATE_PARAMS)
-        except elasticsearch.exceptions.NotFoundError:
+                                    **dict(MUTATE_PARAMS, **self._routing(
+                                        EXECUTION_TYPE, deployment_id)))
+        except (manager_exceptions.NotFoundError,
+                elasticsearch.exceptions.NotFoundError):
             raise manager_exceptions.NotFoundError(
                 "Execution {0} not found".format(execution_id))
 
+        if execution.get('workflow_id') == \
+                Execution.CREATE_DEPLOYMENT_ENVIRONMENT and deployment_id:
+            try:
+                self._connection.update(
+                    index=self._index(DEPLOYMENT_TYPE),
+                    doc_type=DEPLOYMENT_TYPE,
+                    id=deployment_id,
+                    body={'doc': {'environment_status': status,
+                                  'environment_error': error}},
+                    **MUTATE_PARAMS)
+            except elasticsearch.exceptions.NotFoundError:
+                # the deployment has been deleted
+                pass
+
+    def update_executions_status(self, updates):
+        if not updates:
+            return
+        hits = self._connection.search(
+            index=self._index(EXECUTION_TYPE),
+            doc_type=EXECUTION_TYPE,
+            body={'query': {'ids': {'values': [
+                str(execution_id) for execution_id, _, _ in updates]}}},
+            size=len(updates),
+            version=True,
+            _source=['status', 'deployment_id', 'workflow_id'])
+        executions = dict((hit['_id'], hit) for hit in hits['hits']['hits'])
+        actions = []
+        for execution_id, status, error in updates:
+            hit = executions.get(str(execution_id))
+            if hit is None or \
+                    hit['_source'].get('status') in Execution.END_STATES:
+                continue
+            deployment_id = hit['_source'].get('deployment_id')
+            # an update conflicting with a concurrent one (e.g. of an
+            # execution which ended meanwhile) fails, and is dropped
+            meta = {'_index': hit['_index'],
+                    '_type': EXECUTION_TYPE,
+                    '_id': hit['_id'],
+                    '_version': hit['_version']}
+            meta.update(('_' + key, value) for key, value in
+                        self._routing(EXECUTION_TYPE, deployment_id).items())
+            doc = {'status': status}
+            environment_doc = {'environment_status': status}
+            if error is not None:
+                doc['error'] = environment_doc['environment_error'] = error
+            actions.extend([{'update': meta}, {'doc': doc}])
+            if hit['_source'].get('workflow_id') == \
+                    Execution.CREATE_DEPLOYMENT_ENVIRONMENT and deployment_id:
+                actions.extend([
+                    {'update': {'_index': self._index(DEPLOYMENT_TYPE),
+                                '_type': DEPLOYMENT_TYPE,
+                                '_id': deployment_id}},
+                    {'doc': environment_doc}])
+        if actions:
+            # a single refresh for all of the updates
+            self._connection.bulk(body=actions, **MUTATE_PARAMS)
+
+    def transition_execution_status(self, execution_id, from_status,
+                                    to_status):
+        execution = self._get_doc(EXECUTION_TYPE, str(execution_id),
+                                  fields=['deployment_id', 'status'])
+        if execution['_source'].get('status') != from_status:
+            return False
+        # the update only applies to the version the status was read from
+        try:
+            self._connection.update(
+                index=self._index(EXECUTION_TYPE),
+                doc_type=EXECUTION_TYPE,
+                id=str(execution_id),
+                body={'doc': {'status': to_status}},
+                version=execution['_version'],
+                **dict(MUTATE_PARAMS, **self._routing(
+                    EXECUTION_TYPE,
+                    execution['_source'].get('deployment_id'))))
+        except elasticsearch.exceptions.ConflictError:
+            return False
+        return True
+
     def update_provider_context(self, provider_context):
         doc_data = {'doc': provider_context.to_dict()}
         try:
-            self._connection.update(index=STORAGE_INDEX_NAME,
+            self._connection.update(index=self._index(PROVIDER_CONTEXT_TYPE),
                                     doc_type=PROVIDER_CONTEXT_TYPE,
                                     id=PROVIDER_CONTEXT_ID,
                                     body=doc_data,
@@ -307,10 +605,11 @@ class ESStorageManager(object):
 
     def delete_deployment(self, deployment_id):
         query = {'query': {'term': {'deployment_id': deployment_id}}}
-        self._delete_doc_by_query(EXECUTION_TYPE, query)
-        self._delete_doc_by_query(NODE_INSTANCE_TYPE, query)
-        self._delete_doc_by_query(NODE_TYPE, query)
-        self._delete_doc_by_query(DEPLOYMENT_MODIFICATION_TYPE, query)
+        for doc_type in (EXECUTION_TYPE,
+                         NODE_INSTANCE_TYPE,
+                         NODE_TYPE,
+                         DEPLOYMENT_MODIFICATION_TYPE):
+            self._delete_doc_by_query(doc_type, query, deployment_id)
         return self._delete_doc(DEPLOYMENT_TYPE, deployment_id, Deployment)
 
     def delete_execution(self, execution_id):
@@ -336,11 +635,12 @@ class ESStorageManager(object):
                 'planned_number_of_instances'] = planned_number_of_instances
         update_doc = {'doc': update_doc_data}
         try:
-            self._connection.update(index=STORAGE_INDEX_NAME,
+            self._connection.update(index=self._index(NODE_TYPE),
                                     doc_type=NODE_TYPE,
                                     id=storage_node_id,
                                     body=update_doc,
-                                    **MUTATE_PARAMS)
+                                    **dict(MUTATE_PARAMS, **self._routing(
+                                        NODE_TYPE, deployment_id)))
         except elasticsearch.exceptions.NotFoundError:
             raise manager_exceptions.NotFoundError(
                 "Node {0} not found".format(node_id))
@@ -370,11 +670,12 @@ class ESStorageManager(object):
         updated = current.to_dict()
         del updated['version']
 
-        self._connection.index(index=STORAGE_INDEX_NAME,
+        self._connection.index(index=self._index(NODE_INSTANCE_TYPE),
                                doc_type=NODE_INSTANCE_TYPE,
                                id=node.id,
                                body=updated,
-                               **MUTATE_PARAMS)
+                               **dict(MUTATE_PARAMS, **self._routing(
+                                   NODE_INSTANCE_TYPE, current.deployment_id)))
 
     def put_provider_context(self, provider_context):
         doc_data = provider_context.to_dict()
@@ -412,11 +713,14 @@ class ESStorageManager(object):
 
         update_doc = {'doc': update_doc_data}
         try:
-            self._connection.update(index=STORAGE_INDEX_NAME,
-                                    doc_type=DEPLOYMENT_MODIFICATION_TYPE,
-                                    id=modification_id,
-                                    body=update_doc,
-                                    **MUTATE_PARAMS)
+            routing = self._doc_routing(DEPLOYMENT_MODIFICATION_TYPE,
+                                        modification_id)
+            self._connection.update(
+                index=self._index(DEPLOYMENT_MODIFICATION_TYPE),
+                doc_type=DEPLOYMENT_MODIFICATION_TYPE,
+                id=modification_id,
+                body=update_doc,
+                **dict(MUTATE_PARAMS, **routing))
         except elasticsearch.exceptions.NotFoundError:
             raise manager_exceptions.NotFoundError(
                 "Modification {0} not found".format(modification_id))
@@ -429,15 +733,117 @@ class ESStorageManager(object):
         return self._list_docs(DEPLOYMENT_MODIFICATION_TYPE,
                                DeploymentModification,
                                query=query,
-                               fields=include)
+                               fields=include,
+                               deployment_id=deployment_id)
 
     @staticmethod
     def _storage_node_id(deployment_id, node_id):
         return '{0}_{1}'.format(deployment_id, node_id)
 
+    def export_docs(self, storage_type, batch_size):
+        doc_type = EXPORTED_TYPES[storage_type]
+        # scrolling over a consistent view of the documents
+        hits = elasticsearch.helpers.scan(self._connection,
+                                          index=self._index(doc_type),
+                                          doc_type=doc_type,
+                                          size=batch_size,
+                                          version=True)
+        batch = []
+        for hit in hits:
+            doc = hit['_source']
+            if doc_type == NODE_INSTANCE_TYPE:
+                doc['version'] = hit['_version']
+            batch.append(doc)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _doc_action(self, storage_type, doc, op_type):
+        doc_type = EXPORTED_TYPES[storage_type]
+        if doc_type == PROVIDER_CONTEXT_TYPE:
+            doc_id = PROVIDER_CONTEXT_ID
+        else:
+            doc_id = memory_storage_manager.storage_doc_id(storage_type, doc)
+        action = {'_op_type': op_type,
+                  '_index': self._index(doc_type),
+                  '_type': doc_type,
+                  '_id': doc_id}
+        action.update(('_' + key, value) for key, value in self._routing(
+            doc_type, doc.get(ROUTING_FIELD)).items())
+        if op_type != 'delete':
+            doc = dict(doc)
+            # node instances are versioned by elasticsearch
+            doc.pop('version', None)
+            action['_source'] = doc
+        return action
+
+    def import_docs(self, storage_type, docs):
+        """
+        Stores exported documents of the storage type, which must not
+        exist yet. Node instances are versioned by elasticsearch, so their
+        versions start over.
+
+        As with the other storage managers, either all the documents are
+        stored, or none of them: when storing some of them fails, the
+        others are deleted.
+        """
+        doc_type = EXPORTED_TYPES[storage_type]
+        # not refreshed, see refresh()
+        created, conflicts, errors = [], [], []
+        for doc, (ok, item) in zip(docs, elasticsearch.helpers.streaming_bulk(
+                self._connection,
+                (self._doc_action(storage_type, doc, 'create')
+                 for doc in docs),
+                chunk_size=max(len(docs), 1))):
+            result = item.values()[0]
+            if ok:
+                created.append(doc)
+            elif result.get('status') == 409:
+                conflicts.append(result['_id'])
+            else:
+                errors.append('{0}: {1}'.format(result['_id'],
+                                                result.get('error')))
+        if (errors or conflicts) and created:
+            self.delete_docs(storage_type, created)
+        if errors:
+            raise RuntimeError('Failed importing {0} {1} documents: {2}'
+                               .format(len(errors), doc_type,
+                                       ', '.join(errors[:REPORTED_IDS_LIMIT])))
+        if conflicts:
+            raise manager_exceptions.ConflictError(
+                '{0} documents already exist: {1}'.format(
+                    doc_type, ', '.join(conflicts[:REPORTED_IDS_LIMIT])))
+
+    def delete_docs(self, storage_type, docs):
+        """
+        Deletes the documents of the storage type with the ids of the given
+        documents (e.g. imported ones), skipping missing ones.
+        """
+        for ok, item in elasticsearch.helpers.streaming_bulk(
+                self._connection,
+                (self._doc_action(storage_type, doc, 'delete')
+                 for doc in docs),
+                chunk_size=max(len(docs), 1)):
+            result = item.values()[0]
+            if not ok and result.get('status') != 404:
+                raise RuntimeError('Failed deleting {0} document {1}: {2}'
+                                   .format(EXPORTED_TYPES[storage_type],
+                                           result['_id'],
+                                           result.get('error')))
+
+    def refresh(self):
+        """
+        Makes the imported documents visible to searches.
+        """
+        self._connection.indices.refresh(index=','.join(sorted(set(
+            self._index(doc_type) for doc_type in STORAGE_TYPES))))
+
 
 def create():
     return ESStorageManager(
         config.instance().db_address,
-        config.instance().db_port
+        config.instance().db_port,
+        config.instance().es_index_per_type
     )
@@ -0,0 +1,309 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Scheduling of queued executions.
+
+An execution requested (with queue=true) while other executions of its
+deployment are in progress is stored in the 'queued' status, rather than
+rejected. Whenever an execution ends (see
+BlueprintsManager.update_execution_status), the oldest queued execution of
+its deployment is started, so the queued executions of a deployment run
+one at a time, in the order they were requested.
+
+The number of executions running manager wide may be limited as well, by
+the execution_scheduling configuration, e.g.:
+
+    execution_scheduling:
+      max_running_executions: 50
+      max_running_per_blueprint: 20
+      max_running_per_workflow:
+        install: 20
+        uninstall: 20
+
+When limits are configured, every execution (unless forced) is queued and
+started by the scheduler once the limits allow it. Deployments take turns:
+of the executions which may start (the oldest queued execution of every
+deployment with no execution in progress, within the limits), the one
+whose blueprint has the fewest running executions starts first, and the
+oldest one among those.
+
+Starting a queued execution first moves it from the 'queued' to the
+'pending' status, which only succeeds for one of concurrent dispatchers
+(e.g. rest workers handling the end of two executions), so an execution
+is started once. The limits, however, are soft limits: they are checked
+against the executions in progress when dispatching, so concurrent
+dispatchers may each start an execution for the same free slot, and the
+executions in progress may exceed a limit by up to the number of rest
+workers dispatching at once.
+
+An execution may also end without its status being updated through the
+rest service (e.g. when the management worker running it died, or the
+status was written straight to the storage), in which case nothing
+dispatches its deployment's queued executions. Summarizing the execution
+queue (GET /summary/execution-queue, e.g. by the manager's monitoring)
+sweeps every deployment's queued executions, starting those which may
+start.
+
+Each dispatch counts the executions in progress (a single aggregation
+when limits are configured) and, unless the limits are reached, lists the
+queued executions once, however many executions it starts. Whether the
+deployment of a queued execution has an execution in progress is counted
+when the execution is about to start.
+"""
+
+from datetime import datetime
+
+from flask import current_app
+
+from manager_rest import config
+from manager_rest import models
+from manager_rest.workflow_client import workflow_client
+
+# statuses of executions which are in progress
+ACTIVE_STATES = [models.Execution.PENDING,
+                 models.Execution.STARTED,
+                 models.Execution.CANCELLING,
+                 models.Execution.FORCE_CANCELLING]
+
+# statuses of executions which are not in progress
+INACTIVE_STATES = models.Execution.END_STATES + [models.Execution.QUEUED]
+
+EXECUTION_FIELDS = ['id', 'deployment_id', 'blueprint_id', 'workflow_id',
+                    'created_at']
+
+
+def _limits():
+    return config.instance().execution_scheduling or {}
+
+
+def execution_age(execution, now):
+    """
+    :return: the seconds since the execution was created.
+    """
+    created_at = execution.created_at
+    date_format = '%Y-%m-%d %H:%M:%S.%f' if '.' in created_at \
+        else '%Y-%m-%d %H:%M:%S'
+    age = now - datetime.strptime(created_at, date_format)
+    return age.days * 86400 + age.seconds + age.microseconds / 1e6
+
+
+def _count_by(executions, field):
+    counts = {}
+    for execution in executions:
+        value = getattr(execution, field)
+        counts[value] = counts.get(value, 0) + 1
+    return counts
+
+
+class _Running(object):
+    """
+    The counts of executions in progress, manager wide, per blueprint and
+    per workflow.
+    """
+
+    def __init__(self, summary=()):
+        self.total = 0
+        self.per_blueprint = {}
+        self.per_workflow = {}
+        for row in summary:
+            if row['status'] in ACTIVE_STATES:
+                self._add(row['blueprint_id'], row['workflow_id'],
+                          row['count'])
+
+    def _add(self, blueprint_id, workflow_id, count=1):
+        self.total += count
+        self.per_blueprint[blueprint_id] = \
+            self.per_blueprint.get(blueprint_id, 0) + count
+        self.per_workflow[workflow_id] = \
+            self.per_workflow.get(workflow_id, 0) + count
+
+    def add(self, execution):
+        self._add(execution.blueprint_id, execution.workflow_id)
+
+
+class ExecutionScheduler(object):
+
+    def __init__(self, blueprints_manager):
+        self.blueprints_manager = blueprints_manager
+
+    @property
+    def sm(self):
+        return self.blueprints_manager.sm
+
+    @property
+    def limited(self):
+        """
+        Whether manager wide limits apply, in which case every execution
+        is to be queued.
+        """
+        return bool(_limits())
+
+    def _running(self):
+        return _Running(self.sm.executions_summary(
+            ['status', 'blueprint_id', 'workflow_id']))
+
+    def _busy(self, deployment_id):
+        """
+        Whether the deployment has an execution in progress.
+        """
+        count, _ = self.sm.executions_count(deployment_id=deployment_id,
+                                            exclude_statuses=INACTIVE_STATES)
+        return count > 0
+
+    def _queued(self, deployment_id=None):
+        return self.sm.executions_list(deployment_id=deployment_id,
+                                       status=models.Execution.QUEUED,
+                                       include=EXECUTION_FIELDS)
+
+    @staticmethod
+    def _at_capacity(running):
+        max_running = _limits().get('max_running_executions')
+        return max_running is not None and running.total >= max_running
+
+    def _next(self, running, queued, busy):
+        """
+        :param busy: whether deployments have an execution in progress, by
+                     deployment id, filled in as deployments are checked.
+        :return: the queued execution to start next, or None.
+        """
+        if self._at_capacity(running):
+            return None
+        limits = _limits()
+        max_per_blueprint = limits.get('max_running_per_blueprint')
+        max_per_workflow = limits.get('max_running_per_workflow') or {}
+
+        heads = {}
+        for execution in queued:
+            head = heads.get(execution.deployment_id)
+            if head is None or execution.created_at < head.created_at:
+                heads[execution.deployment_id] = execution
+        candidates = [
+            execution for deployment_id, execution in heads.iteritems()
+            if not busy.get(deployment_id) and
+            (max_per_blueprint is None or
+             running.per_blueprint.get(execution.blueprint_id, 0) <
+             max_per_blueprint) and
+            (execution.workflow_id not in max_per_workflow or
+             running.per_workflow.get(execution.workflow_id, 0) <
+             max_per_workflow[execution.workflow_id])]
+        candidates.sort(key=lambda e: (
+            running.per_blueprint.get(e.blueprint_id, 0), e.created_at))
+        for execution in candidates:
+            deployment_id = execution.deployment_id
+            if deployment_id not in busy:
+                busy[deployment_id] = self._busy(deployment_id)
+            if not busy[deployment_id]:
+                return execution
+        return None
+
+    def dispatch(self, deployment_id=None):
+        """
+        Starts the queued executions which may start once an execution of
+        the given deployment ended or has been queued: the deployment's
+        oldest queued execution, or (when manager wide limits apply) any
+        queued executions the limits allow. Without a deployment, the
+        oldest queued execution of every deployment with no execution in
+        progress is started (within the limits).
+
+        :return: the started executions.
+        """
+        busy = {}
+        if self.limited:
+            scope = None
+            running = self._running()
+            if self._at_capacity(running):
+                return []
+        else:
+            scope = deployment_id
+            running = _Running()
+            if deployment_id is not None:
+                busy[deployment_id] = self._busy(deployment_id)
+                if busy[deployment_id]:
+                    return []
+        queued = self._queued(scope)
+        started = []
+        while True:
+            execution = self._next(running, queued, busy)
+            if execution is None:
+                return started
+            queued.remove(execution)
+            if not self.sm.transition_execution_status(
+                    execution.id,
+                    models.Execution.QUEUED,
+                    models.Execution.PENDING):
+                # started or cancelled meanwhile, so the deployment is
+                # checked again
+                del busy[execution.deployment_id]
+                continue
+            current_app.logger.info(
+                'Starting execution {0} of deployment {1} after being queued '
+                'for {2:.1f} seconds'.format(
+                    execution.id, execution.deployment_id,
+                    execution_age(execution, datetime.now())))
+            if self._start(execution.id):
+                started.append(execution)
+                running.add(execution)
+                busy[execution.deployment_id] = True
+
+    def _start(self, execution_id):
+        execution = self.sm.get_execution(execution_id)
+        deployment = self.sm.get_deployment(execution.deployment_id,
+                                            include=['id', 'workflows'])
+        try:
+            workflow = deployment.workflows[execution.workflow_id]
+            # the parameters were validated when the execution was queued
+            execution_parameters = self.blueprints_manager.\
+                _merge_and_validate_execution_parameters(
+                    workflow, execution.workflow_id, execution.parameters,
+                    allow_custom_parameters=True)
+            workflow_client().execute_workflow(
+                execution.workflow_id,
+                workflow,
+                blueprint_id=execution.blueprint_id,
+                deployment_id=execution.deployment_id,
+                execution_id=execution.id,
+                execution_parameters=execution_parameters)
+        except Exception, e:
+            current_app.logger.exception(
+                'Failed starting queued execution {0}'.format(execution.id))
+            self.sm.update_execution_status(
+                execution.id, models.Execution.FAILED,
+                'Failed starting queued execution: {0}'.format(e))
+            return False
+        return True
+
+    def summary(self):
+        """
+        :return: the running and queued executions counts, per blueprint
+                 and per workflow, and the waiting times of the queued
+                 executions (in seconds).
+        """
+        running = self._running()
+        queued = self._queued()
+        now = datetime.now()
+        waits = [execution_age(execution, now) for execution in queued]
+        return {
+            'limits': _limits(),
+            'running': running.total,
+            'queued': len(queued),
+            'running_per_blueprint': running.per_blueprint,
+            'queued_per_blueprint': _count_by(queued, 'blueprint_id'),
+            'running_per_workflow': running.per_workflow,
+            'queued_per_workflow': _count_by(queued, 'workflow_id'),
+            'queued_deployments': len(set(e.deployment_id for e in queued)),
+            'max_wait': round(max(waits), 3) if waits else 0,
+            'mean_wait': round(sum(waits) / len(waits), 3) if waits else 0
+        }
@@ -0,0 +1,175 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Coalescing of execution status updates.
+
+Workflows report the status transitions of their executions through
+PATCH /executions/<id>, and each update is a storage write of its own
+(with elasticsearch, followed by an index refresh). When bursts of
+executions run, most of these writes are superseded within moments.
+
+With the execution_status_flush_interval configuration set (in seconds),
+non terminal status updates are buffered instead: a later update of an
+execution replaces its buffered one, and the buffered updates are written
+in bulk every flush interval (see update_executions_status of the storage
+managers), with a single refresh.
+
+Ordering is preserved: an execution's updates are applied in the order
+they were received, and terminal statuses (as well as other updates which
+must be written synchronously, e.g. cancelling an execution) discard the
+execution's buffered update and are written right away, after a flush in
+progress completes. The bulk write never moves an execution out of an end
+state, so a buffered update can not override a terminal status written
+meanwhile by another rest worker.
+
+Updates are buffered per process: executions read by the process which
+buffered their update reflect it (see overlay), while other processes may
+read a status up to a flush interval late.
+"""
+
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+
+from manager_rest import models
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionStatusWriter(object):
+
+    def __init__(self, storage_manager, flush_interval):
+        """
+        :param storage_manager: A function returning the storage manager
+                                to write with.
+        :param flush_interval: Seconds non terminal updates are buffered
+                               for (0 or None disables buffering).
+        """
+        self.storage_manager = storage_manager
+        self.flush_interval = flush_interval
+        self.coalesced = 0
+        self.flushes = 0
+        self._pending = OrderedDict()
+        # guards the buffered updates
+        self._lock = threading.Lock()
+        # serializes the writes, so a flush and a synchronous write of the
+        # same execution do not interleave
+        self._write_lock = threading.Lock()
+        self._flusher_pid = None
+
+    def update(self, execution_id, status, error):
+        """
+        Buffers a non terminal status update, or writes it right away.
+
+        :return: whether the update was buffered.
+        """
+        if not self.flush_interval or \
+                status in models.Execution.END_STATES:
+            self.write(execution_id, status, error)
+            return False
+        with self._lock:
+            if execution_id in self._pending:
+                self.coalesced += 1
+            self._pending[execution_id] = (status, error)
+            self._start_flusher()
+        return True
+
+    def write(self, execution_id, status, error):
+        """
+        Writes a status update right away, discarding the execution's
+        buffered update.
+        """
+        with self._write_lock:
+            with self._lock:
+                self._pending.pop(execution_id, None)
+            self.storage_manager().update_execution_status(
+                execution_id, status, error)
+
+    def overlay(self, execution):
+        """
+        Reflects the buffered update of the execution (as read from the
+        storage) in it, unless it has ended, so that the process which
+        received an update reads it back right away.
+
+        :return: the execution.
+        """
+        with self._lock:
+            pending = self._pending.get(execution.id)
+        if pending is None or \
+                execution.status in models.Execution.END_STATES:
+            return execution
+        status, error = pending
+        execution.status = status
+        if error is not None:
+            execution.error = error
+        return execution
+
+    def flush(self):
+        """
+        Writes the buffered updates in bulk.
+
+        :return: the number of updates written.
+        """
+        with self._write_lock:
+            with self._lock:
+                updates = [(execution_id, status, error)
+                           for execution_id, (status, error)
+                           in self._pending.iteritems()]
+                self._pending.clear()
+            if not updates:
+                return 0
+            try:
+                self.storage_manager().update_executions_status(updates)
+            except Exception:
+                # retried on the next flush, unless superseded meanwhile
+                with self._lock:
+                    for execution_id, status, error in updates:
+                        self._pending.setdefault(execution_id,
+                                                 (status, error))
+                raise
+            self.flushes += 1
+        return len(updates)
+
+    def _start_flusher(self):
+        # a forked worker does not inherit the flushing thread
+        if self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        flusher = threading.Thread(target=self._flush_periodically,
+                                   name='execution-status-flusher')
+        flusher.daemon = True
+        flusher.start()
+        # not losing the updates buffered when the worker exits
+        atexit.register(self._flush_at_exit)
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed writing buffered execution status '
+                                 'updates')
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Failed writing buffered execution status '
+                             'updates on exit')
@@ -15,380 +15,112 @@
 
 import os
 import json
-from manager_rest.models import (BlueprintState,
-                                 Deployment,
-                                 DeploymentModification,
-                                 Execution,
-                                 DeploymentNode,
-                                 DeploymentNodeInstance,
-                                 ProviderContext)
-from manager_rest import manager_exceptions
+
+from manager_rest import config
+from manager_rest.memory_storage_manager import (MemoryStorageManager,
+                                                 write_snapshot)
 
 STORAGE_FILE_PATH = '/tmp/manager-rest-tests-storage.json'
 
-NODES = 'nodes'
-NODE_INSTANCES = 'node_instances'
-BLUEPRINTS = 'blueprints'
-DEPLOYMENTS = 'deployments'
-DEPLOYMENT_MODIFICATIONS = 'deployment_modifications'
-EXECUTIONS = 'executions'
-PROVIDER_CONTEXT = 'provider_context'
-PROVIDER_CONTEXT_ID = '1'
+# journal size (in bytes) past which the journal is compacted into the
+# storage file
+JOURNAL_COMPACTION_THRESHOLD = 8 * 1024 * 1024
+
+PUT = 'put'
+DELETE = 'delete'
 
 
-class FileStorageManager(object):
+class FileStorageManager(MemoryStorageManager):
     """
-    file based storage manager for tests.
+    file based storage manager.
+
+    The state is kept in memory; every mutation is appended to a journal
+    file next to the storage file (and synced to disk), so it costs a
+    single small write rather than rewriting the entire storage. Once the
+    journal grows past the compaction threshold, the state is written to
+    the storage file and the journal is truncated. On startup, the storage
+    file is loaded and the journal is replayed on top of it.
     """
 
-    def __init__(self, storage_path):
+    def __init__(self, storage_path, recover=False,
+                 compaction_threshold=JOURNAL_COMPACTION_THRESHOLD):
         self._storage_path = storage_path
-        if os.path.isfile(storage_path):
-            os.remove(storage_path)
-
-    def _init_file(self):
-        data = {
-            NODES: {},
-            NODE_INSTANCES: {},
-            BLUEPRINTS: {},
-            DEPLOYMENTS: {},
-            DEPLOYMENT_MODIFICATIONS: {},
-            EXECUTIONS: {},
-            PROVIDER_CONTEXT: {},
-        }
-        self._dump_data(data)
-
-    def _load_data(self):
-        if not os.path.isfile(self._storage_path):
-            self._init_file()
-        with open(self._storage_path, 'r') as f:
-            data = json.load(f)
-            deserialized_data = dict()
-            deserialized_data[NODES] = \
-                {key: DeploymentNode(**val) for key, val in data[NODES]
-                    .iteritems()}
-            deserialized_data[NODE_INSTANCES] = \
-                {key: DeploymentNodeInstance(**val) for key, val in
-                 data[NODE_INSTANCES].iteritems()}
-            deserialized_data[BLUEPRINTS] = \
-                {key: BlueprintState(**val) for key, val in data[BLUEPRINTS]
-                    .iteritems()}
-            deserialized_data[DEPLOYMENTS] = \
-                {key: Deployment(**val) for key, val in data[DEPLOYMENTS]
-                    .iteritems()}
-            deserialized_data[EXECUTIONS] = \
-                {key: Execution(**val) for key, val in data[EXECUTIONS]
-                    .iteritems()}
-            deserialized_data[PROVIDER_CONTEXT] = \
-                {key: ProviderContext(**val)
-                 for key, val in data[PROVIDER_CONTEXT].iteritems()}
-            deserialized_data[DEPLOYMENT_MODIFICATIONS] = \
-                {key: DeploymentModification(**val) for key, val in
-                 data[DEPLOYMENT_MODIFICATIONS].iteritems()}
-
-            return deserialized_data
-
-    def _dump_data(self, data):
-        with open(self._storage_path, 'w') as f:
-            serialized_data = dict()
-            serialized_data[NODES] = {key: val.to_dict() for key, val in
-                                      data[NODES].iteritems()}
-            serialized_data[NODE_INSTANCES] = {
-                key: val.to_dict()
-                for key, val in data[NODE_INSTANCES].iteritems()}
-            serialized_data[BLUEPRINTS] =\
-                {key: val.to_dict() for key, val in data[BLUEPRINTS]
-                    .iteritems()}
-            serialized_data[DEPLOYMENTS] =\
-                {key: val.to_dict() for key, val in data[DEPLOYMENTS]
-                    .iteritems()}
-            serialized_data[EXECUTIONS] =\
-                {key: val.to_dict() for key, val in data[EXECUTIONS]
-                    .iteritems()}
-            serialized_data[PROVIDER_CONTEXT] = \
-                {key: val.to_dict() for key, val in data[PROVIDER_CONTEXT]
-                    .iteritems()}
-            serialized_data[DEPLOYMENT_MODIFICATIONS] = \
-                {key: val.to_dict() for key, val in data[
-                    DEPLOYMENT_MODIFICATIONS].iteritems()}
-            json.dump(serialized_data, f)
-
-    def node_instances_list(self, **_):
-        data = self._load_data()
-        return data[NODE_INSTANCES].values()
-
-    def get_node_instance(self, node_id, **_):
-        data = self._load_data()
-        if node_id in data[NODE_INSTANCES]:
-            return data[NODE_INSTANCES][node_id]
-        raise manager_exceptions.NotFoundError(
-            "Node {0} not found".format(node_id))
-
-    def get_node_instances(self, deployment_id, node_id=None, **_):
-        instances = [
-            x for x in self._load_data()[NODE_INSTANCES].values()
-            if not deployment_id or x.deployment_id == deployment_id]
-        instances = [
-            x for x in instances
-            if not node_id or x.node_id == node_id
-        ]
-        return instances
-
-    def get_nodes(self, deployment_id=None, **_):
-        nodes = [
-            x for x in self._load_data()[NODES].values()
-            if deployment_id is None or x.deployment_id == deployment_id
-        ]
-        return nodes
-
-    def get_node(self, deployment_id, node_id, **_):
-        data = self._load_data()
-        node_id = '{}_{}'.format(deployment_id, node_id)
-        if node_id in data[NODES]:
-            return data[NODES][node_id]
-        raise manager_exceptions.NotFoundError(
-            "Deployment {0} not found".format(deployment_id))
-
-    def put_node(self, node):
-        data = self._load_data()
-        node_id = '{0}_{1}'.format(node.deployment_id, node.id)
-        if str(node_id) in data[NODES]:
-            raise manager_exceptions.ConflictError(
-                'Node {0} already exists'.format(node_id))
-        data[NODES][str(node_id)] = node
-        self._dump_data(data)
-        return 1
-
-    def put_node_instance(self, node):
-        data = self._load_data()
-        node_id = node.id
-        if str(node_id) in data[NODE_INSTANCES]:
-            raise manager_exceptions.ConflictError(
-                'Node {0} already exists'.format(node_id))
-        data[NODE_INSTANCES][str(node_id)] = node
-        self._dump_data(data)
-        return 1
-
-    def update_execution_status(self, execution_id, status, error):
-        data = self._load_data()
-        if execution_id not in data[EXECUTIONS]:
-            raise manager_exceptions.NotFoundError(
-                "Execution {0} not found".format(execution_id))
-
-        execution = data[EXECUTIONS][execution_id]
-        execution.status = status
-        execution.error = error
-        data[EXECUTIONS][execution_id] = execution
-        self._dump_data(data)
-
-    def update_node(self, deployment_id, node_id,
-                    number_of_instances=None,
-                    planned_number_of_instances=None):
-        data = self._load_data()
-        storage_node_id = '{0}_{1}'.format(deployment_id, node_id)
-        if storage_node_id not in data[NODES]:
-            raise manager_exceptions.NotFoundError(
-                'Node {0} not found'.format(node_id))
-        node = data[NODES][storage_node_id]
-        if number_of_instances is not None:
-            node.number_of_instances = number_of_instances
-        if planned_number_of_instances is not None:
-            node.planned_number_of_instances = planned_number_of_instances
-        self._dump_data(data)
-
-    def update_node_instance(self, node_update):
-        data = self._load_data()
-        if node_update.id not in data[NODE_INSTANCES]:
-            raise manager_exceptions.NotFoundError(
-                "Node {0} not found".format(node_update.id))
-        node = data[NODE_INSTANCES][node_update.id]
-
-        if node_update.state is not None:
-            node.state = node_update.state
-        if node_update.runtime_properties is not None:
-            node.runtime_properties = node_update.runtime_properties
-        if node_update.relationships is not None:
-            node.relationships = node_update.relationships
-
-        data[NODE_INSTANCES][node.id] = node
-        self._dump_data(data)
-
-    def blueprints_list(self, **_):
-        data = self._load_data()
-        return data[BLUEPRINTS].values()
-
-    def deployments_list(self, **_):
-        data = self._load_data()
-        return data[DEPLOYMENTS].values()
-
-    def executions_list(self, deployment_id=None, **_):
-        executions = self._load_data()[EXECUTIONS].values()
-        if deployment_id:
-            executions = [
-                e for e in executions if e.deployment_id == deployment_id]
-        return executions
-
-    def get_blueprint_deployments(self, blueprint_id, **_):
-        deployments = self.deployments_list()
-        return [deployment for deployment in deployments
-                if deployment.blueprint_id == blueprint_id]
-
-    def get_blueprint(self, blueprint_id, include=None):
-        data = self._load_data()
-        if blueprint_id in data[BLUEPRINTS]:
-            bp = data[BLUEPRINTS][blueprint_id]
-            if include:
-                for field in BlueprintState.fields:
-                    if field not in include:
-                        setattr(bp, field, None)
-            return bp
-        raise manager_exceptions.NotFoundError(
-            "Blueprint {0} not found".format(blueprint_id))
-
-    def get_deployment(self, deployment_id, include=None):
-        data = self._load_data()
-        if deployment_id in data[DEPLOYMENTS]:
-            dep = data[DEPLOYMENTS][deployment_id]
-            if include:
-                for field in Deployment.fields:
-                    if field not in include:
-                        setattr(dep, field, None)
-            return dep
-        raise manager_exceptions.NotFoundError(
-            "Deployment {0} not found".format(deployment_id))
-
-    def get_execution(self, execution_id, **_):
-        data = self._load_data()
-        if execution_id in data[EXECUTIONS]:
-            return data[EXECUTIONS][execution_id]
-        raise manager_exceptions.NotFoundError(
-            "Execution {0} not found".format(execution_id))
-
-    def put_blueprint(self, blueprint_id, blueprint):
-        data = self._load_data()
-        if str(blueprint_id) in data[BLUEPRINTS]:
-            raise manager_exceptions.ConflictError(
-                'Blueprint {0} already exists'.format(blueprint_id))
-        data[BLUEPRINTS][str(blueprint_id)] = blueprint
-        self._dump_data(data)
-
-    def put_deployment(self, deployment_id, deployment):
-        data = self._load_data()
-        if str(deployment_id) in data[DEPLOYMENTS]:
-            raise manager_exceptions.ConflictError(
-                'Deployment {0} already exists'.format(deployment_id))
-        data[DEPLOYMENTS][str(deployment_id)] = deployment
-        self._dump_data(data)
-
-    def put_execution(self, execution_id, execution):
-        data = self._load_data()
-        if str(execution_id) in data[EXECUTIONS]:
-            raise manager_exceptions.ConflictError(
-                'Execution {0} already exists'.format(execution_id))
-        data[EXECUTIONS][str(execution_id)] = execution
-        self._dump_data(data)
-
-    def delete_blueprint(self, blueprint_id):
-        return self._delete_object(blueprint_id, BLUEPRINTS, 'Blueprint')
-
-    def delete_deployment(self, deployment_id):
-        data = self._load_data()
-        for instance in data[NODE_INSTANCES].values():
-            if instance.deployment_id == deployment_id:
-                del data[NODE_INSTANCES][instance.id]
-        for node in data[NODES].values():
-            if node.deployment_id == deployment_id:
-                node_id = '{0}_{1}'.format(deployment_id, node.id)
-                del data[NODES][node_id]
-        for execution in data[EXECUTIONS].values():
-            if execution.deployment_id == deployment_id:
-                del data[EXECUTIONS][execution.id]
-        for modification in data[DEPLOYMENT_MODIFICATIONS].values():
-            if modification.deployment_id == deployment_id:
-                del data[DEPLOYMENT_MODIFICATIONS][modification.id]
-        self._dump_data(data)
-        return self._delete_object(deployment_id, DEPLOYMENTS, 'Deployment')
-
-    def delete_execution(self, execution_id):
-        return self._delete_object(execution_id, EXECUTIONS, 'Execution')
-
-    def delete_node(self, node_id):
-        return self._delete_object(node_id, NODES, 'Node')
-
-    def delete_node_instance(self, node_instance_id):
-        return self._delete_object(node_instance_id, NODE_INSTANCES, 'Node')
-
-    def _delete_object(self, object_id, object_type, object_type_name):
-        data = self._load_data()
-        if object_id in data[object_type]:
-            obj = data[object_type][object_id]
-            del(data[object_type][object_id])
-            self._dump_data(data)
-            return obj
-        raise manager_exceptions.NotFoundError(
-            "{0} {1} not found".format(object_type_name, object_id))
-
-    def put_provider_context(self, provider_context):
-        data = self._load_data()
-        if PROVIDER_CONTEXT_ID in data[PROVIDER_CONTEXT]:
-            raise manager_exceptions.ConflictError(
-                'Provider context already set')
-        data[PROVIDER_CONTEXT][PROVIDER_CONTEXT_ID] = provider_context
-        self._dump_data(data)
-
-    def update_provider_context(self, provider_context):
-        data = self._load_data()
-        if PROVIDER_CONTEXT_ID not in data[PROVIDER_CONTEXT]:
-            raise manager_exceptions.NotFoundError('Provider Context not '
-                                                   'found')
-        data[PROVIDER_CONTEXT][PROVIDER_CONTEXT_ID] = provider_context
-        self._dump_data(data)
-
-    def get_provider_context(self, **_):
-        data = self._load_data()
-        if PROVIDER_CONTEXT_ID in data[PROVIDER_CONTEXT]:
-            return data[PROVIDER_CONTEXT][PROVIDER_CONTEXT_ID]
-        raise manager_exceptions.NotFoundError(
-            "Provider context not set")
-
-    def put_deployment_modification(self, modification_id, modification):
-        data = self._load_data()
-        if str(modification_id) in data[DEPLOYMENT_MODIFICATIONS]:
-            raise manager_exceptions.ConflictError(
-                'Deployment modification {0} already exists'
-                .format(modification_id))
-        data[DEPLOYMENT_MODIFICATIONS][str(modification_id)] = modification
-        self._dump_data(data)
-
-    def get_deployment_modification(self, modification_id, include=None):
-        data = self._load_data()
-        if modification_id in data[DEPLOYMENT_MODIFICATIONS]:
-            return data[DEPLOYMENT_MODIFICATIONS][modification_id]
-        raise manager_exceptions.NotFoundError(
-            "Deployment modification {0} not found".format(modification_id))
-
-    def update_deployment_modification(self, modification):
-        modification_id = modification.id
-        data = self._load_data()
-        if modification_id not in data[DEPLOYMENT_MODIFICATIONS]:
-            raise manager_exceptions.NotFoundError(
-                'Deployment modification {0} not found'
-                .format(modification_id))
-        updated_modification = data[DEPLOYMENT_MODIFICATIONS][modification_id]
-        if modification.status is not None:
-            updated_modification.status = modification.status
-        if modification.ended_at is not None:
-            updated_modification.ended_at = modification.ended_at
-        if modification.node_instances is not None:
-            updated_modification.node_instances = modification.node_instances
-        self._dump_data(data)
-
-    def deployment_modifications_list(self, deployment_id=None, include=None):
-        return [
-            x for x in self._load_data()[DEPLOYMENT_MODIFICATIONS].values()
-            if deployment_id is None or x.deployment_id == deployment_id
-        ]
+        self._journal_path = '{0}.journal'.format(storage_path)
+        self._compaction_threshold = compaction_threshold
+        self._journal = None
+        if not recover:
+            for path in (self._storage_path, self._journal_path):
+                if os.path.isfile(path):
+                    os.remove(path)
+        super(FileStorageManager, self).__init__(snapshot_path=storage_path)
+        self._replay_journal()
+        self._journal = open(self._journal_path, 'a')
+
+    def _replay_journal(self):
+        if not os.path.isfile(self._journal_path):
+            return
+        with open(self._journal_path, 'r+') as f:
+            intact_size = 0
+            for line in iter(f.readline, ''):
+                try:
+                    if not line.endswith('\n'):
+                        raise ValueError('Missing end of line')
+                    entry = json.loads(line)
+                except ValueError:
+                    # a partially written last entry (e.g. the process
+                    # crashed mid-write); everything before it is intact
+                    break
+                intact_size += len(line)
+                storage_type, doc_id = entry['type'], entry['id']
+                if entry['op'] == PUT:
+                    self._store(storage_type, doc_id, entry['doc'])
+                elif doc_id in self._data[storage_type]:
+                    self._remove(storage_type, doc_id)
+            # the partial entry is dropped, so that the entries appended
+            # next are not joined to it
+            f.truncate(intact_size)
+
+    def _append(self, entry):
+        if self._journal is None:
+            return
+        self._journal.write(json.dumps(entry) + '\n')
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        if self._journal.tell() >= self._compaction_threshold:
+            self.compact()
+
+    def _store(self, storage_type, doc_id, doc):
+        super(FileStorageManager, self)._store(storage_type, doc_id, doc)
+        self._append({'op': PUT, 'type': storage_type, 'id': doc_id,
+                      'doc': doc})
+
+    def _remove(self, storage_type, doc_id):
+        doc = super(FileStorageManager, self)._remove(storage_type, doc_id)
+        self._append({'op': DELETE, 'type': storage_type, 'id': doc_id})
+        return doc
+
+    def compact(self):
+        """
+        Writes the current state to the storage file and truncates the
+        journal.
+        """
+        with self._lock:
+            write_snapshot(self._storage_path, self._dump_data())
+            self._journal.seek(0)
+            self._journal.truncate()
+            self._dirty = False
+
+    def close(self):
+        with self._lock:
+            if self._journal is None:
+                return
+            self.compact()
+            self._journal.close()
+            self._journal = None
 
 
 def create():
+    storage_path = config.instance().file_storage_path
+    if storage_path:
+        return FileStorageManager(storage_path, recover=True)
     return FileStorageManager(STORAGE_FILE_PATH)
@@ -0,0 +1,63 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Gunicorn configuration for serving the rest service with pre-forked,
+preloaded workers (see manager_rest.prefork).
+
+Usage example (from the manager_rest directory):
+
+    MANAGER_REST_CONFIG_PATH=/etc/manager-rest.yaml \\
+        gunicorn -c gunicorn_config.py server:app
+
+Command line options (e.g. -w, -b) override the settings below; the
+number of workers defaults to MANAGER_REST_WORKERS, or to twice the number
+of cores plus one.
+
+Setting MANAGER_REST_WORKER_CLASS=gevent serves the rest service in
+cooperative mode (requires the 'gevent' extra): the standard library is
+monkey patched before the application is loaded, so that every request
+runs in a greenlet and waiting on elasticsearch, on the broker or on a
+blueprint download yields to the other requests of the worker, rather
+than blocking it. Each worker then serves up to MANAGER_REST_WORKER_CONNECTIONS
+concurrent requests, so fewer workers are needed. The sqlite storage
+manager does its I/O in C code, which is not cooperative; cooperative
+mode is meant for the elasticsearch storage manager.
+"""
+
+import os
+import multiprocessing
+
+worker_class = os.environ.get('MANAGER_REST_WORKER_CLASS', 'sync')
+if worker_class == 'gevent':
+    # the application is preloaded by the master, so it has to be patched
+    # before anything imports socket, threading etc.
+    from gevent import monkey
+    monkey.patch_all()
+worker_connections = int(os.environ.get('MANAGER_REST_WORKER_CONNECTIONS',
+                                        1000))
+
+bind = os.environ.get('MANAGER_REST_BIND', '0.0.0.0:8100')
+workers = int(os.environ.get('MANAGER_REST_WORKERS',
+                             multiprocessing.cpu_count() * 2 + 1))
+timeout = 300
+
+# the application is imported and set up once, in the master
+preload_app = True
+
+
+def post_fork(server, worker):
+    from manager_rest import prefork
+    prefork.init_worker()
@@ -267,3 +267,17 @@ class UnknownModificationStageError(ManagerException):
             *args,
             **kwargs
         )
+
+
+class TooManyRequestsError(ManagerException):
+    ERROR_CODE = 'too_many_requests_error'
+
+    def __init__(self, retry_after, *args, **kwargs):
+        super(TooManyRequestsError, self).__init__(
+            429,
+            TooManyRequestsError.ERROR_CODE,
+            *args,
+            **kwargs
+        )
+        # seconds after which the request may be retried
+        self.retry_after = retry_after
@@ -0,0 +1,583 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import json
+import tempfile
+import threading
+import contextlib
+from collections import OrderedDict
+
+from manager_rest import config
+from manager_rest import manager_exceptions
+from manager_rest.models import (LazyJson,
+                                 BlueprintState,
+                                 Deployment,
+                                 DeploymentModification,
+                                 Execution,
+                                 DeploymentNode,
+                                 DeploymentNodeInstance,
+                                 ProviderContext)
+
+NODES = 'nodes'
+NODE_INSTANCES = 'node_instances'
+BLUEPRINTS = 'blueprints'
+DEPLOYMENTS = 'deployments'
+DEPLOYMENT_MODIFICATIONS = 'deployment_modifications'
+EXECUTIONS = 'executions'
+PROVIDER_CONTEXT = 'provider_context'
+PROVIDER_CONTEXT_ID = '1'
+
+MODELS = {
+    NODES: DeploymentNode,
+    NODE_INSTANCES: DeploymentNodeInstance,
+    BLUEPRINTS: BlueprintState,
+    DEPLOYMENTS: Deployment,
+    DEPLOYMENT_MODIFICATIONS: DeploymentModification,
+    EXECUTIONS: Execution,
+    PROVIDER_CONTEXT: ProviderContext
+}
+
+TYPE_NAMES = {
+    NODES: 'Node',
+    NODE_INSTANCES: 'Node instance',
+    BLUEPRINTS: 'Blueprint',
+    DEPLOYMENTS: 'Deployment',
+    DEPLOYMENT_MODIFICATIONS: 'Deployment modification',
+    EXECUTIONS: 'Execution',
+    PROVIDER_CONTEXT: 'Provider context'
+}
+
+# secondary indexes maintained for each storage type
+INDEXED_FIELDS = {
+    NODES: ('deployment_id',),
+    NODE_INSTANCES: ('deployment_id', 'node_id', 'state'),
+    DEPLOYMENTS: ('blueprint_id',),
+    DEPLOYMENT_MODIFICATIONS: ('deployment_id', 'status'),
+    EXECUTIONS: ('deployment_id', 'blueprint_id', 'status'),
+}
+
+
+class MemoryStorageManager(object):
+    """
+    In-memory storage manager.
+
+    Documents are kept as serialized json, keyed by their storage id, so
+    that callers never share (and accidentally mutate) stored state. Lazy
+    model fields are decoded only when they are accessed.
+    Secondary indexes are kept for the fields which are used for lookups.
+    The storage may optionally be snapshotted to a file periodically and
+    is loaded from that file on creation.
+    """
+
+    def __init__(self, snapshot_path=None, snapshot_interval=None):
+        self._lock = threading.RLock()
+        self._data = {}
+        self._indexes = {}
+        self._dirty = False
+        self._snapshot_path = snapshot_path
+        self._init_data()
+        if snapshot_path and os.path.isfile(snapshot_path):
+            with open(snapshot_path) as f:
+                self._load_data(json.load(f))
+        self._snapshot_stop = threading.Event()
+        if snapshot_path and snapshot_interval:
+            snapshot_thread = threading.Thread(target=self._snapshot_loop,
+                                               args=(snapshot_interval,))
+            snapshot_thread.daemon = True
+            snapshot_thread.start()
+
+    def _init_data(self):
+        self._data = {storage_type: OrderedDict() for storage_type in MODELS}
+        self._indexes = {
+            storage_type: {field: {} for field in fields}
+            for storage_type, fields in INDEXED_FIELDS.iteritems()}
+
+    def _load_data(self, data):
+        for storage_type, docs in data.iteritems():
+            for doc_id, doc in docs.iteritems():
+                self._store(storage_type, doc_id, doc)
+
+    def _dump_data(self):
+        return {storage_type: {doc_id: self._decode(storage_type, raw)
+                               for doc_id, raw in docs.iteritems()}
+                for storage_type, docs in self._data.iteritems()}
+
+    @staticmethod
+    def _encode(storage_type, doc):
+        # lazy fields are encoded separately from the rest of the document,
+        # so they are only decoded when accessed (and until then, share the
+        # stored string)
+        lazy_fields = MODELS[storage_type].lazy_fields
+        doc = dict(doc)
+        lazy = {field: json.dumps(doc.pop(field, None))
+                for field in lazy_fields}
+        return json.dumps(doc), lazy
+
+    @staticmethod
+    def _decode(storage_type, raw, lazy=False):
+        encoded_doc, encoded_lazy = raw
+        doc = json.loads(encoded_doc)
+        for field, encoded in encoded_lazy.iteritems():
+            doc[field] = LazyJson(encoded) if lazy else json.loads(encoded)
+        return doc
+
+    def snapshot(self, path=None):
+        """
+        Writes the entire storage to the given path (or to the configured
+        snapshot path) atomically.
+        """
+        path = path or self._snapshot_path
+        with self._lock:
+            data = self._dump_data()
+            self._dirty = False
+        write_snapshot(path, data)
+
+    def close(self):
+        self._snapshot_stop.set()
+        if self._snapshot_path and self._dirty:
+            self.snapshot()
+
+    def _snapshot_loop(self, interval):
+        while not self._snapshot_stop.wait(interval):
+            if self._dirty:
+                self.snapshot()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Runs the enclosed storage operations without interleaving
+        operations of other threads.
+        """
+        with self._lock:
+            yield
+
+    def _index_add(self, storage_type, doc_id, doc):
+        for field, index in self._indexes.get(storage_type, {}).iteritems():
+            index.setdefault(doc.get(field), OrderedDict())[doc_id] = True
+
+    def _index_remove(self, storage_type, doc_id, doc):
+        for field, index in self._indexes.get(storage_type, {}).iteritems():
+            ids = index.get(doc.get(field))
+            if ids is not None:
+                ids.pop(doc_id, None)
+                if not ids:
+                    del index[doc.get(field)]
+
+    def _store(self, storage_type, doc_id, doc):
+        previous = self._data[storage_type].get(doc_id)
+        if previous is not None:
+            self._index_remove(storage_type, doc_id, json.loads(previous[0]))
+        self._data[storage_type][doc_id] = self._encode(storage_type, doc)
+        self._index_add(storage_type, doc_id, doc)
+        self._dirty = True
+
+    def _remove(self, storage_type, doc_id):
+        raw = self._data[storage_type].pop(doc_id)
+        doc = self._decode(storage_type, raw, lazy=True)
+        self._index_remove(storage_type, doc_id, doc)
+        self._dirty = True
+        return doc
+
+    @staticmethod
+    def _deserialize(storage_type, doc, include=None):
+        model_class = MODELS[storage_type]
+        if include:
+            doc = {field: doc.get(field) if field in include else None
+                   for field in model_class.fields}
+        return model_class(**doc)
+
+    def _get(self, storage_type, doc_id, include=None):
+        with self._lock:
+            raw = self._data[storage_type].get(doc_id)
+        if raw is None:
+            raise manager_exceptions.NotFoundError(
+                '{0} {1} not found'.format(TYPE_NAMES[storage_type], doc_id))
+        return self._deserialize(storage_type,
+                                 self._decode(storage_type, raw, lazy=True),
+                                 include)
+
+    def _get_doc(self, storage_type, doc_id):
+        raw = self._data[storage_type].get(doc_id)
+        if raw is None:
+            raise manager_exceptions.NotFoundError(
+                '{0} {1} not found'.format(TYPE_NAMES[storage_type], doc_id))
+        return self._decode(storage_type, raw)
+
+    def _matching_ids(self, storage_type, filters):
+        """
+        :return: the ids of the documents matching the (indexed field)
+                 filters. Must be called holding the lock.
+        """
+        filters = {field: value for field, value in filters.iteritems()
+                   if value is not None}
+        if not filters:
+            return self._data[storage_type].keys()
+        indexes = self._indexes[storage_type]
+        matching = [indexes[field].get(value, {})
+                    for field, value in filters.iteritems()]
+        matching.sort(key=len)
+        return [doc_id for doc_id in matching[0]
+                if all(doc_id in ids for ids in matching[1:])]
+
+    def _matching(self, storage_type, filters):
+        """
+        :return: the raw documents matching the (indexed field) filters.
+                 Must be called holding the lock.
+        """
+        docs = self._data[storage_type]
+        return [docs[doc_id]
+                for doc_id in self._matching_ids(storage_type, filters)]
+
+    def _list(self, storage_type, include=None, **filters):
+        with self._lock:
+            raws = self._matching(storage_type, filters)
+        return [self._deserialize(storage_type,
+                                  self._decode(storage_type, raw, lazy=True),
+                                  include)
+                for raw in raws]
+
+    def _summarize(self, storage_type, group_by, **filters):
+        with self._lock:
+            indexes = self._indexes.get(storage_type, {})
+            if len(group_by) == 1 and group_by[0] in indexes and \
+                    not any(value is not None
+                            for value in filters.itervalues()):
+                # counted off the index, without touching the documents
+                counts = [((value,), len(ids)) for value, ids in
+                          indexes[group_by[0]].iteritems()]
+            else:
+                counts = {}
+                for raw in self._matching(storage_type, filters):
+                    # group by fields are never lazy fields, so only the
+                    # light part of the document is decoded
+                    doc = json.loads(raw[0])
+                    key = tuple(doc.get(field) for field in group_by)
+                    counts[key] = counts.get(key, 0) + 1
+                counts = counts.items()
+        # as with elasticsearch terms aggregations, documents missing a
+        # field are not counted
+        return [dict(zip(group_by, values), count=count)
+                for values, count in counts if None not in values]
+
+    def _count(self, storage_type, ids_limit=0, exclude=None, **filters):
+        # resolved entirely off the indexes, no document is decoded
+        with self._lock:
+            indexes = self._indexes[storage_type]
+            excluded = [indexes[field].get(value, {})
+                        for field, values in (exclude or {}).iteritems()
+                        for value in values]
+            ids = [doc_id
+                   for doc_id in self._matching_ids(storage_type, filters)
+                   if not any(doc_id in excluded_ids
+                              for excluded_ids in excluded)]
+        return len(ids), ids[:ids_limit]
+
+    def _put(self, storage_type, doc_id, obj):
+        doc_id = str(doc_id)
+        with self._lock:
+            if doc_id in self._data[storage_type]:
+                raise manager_exceptions.ConflictError(
+                    '{0} {1} already exists'.format(
+                        TYPE_NAMES[storage_type], doc_id))
+            self._store(storage_type, doc_id, obj.to_dict())
+
+    def _update(self, storage_type, doc_id, **fields):
+        with self._lock:
+            doc = self._get_doc(storage_type, doc_id)
+            doc.update((field, value) for field, value in fields.iteritems()
+                       if value is not None)
+            self._store(storage_type, doc_id, doc)
+
+    def _delete(self, storage_type, doc_id):
+        with self._lock:
+            if doc_id not in self._data[storage_type]:
+                raise manager_exceptions.NotFoundError(
+                    '{0} {1} not found'.format(TYPE_NAMES[storage_type],
+                                               doc_id))
+            return self._deserialize(storage_type,
+                                     self._remove(storage_type, doc_id))
+
+    def node_instances_list(self, include=None):
+        return self._list(NODE_INSTANCES, include=include)
+
+    def get_node_instance(self, node_instance_id, include=None):
+        return self._get(NODE_INSTANCES, node_instance_id, include)
+
+    def get_node_instances(self, deployment_id, node_id=None, include=None):
+        return self._list(NODE_INSTANCES, include=include,
+                          deployment_id=deployment_id,
+                          node_id=node_id)
+
+    def get_nodes(self, deployment_id=None, include=None):
+        return self._list(NODES, include=include,
+                          deployment_id=deployment_id)
+
+    def get_node(self, deployment_id, node_id, include=None):
+        return self._get(NODES,
+                         self._storage_node_id(deployment_id, node_id),
+                         include)
+
+    def put_node(self, node):
+        self._put(NODES,
+                  self._storage_node_id(node.deployment_id, node.id),
+                  node)
+        return 1
+
+    def put_node_instance(self, node_instance):
+        self._put(NODE_INSTANCES, node_instance.id, node_instance)
+        return 1
+
+    def update_execution_status(self, execution_id, status, error):
+        with self._lock:
+            self._update(EXECUTIONS, execution_id, status=status,
+                         error=error)
+            execution = json.loads(self._data[EXECUTIONS][execution_id][0])
+            deployment_id = execution['deployment_id']
+            if execution['workflow_id'] == \
+                    Execution.CREATE_DEPLOYMENT_ENVIRONMENT and \
+                    deployment_id in self._data[DEPLOYMENTS]:
+                self._update(DEPLOYMENTS, deployment_id,
+                             environment_status=status,
+                             environment_error=error)
+
+    def update_executions_status(self, updates):
+        with self._lock:
+            for execution_id, status, error in updates:
+                execution = self._data[EXECUTIONS].get(execution_id)
+                if execution is not None and json.loads(execution[0])[
+                        'status'] not in Execution.END_STATES:
+                    self.update_execution_status(execution_id, status, error)
+
+    def transition_execution_status(self, execution_id, from_status,
+                                    to_status):
+        with self._lock:
+            if self._get_doc(EXECUTIONS, execution_id)['status'] != \
+                    from_status:
+                return False
+            self._update(EXECUTIONS, execution_id, status=to_status)
+            return True
+
+    def update_node(self, deployment_id, node_id,
+                    number_of_instances=None,
+                    planned_number_of_instances=None):
+        self._update(NODES,
+                     self._storage_node_id(deployment_id, node_id),
+                     number_of_instances=number_of_instances,
+                     planned_number_of_instances=planned_number_of_instances)
+
+    def update_node_instance(self, node):
+        self._update(NODE_INSTANCES, node.id,
+                     state=node.state,
+                     runtime_properties=node.runtime_properties,
+                     relationships=node.relationships)
+
+    def node_instances_summary(self, group_by, deployment_id=None):
+        return self._summarize(NODE_INSTANCES, group_by,
+                               deployment_id=deployment_id)
+
+    def executions_summary(self, group_by, deployment_id=None):
+        return self._summarize(EXECUTIONS, group_by,
+                               deployment_id=deployment_id)
+
+    def node_instances_count(self, deployment_id=None,
+                             exclude_states=None, ids_limit=0):
+        return self._count(NODE_INSTANCES, ids_limit,
+                           exclude={'state': exclude_states or ()},
+                           deployment_id=deployment_id)
+
+    def executions_count(self, deployment_id=None, status=None,
+                         exclude_statuses=None, ids_limit=0):
+        return self._count(EXECUTIONS, ids_limit,
+                           exclude={'status': exclude_statuses or ()},
+                           deployment_id=deployment_id,
+                           status=status)
+
+    def deployments_count(self, blueprint_id=None, ids_limit=0):
+        return self._count(DEPLOYMENTS, ids_limit,
+                           blueprint_id=blueprint_id)
+
+    def deployment_modifications_count(self, deployment_id=None,
+                                       status=None, ids_limit=0):
+        return self._count(DEPLOYMENT_MODIFICATIONS, ids_limit,
+                           deployment_id=deployment_id,
+                           status=status)
+
+    def blueprints_list(self, include=None):
+        return self._list(BLUEPRINTS, include=include)
+
+    def deployments_list(self, include=None):
+        return self._list(DEPLOYMENTS, include=include)
+
+    def executions_list(self, deployment_id=None, include=None,
+                        status=None):
+        return self._list(EXECUTIONS, include=include,
+                          deployment_id=deployment_id,
+                          status=status)
+
+    def get_blueprint_deployments(self, blueprint_id, include=None):
+        return self._list(DEPLOYMENTS, include=include,
+                          blueprint_id=blueprint_id)
+
+    def get_blueprint(self, blueprint_id, include=None):
+        return self._get(BLUEPRINTS, blueprint_id, include)
+
+    def get_deployment(self, deployment_id, include=None):
+        return self._get(DEPLOYMENTS, deployment_id, include)
+
+    def get_execution(self, execution_id, include=None):
+        return self._get(EXECUTIONS, execution_id, include)
+
+    def put_blueprint(self, blueprint_id, blueprint):
+        self._put(BLUEPRINTS, blueprint_id, blueprint)
+
+    def put_deployment(self, deployment_id, deployment):
+        self._put(DEPLOYMENTS, deployment_id, deployment)
+
+    def put_execution(self, execution_id, execution):
+        self._put(EXECUTIONS, execution_id, execution)
+
+    def delete_blueprint(self, blueprint_id):
+        return self._delete(BLUEPRINTS, blueprint_id)
+
+    def delete_deployment(self, deployment_id):
+        with self._lock:
+            # verify the deployment exists before deleting its dependents
+            self._get_doc(DEPLOYMENTS, deployment_id)
+            for storage_type in (NODE_INSTANCES, NODES, EXECUTIONS,
+                                 DEPLOYMENT_MODIFICATIONS):
+                index = self._indexes[storage_type]['deployment_id']
+                for doc_id in index.get(deployment_id, {}).keys():
+                    self._remove(storage_type, doc_id)
+            return self._delete(DEPLOYMENTS, deployment_id)
+
+    def delete_execution(self, execution_id):
+        return self._delete(EXECUTIONS, execution_id)
+
+    def delete_node(self, node_id):
+        return self._delete(NODES, node_id)
+
+    def delete_node_instance(self, node_instance_id):
+        return self._delete(NODE_INSTANCES, node_instance_id)
+
+    def put_provider_context(self, provider_context):
+        with self._lock:
+            if PROVIDER_CONTEXT_ID in self._data[PROVIDER_CONTEXT]:
+                raise manager_exceptions.ConflictError(
+                    'Provider context already set')
+            self._store(PROVIDER_CONTEXT, PROVIDER_CONTEXT_ID,
+                        provider_context.to_dict())
+
+    def update_provider_context(self, provider_context):
+        with self._lock:
+            if PROVIDER_CONTEXT_ID not in self._data[PROVIDER_CONTEXT]:
+                raise manager_exceptions.NotFoundError(
+                    'Provider Context not found')
+            self._store(PROVIDER_CONTEXT, PROVIDER_CONTEXT_ID,
+                        provider_context.to_dict())
+
+    def get_provider_context(self, include=None):
+        with self._lock:
+            if PROVIDER_CONTEXT_ID not in self._data[PROVIDER_CONTEXT]:
+                raise manager_exceptions.NotFoundError(
+                    'Provider context not set')
+        return self._get(PROVIDER_CONTEXT, PROVIDER_CONTEXT_ID, include)
+
+    def put_deployment_modification(self, modification_id, modification):
+        self._put(DEPLOYMENT_MODIFICATIONS, modification_id, modification)
+
+    def get_deployment_modification(self, modification_id, include=None):
+        return self._get(DEPLOYMENT_MODIFICATIONS, modification_id, include)
+
+    def update_deployment_modification(self, modification):
+        self._update(DEPLOYMENT_MODIFICATIONS, modification.id,
+                     status=modification.status,
+                     ended_at=modification.ended_at,
+                     node_instances=modification.node_instances)
+
+    def deployment_modifications_list(self, deployment_id=None, include=None):
+        return self._list(DEPLOYMENT_MODIFICATIONS, include=include,
+                          deployment_id=deployment_id)
+
+    @staticmethod
+    def _storage_node_id(deployment_id, node_id):
+        return '{0}_{1}'.format(deployment_id, node_id)
+
+    def export_docs(self, storage_type, batch_size):
+        """
+        :return: an iterator over the documents (dicts) of the storage type,
+                 in batches (lists) of up to batch_size documents.
+        """
+        with self._lock:
+            raw_docs = self._data[storage_type].values()
+        for start in xrange(0, len(raw_docs), batch_size):
+            yield [self._decode(storage_type, raw)
+                   for raw in raw_docs[start:start + batch_size]]
+
+    def import_docs(self, storage_type, docs):
+        """
+        Stores exported documents of the storage type, which must not
+        exist yet.
+        """
+        doc_ids = [storage_doc_id(storage_type, doc) for doc in docs]
+        with self._lock:
+            existing = [doc_id for doc_id in doc_ids
+                        if doc_id in self._data[storage_type]]
+            if existing:
+                raise manager_exceptions.ConflictError(
+                    '{0}s already exist: {1}'.format(
+                        TYPE_NAMES[storage_type], ', '.join(existing[:10])))
+            for doc_id, doc in zip(doc_ids, docs):
+                self._store(storage_type, doc_id, doc)
+
+    def delete_docs(self, storage_type, docs):
+        """
+        Deletes the documents of the storage type with the ids of the given
+        documents (e.g. imported ones), skipping missing ones.
+        """
+        with self._lock:
+            for doc in docs:
+                doc_id = storage_doc_id(storage_type, doc)
+                if doc_id in self._data[storage_type]:
+                    self._remove(storage_type, doc_id)
+
+    def refresh(self):
+        # stored documents are visible right away
+        pass
+
+
+def storage_doc_id(storage_type, doc):
+    """
+    :return: the storage id of a document of the storage type.
+    """
+    if storage_type == NODES:
+        return MemoryStorageManager._storage_node_id(doc['deployment_id'],
+                                                     doc['id'])
+    if storage_type == PROVIDER_CONTEXT:
+        return PROVIDER_CONTEXT_ID
+    return str(doc['id'])
+
+
+def write_snapshot(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.rename(tmp_path, path)
+
+
+def create():
+    return MemoryStorageManager(
+        snapshot_path=config.instance().memory_storage_snapshot_path,
+        snapshot_interval=config.instance().memory_storage_snapshot_interval)
@@ -16,8 +16,46 @@
 import json
 
 
+class LazyJson(object):
+    """
+    Raw json of a field value which has not been decoded yet.
+    """
+
+    __slots__ = ('raw',)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+
+class LazyField(object):
+    """
+    Descriptor for a (potentially large) field which may be assigned a
+    LazyJson value by the storage; the json is decoded on first access.
+    """
+
+    def __init__(self, slot):
+        self.slot = slot
+
+    def __get__(self, obj, owner):
+        if obj is None:
+            return self
+        value = getattr(obj, self.slot)
+        if isinstance(value, LazyJson):
+            value = json.loads(value.raw)
+            setattr(obj, self.slot, value)
+        return value
+
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, value)
+
+
 class SerializableObject(object):
 
+    __slots__ = ()
+
+    # fields which storage backends may provide as LazyJson
+    lazy_fields = frozenset()
+
     def to_dict(self):
         # attr_and_values = ((attr, getattr(self, attr)) for attr in dir(self)
         #                    if not attr.startswith("__"))
@@ -33,6 +71,10 @@ class BlueprintState(SerializableObject):
 
     fields = {'plan', 'id', 'created_at', 'updated_at'}
 
+    __slots__ = ('id', 'created_at', 'updated_at', '_plan')
+    lazy_fields = frozenset(['plan'])
+    plan = LazyField('_plan')
+
     def __init__(self, **kwargs):
         self.plan = kwargs['plan']
         self.id = kwargs['id']
@@ -44,7 +86,15 @@ class Deployment(SerializableObject):
 
     fields = {'id', 'created_at', 'updated_at', 'blueprint_id',
               'workflows', 'permalink', 'inputs', 'policy_types',
-              'policy_triggers', 'groups', 'outputs'}
+              'policy_triggers', 'groups', 'outputs', 'environment_status',
+              'environment_error'}
+
+    __slots__ = ('id', 'created_at', 'updated_at', 'blueprint_id', 'inputs',
+                 'policy_types', 'policy_triggers', 'groups', 'outputs',
+                 'permalink', 'environment_status', 'environment_error',
+                 '_workflows')
+    lazy_fields = frozenset(['workflows'])
+    workflows = LazyField('_workflows')
 
     def __init__(self, **kwargs):
         self.id = kwargs['id']
@@ -58,6 +108,12 @@ class Deployment(SerializableObject):
         self.groups = kwargs['groups']
         self.outputs = kwargs['outputs']
         self.permalink = None  # TODO: implement
+        # status (and error) of the deployment's environment creation
+        # execution, kept up to date by the storage's
+        # update_execution_status. Not set for deployments stored by
+        # older versions.
+        self.environment_status = kwargs.get('environment_status')
+        self.environment_error = kwargs.get('environment_error')
 
 
 class DeploymentModification(SerializableObject):
@@ -71,6 +127,9 @@ class DeploymentModification(SerializableObject):
     fields = {'id', 'deployment_id', 'modified_nodes', 'node_instances',
               'status', 'created_at', 'ended_at', 'context'}
 
+    __slots__ = ('id', 'created_at', 'ended_at', 'status', 'deployment_id',
+                 'modified_nodes', 'node_instances', 'context')
+
     def __init__(self, **kwargs):
         self.id = kwargs['id']
         self.created_at = kwargs['created_at']
@@ -91,12 +150,20 @@ class Execution(SerializableObject):
     STARTED = 'started'
     CANCELLING = 'cancelling'
     FORCE_CANCELLING = 'force_cancelling'
+    # waiting for the deployment's previous executions to end
+    QUEUED = 'queued'
 
     END_STATES = [TERMINATED, FAILED, CANCELLED]
 
+    # the system workflow creating a deployment's environment
+    CREATE_DEPLOYMENT_ENVIRONMENT = 'create_deployment_environment'
+
     fields = {'id', 'status', 'deployment_id', 'workflow_id', 'blueprint_id',
               'created_at', 'error', 'parameters'}
 
+    __slots__ = ('id', 'status', 'deployment_id', 'workflow_id',
+                 'blueprint_id', 'created_at', 'error', 'parameters')
+
     def __init__(self, **kwargs):
         self.id = kwargs['id']
         self.status = kwargs['status']
@@ -120,6 +187,12 @@ class DeploymentNode(SerializableObject):
         'operations', 'plugins', 'relationships', 'plugins_to_install'
     }
 
+    __slots__ = ('id', 'deployment_id', 'blueprint_id', 'type',
+                 'type_hierarchy', 'number_of_instances',
+                 'planned_number_of_instances', 'deploy_number_of_instances',
+                 'host_id', 'properties', 'operations', 'plugins',
+                 'relationships', 'plugins_to_install')
+
     def __init__(self, **kwargs):
         self.id = kwargs['id']
         self.deployment_id = kwargs['deployment_id']
@@ -148,6 +221,11 @@ class DeploymentNodeInstance(SerializableObject):
         'relationships', 'node_id', 'host_id'
     }
 
+    __slots__ = ('id', 'node_id', 'deployment_id', 'state', 'version',
+                 'relationships', 'host_id', '_runtime_properties')
+    lazy_fields = frozenset(['runtime_properties'])
+    runtime_properties = LazyField('_runtime_properties')
+
     def __init__(self, **kwargs):
         self.id = kwargs['id']
         self.node_id = kwargs['node_id']
@@ -163,6 +241,8 @@ class ProviderContext(SerializableObject):
 
     fields = {'context', 'name'}
 
+    __slots__ = ('context', 'name')
+
     def __init__(self, **kwargs):
         self.context = kwargs['context']
         self.name = kwargs['name']
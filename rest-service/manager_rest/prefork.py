@@ -0,0 +1,62 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Serving the rest service from pre-forked worker processes.
+
+The application is built when the server module is imported: the
+configuration is loaded, the heavy modules (dsl parser, celery,
+elasticsearch) are imported and the flask app is set up. When the WSGI
+server preloads the application (gunicorn's preload_app), this is done once
+in the master process and workers are forked from it, sharing its memory.
+
+Everything which holds connections or threads (the storage manager and
+the elasticsearch and celery clients) is process local: it is created
+lazily in the process which uses it, and objects inherited from the master
+are never used by a worker. init_worker should still be called in every
+worker right after it is forked (see gunicorn_config.post_fork), so the
+worker's resources are initialized before it accepts requests rather than
+by its first request, and initialization errors fail the worker on boot.
+
+The memory and file storage managers keep the storage in the memory of
+the process, so they may only be served by a single worker.
+"""
+
+import os
+import logging
+
+from manager_rest import config
+from manager_rest import storage_manager
+from manager_rest import celery_client
+
+logger = logging.getLogger(__name__)
+
+SINGLE_PROCESS_STORAGE_MODULES = ('memory_storage_manager',
+                                  'file_storage_manager')
+
+
+def init_worker():
+    """
+    Initializes the process local resources of a newly forked worker.
+    """
+    celery_client.reset()
+    storage_manager.reset()
+    module_name = config.instance().storage_manager_module_name or \
+        storage_manager.storage_manager_module_name
+    if module_name in SINGLE_PROCESS_STORAGE_MODULES:
+        logger.warning('{0} keeps the storage in process memory; serving it '
+                       'from more than a single worker leads to '
+                       'inconsistent results'.format(module_name))
+    logger.info('Worker {0} initialized'.format(os.getpid()))
@@ -0,0 +1,158 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Profiling of individual requests, for investigating slow endpoints on a
+running manager rather than reproducing them offline.
+
+A request carrying the X-Profile header, whose value is the token set by
+the manager's administrator in the request_profiling configuration, e.g.:
+
+    request_profiling:
+      token: <a secret token>
+      profiles_dir: /var/log/cloudify/rest/profiles
+
+is handled under cProfile, and its profile is stored in profiles_dir (in
+the pstats format, named by the X-Profile-File response header). Requests
+with any other X-Profile value are handled as usual.
+
+The elasticsearch calls made while handling a profiled request are traced
+as well: the response carries their number (X-Storage-Calls) and total
+duration in seconds (X-Storage-Time), and each call is logged with its
+duration. Calls are traced by the transport of the elasticsearch clients
+(see TracingTransport), so other storage backends are not traced.
+"""
+
+import os
+import hmac
+import time
+import uuid
+import cProfile
+import tempfile
+import threading
+
+from elasticsearch import Transport
+from flask import g, request
+
+from manager_rest import config
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_FILE_HEADER = 'X-Profile-File'
+STORAGE_CALLS_HEADER = 'X-Storage-Calls'
+STORAGE_TIME_HEADER = 'X-Storage-Time'
+
+# the trace of the request handled by the current thread, if profiled
+_local = threading.local()
+
+
+class StorageTrace(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def record(self, method, url, duration):
+        self.calls.append((method, url, duration))
+
+    @property
+    def total_time(self):
+        return sum(duration for _, _, duration in self.calls)
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+class TracingTransport(Transport):
+    """
+    An elasticsearch transport recording the calls made while a request is
+    profiled.
+    """
+
+    def perform_request(self, method, url, params=None, body=None):
+        trace = current_trace()
+        if trace is None:
+            return super(TracingTransport, self).perform_request(
+                method, url, params, body)
+        started_at = time.time()
+        try:
+            return super(TracingTransport, self).perform_request(
+                method, url, params, body)
+        finally:
+            trace.record(method, url, time.time() - started_at)
+
+
+def init_app(app):
+    """
+    Enables profiling requests, if configured.
+    """
+    profiling_config = config.instance().request_profiling
+    if not profiling_config:
+        return
+    token = str(profiling_config['token'])
+    profiles_dir = profiling_config.get('profiles_dir') or \
+        tempfile.gettempdir()
+
+    def start():
+        supplied_token = request.headers.get(PROFILE_HEADER)
+        if supplied_token is None:
+            return
+        if not hmac.compare_digest(str(supplied_token), token):
+            app.logger.warning('Not profiling {0} {1}: invalid profiling '
+                               'token'.format(request.method, request.path))
+            return
+        _local.trace = StorageTrace()
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+    def stop(response):
+        profiler = getattr(g, 'profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        g.profiler = None
+        trace = current_trace()
+        _local.trace = None
+
+        if not os.path.isdir(profiles_dir):
+            os.makedirs(profiles_dir)
+        profile_file = '{0}-{1}-{2}.prof'.format(
+            time.strftime('%Y%m%d-%H%M%S'), request.endpoint,
+            uuid.uuid4().hex[:8])
+        profiler.dump_stats(os.path.join(profiles_dir, profile_file))
+
+        response.headers[PROFILE_FILE_HEADER] = profile_file
+        response.headers[STORAGE_CALLS_HEADER] = str(len(trace.calls))
+        response.headers[STORAGE_TIME_HEADER] = '{0:.6f}'.format(
+            trace.total_time)
+        app.logger.info(
+            'Profiled {0} {1} ({2}): {3} storage calls in {4:.3f} '
+            'seconds{5}'.format(
+                request.method, request.path, profile_file,
+                len(trace.calls), trace.total_time,
+                ''.join('\n\t{0} {1}: {2:.3f}'.format(*call)
+                        for call in trace.calls)))
+        return response
+
+    def teardown(exc=None):
+        # requests failing with an unhandled error are not profiled
+        profiler = getattr(g, 'profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            g.profiler = None
+        _local.trace = None
+
+    app.before_request(start)
+    app.after_request(stop)
+    app.teardown_request(teardown)
@@ -0,0 +1,117 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+A short lived cache of query results (of the /search and /events
+endpoints), for clients polling with identical queries.
+
+Results are kept for a few seconds (ttl) in a bounded (LRU) cache, keyed by
+the canonical form of the query, so that identical queries differing in the
+order of their keys share an entry. Concurrent identical queries are
+coalesced: the first one queries the backend, and the others wait for its
+result (or error) rather than issuing the same query. Coalescing applies
+even when caching is disabled (ttl of 0).
+
+Cached results are shared by the requests they are returned to, and must
+not be modified.
+"""
+
+import json
+import time
+import threading
+from collections import OrderedDict
+
+
+def canonical_key(*parts):
+    """
+    :return: a key of the given json serializable parts, which is equal
+             for equal parts regardless of the order of dicts' keys.
+    """
+    return json.dumps(parts, sort_keys=True, separators=(',', ':'))
+
+
+class _Pending(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class QueryCache(object):
+
+    def __init__(self, ttl, max_entries, clock=time.time):
+        """
+        :param ttl: Seconds a result is cached for (0 disables caching).
+        :param max_entries: Maximum number of cached results.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, query):
+        """
+        :param key: The canonical key of the query (see canonical_key).
+        :param query: A function returning the result of the query.
+        :return: the cached result of the query, or the result of a
+                 concurrent identical query, or else the result of query().
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry[0] > self.clock():
+                # re-inserted as the most recently used entry
+                self._entries[key] = entry
+                self.hits += 1
+                return entry[1]
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = _Pending()
+                leader = True
+                self.misses += 1
+            else:
+                leader = False
+                self.coalesced += 1
+
+        if not leader:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.result
+
+        try:
+            pending.result = query()
+        except Exception, e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._pending[key]
+                if pending.error is None and self.ttl > 0:
+                    self._entries[key] = (self.clock() + self.ttl,
+                                          pending.result)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            pending.done.set()
+        return pending.result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
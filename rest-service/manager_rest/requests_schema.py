@@ -24,7 +24,10 @@ class ExecutionRequest(object):
         'workflow_id': fields.String,
         'parameters': fields.Raw,
         'allow_custom_parameters': fields.Boolean,
-        'force': fields.Boolean
+        'force': fields.Boolean,
+        'queue': fields.Boolean,
+        'idempotency_key': fields.String,
+        'dedup_window': fields.Integer
     }
 
 
@@ -20,6 +20,7 @@ import urllib
 import tempfile
 import shutil
 import uuid
+import inspect
 import contextlib
 from functools import wraps
 from os import path
@@ -45,7 +46,11 @@ from manager_rest import requests_schema
 from manager_rest import chunked
 from manager_rest import archiving
 from manager_rest import manager_exceptions
+from manager_rest import es_storage_manager
+from manager_rest import es_events
+from manager_rest import query_cache
 from manager_rest import utils
+from manager_rest.profiling import TracingTransport
 from manager_rest.storage_manager import get_storage_manager
 from manager_rest.blueprints_manager import (DslParseException,
                                              get_blueprints_manager)
@@ -55,6 +60,16 @@ CONVENTION_APPLICATION_BLUEPRINT_FILE = 'blueprint.yaml'
 
 SUPPORTED_ARCHIVE_TYPES = ['zip', 'tar', 'tar.gz', 'tar.bz2']
 
+# size of the chunks in which blueprint archives are downloaded
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# fields returned by list endpoints unless other fields are explicitly
+# requested using the _include query parameter; heavy fields (e.g. a
+# blueprint's plan) are opt-in
+BLUEPRINT_LIST_DEFAULT_FIELDS = ['id', 'created_at', 'updated_at']
+DEPLOYMENT_LIST_DEFAULT_FIELDS = ['id', 'created_at', 'updated_at',
+                                  'blueprint_id', 'inputs', 'outputs']
+
 
 def exceptions_handled(func):
     @wraps(func)
@@ -66,7 +81,7 @@ def exceptions_handled(func):
     return wrapper
 
 
-def _get_fields_to_include(model_fields):
+def _get_fields_to_include(model_fields, default_include=None):
     if '_include' in request.args and request.args['_include']:
         include = set(request.args['_include'].split(','))
         include_fields = {}
@@ -84,20 +99,33 @@ def _get_fields_to_include(model_fields):
                 '[{}]'.format(', '.join(illegal_fields),
                               ', '.join(model_fields.keys())))
         return include_fields
+    if default_include:
+        return {field: model_fields[field] for field in default_include}
     return model_fields
 
 
 class marshal_with(object):
-    def __init__(self, fields):
+    def __init__(self, fields, default_include=None):
         """
         :param fields: Model resource fields to marshal result according to.
+        :param default_include: Fields to marshal when the request does not
+                                specify fields to include (default: all
+                                fields).
         """
         self.fields = fields
+        self.default_include = default_include
 
     def __call__(self, f):
+        # the fields to include are passed on to the resource method (if it
+        # accepts them), so only these fields are fetched from the storage
+        accepts_include = '_include' in inspect.getargspec(f).args
+
         @wraps(f)
         def wrapper(*args, **kwargs):
-            include = _get_fields_to_include(self.fields)
+            include = _get_fields_to_include(self.fields,
+                                             self.default_include)
+            if accepts_include and include is not self.fields:
+                kwargs['_include'] = include.keys()
             response = f(*args, **kwargs)
             if isinstance(response, tuple):
                 data, code, headers = unpack(response)
@@ -167,6 +195,8 @@ def setup_resources(api):
     api.add_resource(DeploymentsId, '/deployments/<string:deployment_id>')
     api.add_resource(DeploymentsIdOutputs,
                      '/deployments/<string:deployment_id>/outputs')
+    api.add_resource(DeploymentsIdSummary,
+                     '/deployments/<string:deployment_id>/summary')
     api.add_resource(DeploymentModifications,
                      '/deployment-modifications')
     api.add_resource(DeploymentModificationsId,
@@ -181,6 +211,9 @@ def setup_resources(api):
     api.add_resource(NodeInstances, '/node-instances')
     api.add_resource(NodeInstancesId,
                      '/node-instances/<string:node_instance_id>')
+    api.add_resource(NodeInstancesSummary, '/summary/node-instances')
+    api.add_resource(ExecutionsSummary, '/summary/executions')
+    api.add_resource(ExecutionQueueSummary, '/summary/execution-queue')
     api.add_resource(Events, '/events')
     api.add_resource(Search, '/search')
     api.add_resource(Status, '/status')
@@ -268,9 +301,10 @@ class BlueprintsUpload(object):
 
             blueprint_url = request.args['blueprint_archive_url']
             try:
+                # streamed to the file, rather than read into memory
                 with contextlib.closing(urlopen(blueprint_url)) as urlf:
                     with open(archive_file_name, 'w') as f:
-                        f.write(urlf.read())
+                        shutil.copyfileobj(urlf, f, DOWNLOAD_CHUNK_SIZE)
                 return
             except URLError:
                 raise manager_exceptions.ParamUrlNotFoundError(
@@ -440,10 +474,13 @@ class Blueprints(SecuredResource):
     @swagger.operation(
         responseClass='List[{0}]'.format(responses.BlueprintState.__name__),
         nickname="list",
-        notes="Returns a list a submitted blueprints."
+        notes="Returns a list a submitted blueprints. Unless requested "
+              "using _include, only their id, created_at and updated_at "
+              "are returned (not their plan)."
     )
     @exceptions_handled
-    @marshal_with(responses.BlueprintState.resource_fields)
+    @marshal_with(responses.BlueprintState.resource_fields,
+                  default_include=BLUEPRINT_LIST_DEFAULT_FIELDS)
     def get(self, _include=None):
         """
         List uploaded blueprints
@@ -579,6 +616,17 @@ class Executions(SecuredResource):
         force = verify_and_convert_bool(
             'force',
             request_json.get('force', 'false'))
+        queue = verify_and_convert_bool(
+            'queue',
+            request_json.get('queue', 'false'))
+        verify_parameter_in_request_body('idempotency_key', request_json,
+                                         param_type=basestring,
+                                         optional=True)
+        verify_parameter_in_request_body('dedup_window', request_json,
+                                         param_type=int, optional=True)
+        if request_json.get('dedup_window', 0) < 0:
+            raise manager_exceptions.BadParametersError(
+                'dedup_window must not be negative')
 
         deployment_id = request.json['deployment_id']
         workflow_id = request.json['workflow_id']
@@ -591,7 +639,9 @@ class Executions(SecuredResource):
 
         execution = get_blueprints_manager().execute_workflow(
             deployment_id, workflow_id, parameters=parameters,
-            allow_custom_parameters=allow_custom_parameters, force=force)
+            allow_custom_parameters=allow_custom_parameters, force=force,
+            queue=queue, idempotency_key=request_json.get('idempotency_key'),
+            dedup_window=request_json.get('dedup_window'))
         return responses.Execution(**execution.to_dict()), 201
 
 
@@ -683,13 +733,11 @@ class ExecutionsId(SecuredResource):
         request_json = request.json
         verify_parameter_in_request_body('status', request_json)
 
-        get_storage_manager().update_execution_status(
+        execution = get_blueprints_manager().update_execution_status(
             execution_id,
             request_json['status'],
             request_json.get('error', ''))
-
-        return responses.Execution(**get_storage_manager().get_execution(
-            execution_id).to_dict())
+        return responses.Execution(**execution.to_dict())
 
 
 class Deployments(SecuredResource):
@@ -697,10 +745,13 @@ class Deployments(SecuredResource):
     @swagger.operation(
         responseClass='List[{0}]'.format(responses.Deployment.__name__),
         nickname="list",
-        notes="Returns a list existing deployments."
+        notes="Returns a list existing deployments. Unless requested "
+              "using _include, their workflows, groups, policy_types and "
+              "policy_triggers are not returned."
     )
     @exceptions_handled
-    @marshal_with(responses.Deployment.resource_fields)
+    @marshal_with(responses.Deployment.resource_fields,
+                  default_include=DEPLOYMENT_LIST_DEFAULT_FIELDS)
     def get(self, _include=None):
         """
         List deployments
@@ -1144,19 +1195,216 @@ class DeploymentsIdOutputs(SecuredResource):
                                            outputs=outputs)
 
 
+class DeploymentsIdSummary(SecuredResource):
+
+    @swagger.operation(
+        responseClass=responses.DeploymentSummary.__name__,
+        nickname="getSummary",
+        notes="Gets the node instance counts by state and the execution "
+              "counts by status of a specific deployment."
+    )
+    @exceptions_handled
+    @marshal_with(responses.DeploymentSummary.resource_fields)
+    def get(self, deployment_id, **_):
+        """Get deployment summary"""
+        sm = get_storage_manager()
+        # verify the deployment exists
+        sm.get_deployment(deployment_id, include=['id'])
+        node_instances = sm.node_instances_summary(['state'], deployment_id)
+        executions = sm.executions_summary(['status'], deployment_id)
+        return responses.DeploymentSummary(
+            deployment_id=deployment_id,
+            node_instances={item['state']: item['count']
+                            for item in node_instances},
+            executions={item['status']: item['count']
+                        for item in executions})
+
+
+def _parse_group_by(group_by, allowed_fields):
+    fields = [field.strip() for field in group_by.split(',')
+              if field.strip()]
+    if not fields:
+        raise manager_exceptions.BadParametersError(
+            'group_by must specify at least one field')
+    unknown = [field for field in fields if field not in allowed_fields]
+    if unknown or len(set(fields)) != len(fields):
+        raise manager_exceptions.BadParametersError(
+            'Cannot group by {0}; group_by must be a comma separated list of '
+            'distinct fields out of {1}'.format(group_by,
+                                                ', '.join(allowed_fields)))
+    return fields
+
+
+def _sorted_summary(items, group_by):
+    # most common groups first, as elasticsearch terms aggregations order
+    # buckets
+    return sorted(items, key=lambda item: [-item['count']] +
+                  [item[field] for field in group_by])
+
+
+class _SummaryResource(SecuredResource):
+
+    allowed_fields = ()
+    default_group_by = None
+
+    def __init__(self):
+        self._args_parser = reqparse.RequestParser()
+        self._args_parser.add_argument('group_by',
+                                       type=str,
+                                       required=False,
+                                       default=self.default_group_by,
+                                       location='args')
+        self._args_parser.add_argument('deployment_id',
+                                       type=str,
+                                       required=False,
+                                       location='args')
+
+    def _summarize(self, group_by, deployment_id):
+        raise NotImplementedError()
+
+    def _summary(self):
+        args = self._args_parser.parse_args()
+        group_by = _parse_group_by(args['group_by'], self.allowed_fields)
+        items = self._summarize(group_by, args.get('deployment_id'))
+        return responses.Summary(group_by=group_by,
+                                 items=_sorted_summary(items, group_by))
+
+
+class NodeInstancesSummary(_SummaryResource):
+
+    allowed_fields = ('state', 'deployment_id', 'node_id', 'host_id')
+    default_group_by = 'state'
+
+    @swagger.operation(
+        responseClass=responses.Summary.__name__,
+        nickname="summarizeNodeInstances",
+        notes="Returns node instance counts grouped by the provided fields "
+              "(without transferring the node instances).",
+        parameters=[{'name': 'group_by',
+                     'description': 'Comma separated fields to group by '
+                                    '(state, deployment_id, node_id, '
+                                    'host_id)',
+                     'required': False,
+                     'allowMultiple': False,
+                     'dataType': 'string',
+                     'defaultValue': 'state',
+                     'paramType': 'query'},
+                    {'name': 'deployment_id',
+                     'description': 'Deployment id',
+                     'required': False,
+                     'allowMultiple': False,
+                     'dataType': 'string',
+                     'paramType': 'query'}]
+    )
+    @exceptions_handled
+    @marshal_with(responses.Summary.resource_fields)
+    def get(self, **_):
+        """
+        Summarize node instances
+        """
+        return self._summary()
+
+    def _summarize(self, group_by, deployment_id):
+        return get_storage_manager().node_instances_summary(group_by,
+                                                            deployment_id)
+
+
+class ExecutionsSummary(_SummaryResource):
+
+    allowed_fields = ('status', 'deployment_id', 'workflow_id',
+                      'blueprint_id')
+    default_group_by = 'status'
+
+    @swagger.operation(
+        responseClass=responses.Summary.__name__,
+        nickname="summarizeExecutions",
+        notes="Returns execution counts grouped by the provided fields "
+              "(without transferring the executions).",
+        parameters=[{'name': 'group_by',
+                     'description': 'Comma separated fields to group by '
+                                    '(status, deployment_id, workflow_id, '
+                                    'blueprint_id)',
+                     'required': False,
+                     'allowMultiple': False,
+                     'dataType': 'string',
+                     'defaultValue': 'status',
+                     'paramType': 'query'},
+                    {'name': 'deployment_id',
+                     'description': 'Deployment id',
+                     'required': False,
+                     'allowMultiple': False,
+                     'dataType': 'string',
+                     'paramType': 'query'}]
+    )
+    @exceptions_handled
+    @marshal_with(responses.Summary.resource_fields)
+    def get(self, **_):
+        """
+        Summarize executions
+        """
+        return self._summary()
+
+    def _summarize(self, group_by, deployment_id):
+        return get_storage_manager().executions_summary(group_by,
+                                                        deployment_id)
+
+
+class ExecutionQueueSummary(SecuredResource):
+
+    @swagger.operation(
+        responseClass=responses.ExecutionQueueSummary,
+        nickname="summarizeExecutionQueue",
+        notes="Returns the running and queued execution counts (per "
+              "blueprint and per workflow), the waiting times of the queued "
+              "executions and the configured execution limits."
+    )
+    @exceptions_handled
+    @marshal_with(responses.ExecutionQueueSummary.resource_fields)
+    def get(self, **_):
+        """
+        Summarize the execution queue
+        """
+        return responses.ExecutionQueueSummary(
+            **get_blueprints_manager().execution_queue_summary())
+
+
+# the elasticsearch client is thread safe and pools its connections, so a
+# single client is shared by the requests a process serves
+_es_client = None
+_es_client_pid = None
+
+
+def _elastic_search_connection():
+    global _es_client, _es_client_pid
+    if _es_client is None or _es_client_pid != os.getpid():
+        es_host = config.instance().db_address
+        es_port = config.instance().db_port
+        _es_client = elasticsearch.Elasticsearch(
+            hosts=[{"host": es_host, "port": es_port}],
+            transport_class=TracingTransport)
+        _es_client_pid = os.getpid()
+    return _es_client
+
+
 def _query_elastic_search(index=None, doc_type=None, body=None):
     """Query ElasticSearch with the provided index and query body.
 
     Returns:
     Elasticsearch result as is (Python dict).
     """
-    es_host = config.instance().db_address
-    es_port = config.instance().db_port
-    es = elasticsearch.Elasticsearch(hosts=[{"host": es_host,
-                                             "port": es_port}])
+    es = _elastic_search_connection()
     return es.search(index=index, doc_type=doc_type, body=body)
 
 
+def _cached_query(key, query):
+    """
+    :return: the result of query() through the app's query cache (see
+             query_cache), for the given endpoint key and request body.
+    """
+    return app.query_cache.get(query_cache.canonical_key(key, request.json),
+                               query)
+
+
 class Events(SecuredResource):
 
     def _query_events(self):
@@ -1164,7 +1412,17 @@ class Events(SecuredResource):
         List events for the provided Elasticsearch query
         """
         verify_json_content_type()
-        return _query_elastic_search(index='cloudify_events',
+        return _cached_query('events', self._search_events)
+
+    @staticmethod
+    def _search_events():
+        # only the daily events indices overlapping the time range of the
+        # query are searched
+        indices = es_events.indices_for_query(_elastic_search_connection(),
+                                              request.json)
+        if not indices:
+            return es_events.empty_result()
+        return _query_elastic_search(index=','.join(indices),
                                      body=request.json)
 
     @swagger.operation(
@@ -1227,8 +1485,11 @@ class Search(SecuredResource):
         Search using an Elasticsearch query
         """
         verify_json_content_type()
-        return _query_elastic_search(index='cloudify_storage',
-                                     body=request.json)
+        index = ','.join(es_storage_manager.storage_index_names(
+            config.instance().es_index_per_type))
+        return _cached_query(
+            ['search', index],
+            lambda: _query_elastic_search(index=index, body=request.json))
 
 
 class Status(SecuredResource):
@@ -1236,7 +1497,18 @@ class Status(SecuredResource):
     @swagger.operation(
         responseClass=responses.Status,
         nickname="status",
-        notes="Returns state of running system services"
+        notes="Returns state of running system services, as collected "
+              "up to a few seconds ago (the age of the state is returned "
+              "in seconds).",
+        parameters=[{'name': 'fresh',
+                     'description': 'Specifies whether to collect the state '
+                                    'of the services, rather than return the '
+                                    'recently collected state.',
+                     'required': False,
+                     'allowMultiple': False,
+                     'dataType': 'boolean',
+                     'defaultValue': False,
+                     'paramType': 'query'}]
     )
     @exceptions_handled
     @marshal_with(responses.Status.resource_fields)
@@ -1244,37 +1516,11 @@ class Status(SecuredResource):
         """
         Get the status of running system services
         """
-        job_list = {'riemann': 'Riemann',
-                    'rabbitmq-server': 'RabbitMQ',
-                    'celeryd-cloudify-management': 'Celery Management',
-                    'elasticsearch': 'Elasticsearch',
-                    'cloudify-ui': 'Cloudify UI',
-                    'logstash': 'Logstash',
-                    'nginx': 'Webserver'
-                    }
-
-        try:
-            if self._is_docker_env():
-                job_list.update({'rest-service': 'Manager Rest-Service',
-                                 'amqp-influx': 'AMQP InfluxDB',
-                                 })
-                from manager_rest.runitsupervise import get_services
-                jobs = get_services(job_list)
-            else:
-                job_list.update({'manager': 'Cloudify Manager',
-                                 'rsyslog': 'Syslog',
-                                 'ssh': 'SSH',
-                                 })
-                from manager_rest.upstartdbus import get_jobs
-                jobs = get_jobs(job_list.keys(), job_list.values())
-        except ImportError:
-            jobs = ['undefined']
-
-        return responses.Status(status='running', services=jobs)
-
-    @staticmethod
-    def _is_docker_env():
-        return os.getenv('DOCKER_ENV') is not None
+        fresh = verify_and_convert_bool(
+            'fresh', request.args.get('fresh', 'false'))
+        services, age = app.service_status.get(fresh=fresh)
+        return responses.Status(status='running', services=services,
+                                age=round(age, 3))
 
 
 class ProviderContext(SecuredResource):
@@ -106,6 +106,64 @@ class DeploymentOutputs(object):
         self.outputs = kwargs['outputs']
 
 
+@swagger.model
+class DeploymentSummary(object):
+
+    resource_fields = {
+        'deployment_id': fields.String,
+        'node_instances': fields.Raw,
+        'executions': fields.Raw
+    }
+
+    def __init__(self, **kwargs):
+        self.deployment_id = kwargs['deployment_id']
+        self.node_instances = kwargs['node_instances']
+        self.executions = kwargs['executions']
+
+
+@swagger.model
+class Summary(object):
+
+    resource_fields = {
+        'group_by': fields.Raw,
+        'items': fields.Raw
+    }
+
+    def __init__(self, **kwargs):
+        self.group_by = kwargs['group_by']
+        self.items = kwargs['items']
+
+
+@swagger.model
+class ExecutionQueueSummary(object):
+
+    resource_fields = {
+        'limits': fields.Raw,
+        'running': fields.Integer,
+        'queued': fields.Integer,
+        'running_per_blueprint': fields.Raw,
+        'queued_per_blueprint': fields.Raw,
+        'running_per_workflow': fields.Raw,
+        'queued_per_workflow': fields.Raw,
+        'queued_deployments': fields.Integer,
+        # fields.Float renders numbers as strings
+        'max_wait': fields.Raw,
+        'mean_wait': fields.Raw
+    }
+
+    def __init__(self, **kwargs):
+        self.limits = kwargs['limits']
+        self.running = kwargs['running']
+        self.queued = kwargs['queued']
+        self.running_per_blueprint = kwargs['running_per_blueprint']
+        self.queued_per_blueprint = kwargs['queued_per_blueprint']
+        self.running_per_workflow = kwargs['running_per_workflow']
+        self.queued_per_workflow = kwargs['queued_per_workflow']
+        self.queued_deployments = kwargs['queued_deployments']
+        self.max_wait = kwargs['max_wait']
+        self.mean_wait = kwargs['mean_wait']
+
+
 @swagger.model
 class DeploymentModification(object):
 
@@ -224,12 +282,15 @@ class Status(object):
 
     resource_fields = {
         'status': fields.String,
-        'services': fields.Raw
+        'services': fields.Raw,
+        # fields.Float renders numbers as strings
+        'age': fields.Raw
     }
 
     def __init__(self, **kwargs):
         self.status = kwargs['status']
         self.services = kwargs['services']
+        self.age = kwargs.get('age')
 
 
 @swagger.model
@@ -16,6 +16,7 @@
 import StringIO
 import functools
 import traceback
+import logging
 import os
 import yaml
 from logging.handlers import RotatingFileHandler
@@ -30,12 +31,21 @@ from flask_restful import Api
 
 from flask_securest.rest_security import SecuREST
 
+from manager_rest import admission
+from manager_rest import async_logging
 from manager_rest import config
 from manager_rest import storage_manager
 from manager_rest import resources
 from manager_rest import manager_exceptions
+from manager_rest import query_cache
+from manager_rest import execution_status_writer
+from manager_rest import profiling
+from manager_rest import service_status
 from manager_rest import utils
 
+# logged request data (e.g. json bodies) longer than this is truncated
+LOGGED_DATA_MAX_LENGTH = 1024
+
 
 # app factory
 def setup_app():
@@ -60,6 +70,26 @@ def setup_app():
     app.before_request(log_request)
     app.after_request(log_response)
 
+    # rejecting requests over the configured limits before handling them
+    admission.init_app(app)
+
+    # profiling requests on demand of the manager's administrator
+    profiling.init_app(app)
+
+    # results of /search and /events queries, shared by identical queries
+    app.query_cache = query_cache.QueryCache(cfy_config.query_cache_ttl,
+                                             cfy_config.query_cache_size)
+
+    # execution status updates, coalesced when a flush interval is set
+    app.execution_status_writer = \
+        execution_status_writer.ExecutionStatusWriter(
+            storage_manager.instance,
+            cfy_config.execution_status_flush_interval)
+
+    # the status of the system services, served by /status
+    app.service_status = service_status.ServiceStatusCache(
+        cfy_config.status_refresh_interval)
+
     # saving flask's original error handlers
     flask_handle_exception = app.handle_exception
     flask_handle_user_exception = app.handle_user_exception
@@ -94,6 +124,9 @@ def setup_app():
 
 
 def log_request():
+    if not app.logger.isEnabledFor(logging.DEBUG):
+        return
+
     # form and args parameters are "multidicts", i.e. values are not
     # flattened and will appear in a list (even if single value)
     form_data = request.form.to_dict(False)
@@ -116,13 +149,16 @@ def log_request():
             id(request),
             request.path,  # includes "path parameters"
             request.method,
-            json_data,
-            args_data,
-            form_data,
+            truncate(json_data),
+            truncate(args_data),
+            truncate(form_data),
             headers_pretty_print(request.headers)))
 
 
 def log_response(response):
+    if not app.logger.isEnabledFor(logging.DEBUG):
+        return response
+
     # content-type and content-length are already included in headers
     # not logging response.data as volumes are massive
 
@@ -137,6 +173,14 @@ def log_response(response):
     return response
 
 
+def truncate(data, max_length=LOGGED_DATA_MAX_LENGTH):
+    data = str(data)
+    if len(data) <= max_length:
+        return data
+    return '{0}... ({1} more characters)'.format(data[:max_length],
+                                                 len(data) - max_length)
+
+
 def headers_pretty_print(headers):
     pp_headers = ''.join(['\t\t{0}: {1}\n'.format(k, v) for k, v in headers])
     return '\n' + pp_headers
@@ -158,11 +202,12 @@ def create_logger(logger_name,
                   log_file_size_MB,
                   log_files_backup_count):
 
+    # the log file is written (and rotated) off the request threads
     additional_log_handlers = [
-        RotatingFileHandler(
+        async_logging.AsyncHandler(RotatingFileHandler(
             filename=log_file,
             maxBytes=log_file_size_MB * 1024 * 1024,
-            backupCount=log_files_backup_count)
+            backupCount=log_files_backup_count))
     ]
 
     return utils.setup_logger(logger_name=logger_name,
@@ -0,0 +1,178 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Collection of the status of the manager's system services, for /status.
+
+The status of each service is probed through D-Bus (upstart) or, in a
+docker environment, through the runit supervise files, with the probes of
+all services running concurrently. As monitoring probes call /status
+frequently, the collected status is cached, and refreshed in the
+background every status_refresh_interval seconds (see
+ServiceStatusCache) while /status is being called. Requests are served
+the cached status, along with its age, unless a fresh status is asked for.
+A refresh interval of 0 disables caching.
+"""
+
+import os
+import time
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+SERVICES = {
+    'riemann': 'Riemann',
+    'rabbitmq-server': 'RabbitMQ',
+    'celeryd-cloudify-management': 'Celery Management',
+    'elasticsearch': 'Elasticsearch',
+    'cloudify-ui': 'Cloudify UI',
+    'logstash': 'Logstash',
+    'nginx': 'Webserver'
+}
+
+DOCKER_SERVICES = {
+    'rest-service': 'Manager Rest-Service',
+    'amqp-influx': 'AMQP InfluxDB'
+}
+
+UPSTART_SERVICES = {
+    'manager': 'Cloudify Manager',
+    'rsyslog': 'Syslog',
+    'ssh': 'SSH'
+}
+
+logger = logging.getLogger(__name__)
+
+# the refresher stops after this many intervals without /status requests
+IDLE_REFRESH_INTERVALS = 10
+
+
+def _is_docker_env():
+    return os.getenv('DOCKER_ENV') is not None
+
+
+def collect():
+    """
+    :return: the status of the system services, probed concurrently.
+    """
+    services = dict(SERVICES)
+    try:
+        if _is_docker_env():
+            services.update(DOCKER_SERVICES)
+            from manager_rest.runitsupervise import get_services
+
+            def probe(service):
+                return get_services({service: services[service]})
+        else:
+            services.update(UPSTART_SERVICES)
+            from manager_rest.upstartdbus import get_jobs
+
+            def probe(service):
+                return get_jobs([service], [services[service]])
+    except ImportError:
+        return ['undefined']
+
+    pool = ThreadPool(len(services))
+    try:
+        results = pool.map(probe, sorted(services))
+    finally:
+        pool.close()
+    return [details for result in results for details in result]
+
+
+class ServiceStatusCache(object):
+
+    def __init__(self, refresh_interval, collect=collect, clock=time.time):
+        """
+        :param refresh_interval: Seconds between refreshes of the cached
+                                 status (0 disables caching).
+        :param collect: A function returning the status of the services.
+        """
+        self.refresh_interval = refresh_interval
+        self.collect = collect
+        self.clock = clock
+        self._services = None
+        self._collected_at = None
+        self._last_access = None
+        self._refresher_running = False
+        self._refresher_pid = None
+        self._lock = threading.Lock()
+        # a single refresh at a time, which concurrent requests wait for
+        self._refresh_lock = threading.Lock()
+
+    def get(self, fresh=False):
+        """
+        :param fresh: Whether to collect the status rather than return the
+                      cached one.
+        :return: the status of the services, and its age in seconds.
+        """
+        if not self.refresh_interval:
+            return self.collect(), 0
+        requested_at = self.clock()
+        with self._lock:
+            self._last_access = requested_at
+            self._start_refresher()
+            cached = self._collected_at is not None
+        if fresh:
+            self.refresh()
+        elif not cached:
+            # requests arriving before the first status is collected share
+            # its collection
+            self.refresh(unless_collected_since=requested_at)
+        with self._lock:
+            return self._services, max(0, self.clock() - self._collected_at)
+
+    def refresh(self, unless_collected_since=None):
+        """
+        Collects the status of the services, unless it has been collected
+        since the given time (while waiting for a refresh in progress).
+        """
+        with self._refresh_lock:
+            if unless_collected_since is not None and \
+                    self._collected_at is not None and \
+                    self._collected_at >= unless_collected_since:
+                return
+            services = self.collect()
+            with self._lock:
+                self._services = services
+                self._collected_at = self.clock()
+
+    def _start_refresher(self):
+        # a forked worker does not inherit the refresher thread
+        if self._refresher_running and \
+                self._refresher_pid == os.getpid():
+            return
+        self._refresher_running = True
+        self._refresher_pid = os.getpid()
+        refresher = threading.Thread(target=self._refresh_periodically,
+                                     name='service-status-refresher')
+        refresher.daemon = True
+        refresher.start()
+
+    def _refresh_periodically(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            with self._lock:
+                if self.clock() - self._last_access > \
+                        IDLE_REFRESH_INTERVALS * self.refresh_interval:
+                    # restarted by the next request
+                    self._refresher_running = False
+                    return
+            try:
+                self.refresh()
+            except Exception:
+                # the cached status is served until a refresh succeeds
+                logger.exception('Failed collecting the status of the '
+                                 'system services')
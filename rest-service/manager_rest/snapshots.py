@@ -0,0 +1,390 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Snapshots of a whole manager: its storage and the blueprints stored in
+its file server, e.g. for backing up a manager or moving to a manager with
+another storage backend.
+
+A snapshot is a gzipped tar archive, which is written and read as a
+stream (so it may be piped, e.g. to or from ssh):
+
+    snapshot.json                      snapshot format and manager version
+    storage/<storage type>/<n>.json    the documents of a storage type, in
+                                       batches (json lists)
+    files/<blueprints folder>/...      the blueprints folders of the file
+                                       server
+    storage.json                       the number of documents of each
+                                       storage type, marking the snapshot
+                                       complete
+
+The documents are read from the storage in batches (scrolled, on
+elasticsearch), and are restored by parallel workers, each batch in a
+single bulk write. Restored documents are made visible to searches once,
+when all of them are written. Snapshots are restored into managers with
+no blueprints or deployments. A restore which fails is rolled back: the
+documents and files it restored are deleted, so it may be retried.
+
+Node instance versions are restored, except into an elasticsearch
+storage, which versions documents itself: there, the versions of the
+restored node instances start over (at 1).
+
+Usage example:
+
+    python -m manager_rest.snapshots create /tmp/manager.tar.gz
+    python -m manager_rest.snapshots restore /tmp/manager.tar.gz
+"""
+
+import os
+import sys
+import json
+import time
+import Queue
+import shutil
+import StringIO
+import logging
+import tarfile
+import argparse
+import threading
+
+import yaml
+
+from manager_rest import config
+from manager_rest import manager_exceptions
+from manager_rest import storage_manager
+from manager_rest import get_version
+from manager_rest.memory_storage_manager import (NODES,
+                                                 NODE_INSTANCES,
+                                                 BLUEPRINTS,
+                                                 DEPLOYMENTS,
+                                                 DEPLOYMENT_MODIFICATIONS,
+                                                 EXECUTIONS,
+                                                 PROVIDER_CONTEXT)
+
+SNAPSHOT_FORMAT_VERSION = 1
+METADATA_FILE = 'snapshot.json'
+COUNTS_FILE = 'storage.json'
+STORAGE_DIR = 'storage'
+FILES_DIR = 'files'
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_WORKERS = 4
+
+# storage types in the order they are written (and restored)
+STORAGE_TYPES = (PROVIDER_CONTEXT,
+                 BLUEPRINTS,
+                 DEPLOYMENTS,
+                 NODES,
+                 NODE_INSTANCES,
+                 EXECUTIONS,
+                 DEPLOYMENT_MODIFICATIONS)
+
+logger = logging.getLogger(__name__)
+
+
+def blueprints_folders():
+    """
+    :return: the file server folders (relative to the file server root)
+             included in snapshots.
+    """
+    return [folder for folder in (
+        config.instance().file_server_blueprints_folder,
+        config.instance().file_server_uploaded_blueprints_folder) if folder]
+
+
+def _add_json(tar, name, data):
+    content = json.dumps(data)
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    info.mtime = time.time()
+    tar.addfile(info, StringIO.StringIO(content))
+
+
+def create_snapshot(sm, fileobj, file_server_root, folders,
+                    batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Writes a snapshot of the manager.
+
+    :param sm: The storage manager to read the documents from.
+    :param fileobj: The file object the snapshot is written to.
+    :param file_server_root: The root directory of the file server.
+    :param folders: The file server folders to include.
+    :param batch_size: The number of documents read (and written) at once.
+    :return: the number of documents of each storage type in the snapshot.
+    """
+    counts = {}
+    with tarfile.open(fileobj=fileobj, mode='w|gz') as tar:
+        _add_json(tar, METADATA_FILE, {
+            'snapshot_version': SNAPSHOT_FORMAT_VERSION,
+            'manager_version': get_version(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        })
+        for storage_type in STORAGE_TYPES:
+            counts[storage_type] = 0
+            for number, docs in enumerate(sm.export_docs(storage_type,
+                                                         batch_size)):
+                _add_json(tar, '{0}/{1}/{2:06d}.json'.format(
+                    STORAGE_DIR, storage_type, number), docs)
+                counts[storage_type] += len(docs)
+            logger.info('Wrote {0} {1}'.format(counts[storage_type],
+                                               storage_type))
+        for folder in folders:
+            folder_path = os.path.join(file_server_root, folder)
+            if os.path.isdir(folder_path):
+                tar.add(folder_path, arcname='{0}/{1}'.format(FILES_DIR,
+                                                              folder))
+        # written last, so that incomplete snapshots are not restored
+        _add_json(tar, COUNTS_FILE, counts)
+    return counts
+
+
+def _verify_empty(sm):
+    if sm.blueprints_list(include=['id']) or \
+            sm.deployments_list(include=['id']):
+        raise manager_exceptions.ConflictError(
+            'Snapshots can only be restored into a manager with no '
+            'blueprints or deployments')
+
+
+def _file_path(member):
+    path = member.name[len(FILES_DIR) + 1:]
+    if not path or os.path.isabs(path) or \
+            '..' in path.split('/') or \
+            not (member.isfile() or member.isdir()):
+        raise ValueError('Invalid snapshot file: {0}'.format(member.name))
+    return path
+
+
+def _doc_keys(docs):
+    # the fields identifying (and routing) the documents, which is all
+    # that is kept of imported documents for rolling them back
+    return [dict((field, doc[field]) for field in ('id', 'deployment_id')
+                 if field in doc)
+            for doc in docs]
+
+
+class _ImportWorkers(object):
+    """
+    Threads importing batches of documents, each in a single bulk write.
+    """
+
+    def __init__(self, sm, workers):
+        self._sm = sm
+        self._queue = Queue.Queue(workers * 2)
+        self.errors = []
+        # the keys of the imported documents, by storage type
+        self.imported = dict((storage_type, []) for storage_type in
+                             STORAGE_TYPES)
+        self._threads = [threading.Thread(target=self._work,
+                                          name='snapshot-import-{0}'.format(i))
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def put(self, storage_type, docs):
+        self._queue.put((storage_type, docs))
+
+    def join(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            if self.errors:
+                # the restore failed, the remaining batches are skipped
+                continue
+            storage_type, docs = batch
+            try:
+                self._sm.import_docs(storage_type, docs)
+                self.imported[storage_type].extend(_doc_keys(docs))
+            except manager_exceptions.ConflictError:
+                if storage_type != PROVIDER_CONTEXT:
+                    self.errors.append(sys.exc_info())
+                    continue
+                logger.warning('Not restoring the provider context: the '
+                               'manager has a provider context')
+            except Exception:
+                self.errors.append(sys.exc_info())
+
+
+def restore_snapshot(sm, fileobj, file_server_root,
+                     workers=DEFAULT_WORKERS):
+    """
+    Restores a snapshot into a manager with no blueprints or deployments.
+    The provider context is restored unless the manager has one. A failed
+    restore is rolled back.
+
+    :param sm: The storage manager to write the documents to.
+    :param fileobj: The file object the snapshot is read from.
+    :param file_server_root: The root directory of the file server.
+    :param workers: The number of batches of documents written in parallel.
+    :return: the number of documents of each storage type restored.
+    """
+    _verify_empty(sm)
+    counts = dict((storage_type, 0) for storage_type in STORAGE_TYPES)
+    expected_counts = None
+    extracted = []
+    import_workers = _ImportWorkers(sm, workers)
+    try:
+        try:
+            with tarfile.open(fileobj=fileobj, mode='r|gz') as tar:
+                for member in tar:
+                    if import_workers.errors:
+                        break
+                    parts = member.name.split('/')
+                    if member.name == METADATA_FILE:
+                        _verify_metadata(json.load(tar.extractfile(member)))
+                    elif parts[0] == STORAGE_DIR and member.isfile():
+                        storage_type = parts[1]
+                        if storage_type not in counts:
+                            raise ValueError(
+                                'Unknown storage type: {0}'.format(
+                                    storage_type))
+                        docs = json.load(tar.extractfile(member))
+                        counts[storage_type] += len(docs)
+                        import_workers.put(storage_type, docs)
+                    elif parts[0] == FILES_DIR and len(parts) > 1:
+                        member.name = _file_path(member)
+                        path = os.path.join(file_server_root, member.name)
+                        if not os.path.lexists(path):
+                            extracted.append(path)
+                        tar.extract(member, file_server_root)
+                    elif member.name == COUNTS_FILE:
+                        expected_counts = json.load(tar.extractfile(member))
+        finally:
+            import_workers.join()
+        if import_workers.errors:
+            exc_type, exc_value, exc_traceback = import_workers.errors[0]
+            raise exc_type, exc_value, exc_traceback
+        if expected_counts is None:
+            raise ValueError('Incomplete snapshot: read {0}'.format(counts))
+        if expected_counts != counts:
+            raise ValueError('Incomplete snapshot: expected {0}, read {1}'
+                             .format(expected_counts, counts))
+    except Exception:
+        exc_info = sys.exc_info()
+        logger.error('Restoring the snapshot failed, rolling it back')
+        try:
+            _roll_back(sm, import_workers.imported, extracted)
+        except Exception:
+            logger.exception('Failed rolling back the snapshot restore')
+        raise exc_info[0], exc_info[1], exc_info[2]
+    # a single refresh, rather than one per written batch
+    sm.refresh()
+    return counts
+
+
+def _verify_metadata(metadata):
+    if metadata['snapshot_version'] != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError('Unsupported snapshot version: {0}'.format(
+            metadata['snapshot_version']))
+    logger.info('Restoring a snapshot of manager {0}, created at {1}'.format(
+        metadata['manager_version'], metadata['created_at']))
+
+
+def _roll_back(sm, imported, extracted):
+    """
+    Deletes the restored documents, and the restored files and
+    directories which did not exist before.
+    """
+    for storage_type in reversed(STORAGE_TYPES):
+        docs = imported[storage_type]
+        if docs:
+            logger.info('Deleting {0} restored {1}'.format(
+                len(docs), storage_type))
+            sm.delete_docs(storage_type, docs)
+    sm.refresh()
+    # directories are extracted before their contents
+    for path in reversed(extracted):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.lexists(path):
+            os.remove(path)
+
+
+def _load_configuration(config_path):
+    obj_conf = config.instance()
+    with open(config_path) as f:
+        yaml_conf = yaml.load(f.read())
+    for key, value in yaml_conf.iteritems():
+        if hasattr(obj_conf, key):
+            setattr(obj_conf, key, value)
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description='Create or restore a snapshot of the manager')
+    parser.add_argument('--config',
+                        default=os.environ.get('MANAGER_REST_CONFIG_PATH'),
+                        help='rest service configuration file (default: '
+                             '$MANAGER_REST_CONFIG_PATH)')
+    subparsers = parser.add_subparsers(dest='command')
+    create_parser = subparsers.add_parser('create', help='create a snapshot')
+    create_parser.add_argument('path',
+                               help='snapshot file to write ("-" for '
+                                    'stdout)')
+    create_parser.add_argument('--batch-size', type=int,
+                               default=DEFAULT_BATCH_SIZE,
+                               help='number of documents read at once')
+    restore_parser = subparsers.add_parser(
+        'restore', help='restore a snapshot into a manager with no '
+                        'blueprints or deployments')
+    restore_parser.add_argument('path',
+                                help='snapshot file to read ("-" for stdin)')
+    restore_parser.add_argument('--workers', type=int,
+                                default=DEFAULT_WORKERS,
+                                help='number of batches of documents '
+                                     'written in parallel')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = parse_arguments(argv if argv is not None else sys.argv[1:])
+    if args.config:
+        _load_configuration(args.config)
+    sm = storage_manager.instance()
+    file_server_root = config.instance().file_server_root
+
+    if args.command == 'create':
+        if args.path == '-':
+            counts = create_snapshot(sm, sys.stdout, file_server_root,
+                                     blueprints_folders(), args.batch_size)
+        else:
+            with open(args.path, 'wb') as f:
+                counts = create_snapshot(sm, f, file_server_root,
+                                         blueprints_folders(),
+                                         args.batch_size)
+    else:
+        if args.path == '-':
+            counts = restore_snapshot(sm, sys.stdin, file_server_root,
+                                      args.workers)
+        else:
+            with open(args.path, 'rb') as f:
+                counts = restore_snapshot(sm, f, file_server_root,
+                                          args.workers)
+    for storage_type in STORAGE_TYPES:
+        logger.info('{0}: {1}'.format(storage_type, counts[storage_type]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,573 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import json
+import sqlite3
+import threading
+import contextlib
+
+from manager_rest import config
+from manager_rest import manager_exceptions
+from manager_rest.models import LazyJson, Execution
+from manager_rest.memory_storage_manager import (MODELS,
+                                                 TYPE_NAMES,
+                                                 NODES,
+                                                 NODE_INSTANCES,
+                                                 BLUEPRINTS,
+                                                 DEPLOYMENTS,
+                                                 DEPLOYMENT_MODIFICATIONS,
+                                                 EXECUTIONS,
+                                                 PROVIDER_CONTEXT,
+                                                 PROVIDER_CONTEXT_ID,
+                                                 storage_doc_id)
+
+STORAGE_FILE_PATH = '/tmp/manager-rest-tests-storage.db'
+
+# columns which are stored as plain text (so they may be indexed and
+# queried); every other field is stored as a json column
+PLAIN_COLUMNS = {
+    NODES: ('id', 'deployment_id', 'blueprint_id'),
+    NODE_INSTANCES: ('id', 'deployment_id', 'node_id'),
+    BLUEPRINTS: ('id',),
+    DEPLOYMENTS: ('id', 'blueprint_id', 'environment_status'),
+    DEPLOYMENT_MODIFICATIONS: ('id', 'deployment_id', 'status'),
+    EXECUTIONS: ('id', 'deployment_id', 'blueprint_id', 'status'),
+    PROVIDER_CONTEXT: (),
+}
+
+INDEXES = {
+    NODES: [('deployment_id',)],
+    NODE_INSTANCES: [('deployment_id', 'node_id')],
+    DEPLOYMENTS: [('blueprint_id',)],
+    DEPLOYMENT_MODIFICATIONS: [('deployment_id', 'status')],
+    EXECUTIONS: [('deployment_id', 'status'), ('status',)],
+}
+
+STORAGE_ID = 'storage_id'
+
+
+def _quote(column):
+    return '"{0}"'.format(column)
+
+
+class SQLiteStorageManager(object):
+    """
+    SQLite based storage manager.
+
+    Every storage type is kept in its own table, one column per model
+    field. Lookup fields are stored as plain indexed columns, while the
+    rest (e.g. plan, runtime_properties) are stored as json. The database
+    runs in WAL mode so readers are not blocked by a writer; each thread
+    uses its own connection.
+    """
+
+    def __init__(self, db_path):
+        self._db_path = db_path
+        self._local = threading.local()
+        with self.transaction() as conn:
+            for storage_type in MODELS:
+                self._create_table(conn, storage_type)
+
+    @property
+    def _connection(self):
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            # transactions are managed explicitly, see transaction()
+            conn = sqlite3.connect(self._db_path,
+                                   timeout=30,
+                                   isolation_level=None)
+            # plain strings; saves decoding (and memory) for lazy fields
+            conn.text_factory = str
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = conn
+            self._local.depth = 0
+        return conn
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Runs the enclosed storage operations in a single transaction.
+        Nested transactions join the outermost one.
+        """
+        conn = self._connection
+        if self._local.depth == 0:
+            conn.execute('BEGIN IMMEDIATE')
+        self._local.depth += 1
+        try:
+            yield conn
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                conn.rollback()
+            raise
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            conn.commit()
+
+    @staticmethod
+    def _columns(storage_type):
+        return sorted(MODELS[storage_type].fields)
+
+    def _create_table(self, conn, storage_type):
+        columns = ['{0} TEXT PRIMARY KEY'.format(STORAGE_ID)] + \
+                  ['{0} TEXT'.format(_quote(column))
+                   for column in self._columns(storage_type)]
+        conn.execute('CREATE TABLE IF NOT EXISTS {0} ({1})'.format(
+            storage_type, ', '.join(columns)))
+        # fields added to a model after its table was created
+        existing = set(row[1] for row in conn.execute(
+            'PRAGMA table_info({0})'.format(storage_type)))
+        for column in self._columns(storage_type):
+            if column not in existing:
+                conn.execute('ALTER TABLE {0} ADD COLUMN {1} TEXT'.format(
+                    storage_type, _quote(column)))
+        for index_columns in INDEXES.get(storage_type, []):
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ({2})'.format(
+                    storage_type,
+                    '_'.join(index_columns),
+                    ', '.join(_quote(column) for column in index_columns)))
+
+    @staticmethod
+    def _serialize(storage_type, field, value):
+        if field in PLAIN_COLUMNS[storage_type]:
+            return value
+        return json.dumps(value)
+
+    @staticmethod
+    def _deserialize(storage_type, field, value):
+        if field in PLAIN_COLUMNS[storage_type] or value is None:
+            return value
+        if field in MODELS[storage_type].lazy_fields:
+            return LazyJson(value)
+        return json.loads(value)
+
+    def _select(self, storage_type, include=None, where=None):
+        columns = [column for column in self._columns(storage_type)
+                   if not include or column in include]
+        query = 'SELECT {0} FROM {1}'.format(
+            ', '.join(_quote(column) for column in columns), storage_type)
+        params = []
+        if where:
+            query += ' WHERE {0}'.format(' AND '.join(
+                '{0} = ?'.format(_quote(column)) for column in where))
+            params = where.values()
+        query += ' ORDER BY rowid'
+        rows = self._connection.execute(query, params).fetchall()
+        model_class = MODELS[storage_type]
+        result = []
+        for row in rows:
+            doc = dict.fromkeys(model_class.fields)
+            doc.update(
+                (column, self._deserialize(storage_type, column, value))
+                for column, value in zip(columns, row))
+            result.append(model_class(**doc))
+        return result
+
+    def _list(self, storage_type, include=None, **filters):
+        where = {field: value for field, value in filters.iteritems()
+                 if value is not None}
+        return self._select(storage_type, include, where)
+
+    def _summarize(self, storage_type, group_by, **filters):
+        where = {field: value for field, value in filters.iteritems()
+                 if value is not None}
+        columns = ', '.join(_quote(column) for column in group_by)
+        query = 'SELECT {0}, COUNT(*) FROM {1}'.format(columns, storage_type)
+        if where:
+            query += ' WHERE {0}'.format(' AND '.join(
+                '{0} = ?'.format(_quote(column)) for column in where))
+        query += ' GROUP BY {0}'.format(columns)
+        rows = self._connection.execute(query, where.values()).fetchall()
+        result = []
+        for row in rows:
+            key = [self._deserialize(storage_type, column, value)
+                   for column, value in zip(group_by, row)]
+            # as with elasticsearch terms aggregations, documents missing
+            # a field are not counted
+            if None not in key:
+                result.append(dict(zip(group_by, key), count=row[-1]))
+        return result
+
+    def _count(self, storage_type, ids_limit=0, exclude=None, **filters):
+        conditions = []
+        params = []
+        for field, value in filters.iteritems():
+            if value is not None:
+                conditions.append('{0} = ?'.format(_quote(field)))
+                params.append(self._serialize(storage_type, field, value))
+        for field, values in (exclude or {}).iteritems():
+            if values:
+                conditions.append('({0} IS NULL OR {0} NOT IN ({1}))'.format(
+                    _quote(field), ', '.join('?' * len(values))))
+                params.extend(self._serialize(storage_type, field, value)
+                              for value in values)
+        where = ''
+        if conditions:
+            where = ' WHERE {0}'.format(' AND '.join(conditions))
+        conn = self._connection
+        count = conn.execute('SELECT COUNT(*) FROM {0}{1}'.format(
+            storage_type, where), params).fetchone()[0]
+        ids = []
+        if count and ids_limit:
+            ids = [row[0] for row in conn.execute(
+                'SELECT "id" FROM {0}{1} ORDER BY rowid LIMIT ?'.format(
+                    storage_type, where), params + [ids_limit])]
+        return count, ids
+
+    def _get(self, storage_type, doc_id, include=None):
+        result = self._select(storage_type, include, {STORAGE_ID: doc_id})
+        if not result:
+            raise manager_exceptions.NotFoundError(
+                '{0} {1} not found'.format(TYPE_NAMES[storage_type], doc_id))
+        return result[0]
+
+    def _put(self, storage_type, doc_id, obj):
+        doc = obj.to_dict()
+        columns = self._columns(storage_type)
+        values = [str(doc_id)] + [
+            self._serialize(storage_type, column, doc[column])
+            for column in columns]
+        try:
+            with self.transaction() as conn:
+                conn.execute(
+                    'INSERT INTO {0} ({1}) VALUES ({2})'.format(
+                        storage_type,
+                        ', '.join([STORAGE_ID] + map(_quote, columns)),
+                        ', '.join('?' * len(values))),
+                    values)
+        except sqlite3.IntegrityError:
+            raise manager_exceptions.ConflictError(
+                '{0} {1} already exists'.format(TYPE_NAMES[storage_type],
+                                                doc_id))
+
+    def _update(self, storage_type, doc_id, **fields):
+        fields = {field: value for field, value in fields.iteritems()
+                  if value is not None}
+        with self.transaction() as conn:
+            if fields:
+                cursor = conn.execute(
+                    'UPDATE {0} SET {1} WHERE {2} = ?'.format(
+                        storage_type,
+                        ', '.join('{0} = ?'.format(_quote(field))
+                                  for field in fields),
+                        STORAGE_ID),
+                    [self._serialize(storage_type, field, value)
+                     for field, value in fields.iteritems()] + [doc_id])
+                found = cursor.rowcount > 0
+            else:
+                found = conn.execute(
+                    'SELECT 1 FROM {0} WHERE {1} = ?'.format(
+                        storage_type, STORAGE_ID),
+                    [doc_id]).fetchone() is not None
+        if not found:
+            raise manager_exceptions.NotFoundError(
+                '{0} {1} not found'.format(TYPE_NAMES[storage_type], doc_id))
+
+    def _delete(self, storage_type, doc_id):
+        with self.transaction() as conn:
+            obj = self._get(storage_type, doc_id)
+            conn.execute('DELETE FROM {0} WHERE {1} = ?'.format(
+                storage_type, STORAGE_ID), [doc_id])
+        return obj
+
+    def node_instances_list(self, include=None):
+        return self._list(NODE_INSTANCES, include=include)
+
+    def get_node_instance(self, node_instance_id, include=None):
+        return self._get(NODE_INSTANCES, node_instance_id, include)
+
+    def get_node_instances(self, deployment_id, node_id=None, include=None):
+        return self._list(NODE_INSTANCES, include=include,
+                          deployment_id=deployment_id,
+                          node_id=node_id)
+
+    def get_nodes(self, deployment_id=None, include=None):
+        return self._list(NODES, include=include,
+                          deployment_id=deployment_id)
+
+    def get_node(self, deployment_id, node_id, include=None):
+        return self._get(NODES,
+                         self._storage_node_id(deployment_id, node_id),
+                         include)
+
+    def put_node(self, node):
+        self._put(NODES,
+                  self._storage_node_id(node.deployment_id, node.id),
+                  node)
+        return 1
+
+    def put_node_instance(self, node_instance):
+        self._put(NODE_INSTANCES, node_instance.id, node_instance)
+        return 1
+
+    def update_execution_status(self, execution_id, status, error):
+        with self.transaction() as conn:
+            self._update(EXECUTIONS, execution_id, status=status,
+                         error=error)
+            self._update_environment_status(conn, execution_id, status,
+                                            error)
+
+    def _update_environment_status(self, conn, execution_id, status, error):
+        workflow_id, deployment_id = conn.execute(
+            'SELECT "workflow_id", "deployment_id" FROM {0} '
+            'WHERE {1} = ?'.format(EXECUTIONS, STORAGE_ID),
+            [execution_id]).fetchone()
+        workflow_id = self._deserialize(EXECUTIONS, 'workflow_id',
+                                        workflow_id)
+        if workflow_id == Execution.CREATE_DEPLOYMENT_ENVIRONMENT:
+            conn.execute(
+                'UPDATE {0} SET "environment_status" = ?, '
+                '"environment_error" = ? WHERE {1} = ?'.format(
+                    DEPLOYMENTS, STORAGE_ID),
+                [self._serialize(DEPLOYMENTS, 'environment_status',
+                                 status),
+                 self._serialize(DEPLOYMENTS, 'environment_error',
+                                 error),
+                 deployment_id])
+
+    def update_executions_status(self, updates):
+        end_states = [self._serialize(EXECUTIONS, 'status', status)
+                      for status in Execution.END_STATES]
+        with self.transaction() as conn:
+            for execution_id, status, error in updates:
+                cursor = conn.execute(
+                    'UPDATE {0} SET "status" = ?, '
+                    '"error" = COALESCE(?, "error") '
+                    'WHERE {1} = ? AND "status" NOT IN ({2})'.format(
+                        EXECUTIONS, STORAGE_ID,
+                        ', '.join('?' * len(end_states))),
+                    [self._serialize(EXECUTIONS, 'status', status),
+                     None if error is None else
+                     self._serialize(EXECUTIONS, 'error', error),
+                     execution_id] + end_states)
+                if cursor.rowcount > 0:
+                    self._update_environment_status(conn, execution_id,
+                                                    status, error)
+
+    def transition_execution_status(self, execution_id, from_status,
+                                    to_status):
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE {0} SET "status" = ? WHERE {1} = ? AND '
+                '"status" = ?'.format(EXECUTIONS, STORAGE_ID),
+                [self._serialize(EXECUTIONS, 'status', to_status),
+                 execution_id,
+                 self._serialize(EXECUTIONS, 'status', from_status)])
+            if cursor.rowcount > 0:
+                return True
+        # raises if the execution does not exist
+        self._get(EXECUTIONS, execution_id, include=['id'])
+        return False
+
+    def update_node(self, deployment_id, node_id,
+                    number_of_instances=None,
+                    planned_number_of_instances=None):
+        self._update(NODES,
+                     self._storage_node_id(deployment_id, node_id),
+                     number_of_instances=number_of_instances,
+                     planned_number_of_instances=planned_number_of_instances)
+
+    def update_node_instance(self, node):
+        self._update(NODE_INSTANCES, node.id,
+                     state=node.state,
+                     runtime_properties=node.runtime_properties,
+                     relationships=node.relationships)
+
+    def node_instances_summary(self, group_by, deployment_id=None):
+        return self._summarize(NODE_INSTANCES, group_by,
+                               deployment_id=deployment_id)
+
+    def executions_summary(self, group_by, deployment_id=None):
+        return self._summarize(EXECUTIONS, group_by,
+                               deployment_id=deployment_id)
+
+    def node_instances_count(self, deployment_id=None,
+                             exclude_states=None, ids_limit=0):
+        return self._count(NODE_INSTANCES, ids_limit,
+                           exclude={'state': exclude_states},
+                           deployment_id=deployment_id)
+
+    def executions_count(self, deployment_id=None, status=None,
+                         exclude_statuses=None, ids_limit=0):
+        return self._count(EXECUTIONS, ids_limit,
+                           exclude={'status': exclude_statuses},
+                           deployment_id=deployment_id,
+                           status=status)
+
+    def deployments_count(self, blueprint_id=None, ids_limit=0):
+        return self._count(DEPLOYMENTS, ids_limit,
+                           blueprint_id=blueprint_id)
+
+    def deployment_modifications_count(self, deployment_id=None,
+                                       status=None, ids_limit=0):
+        return self._count(DEPLOYMENT_MODIFICATIONS, ids_limit,
+                           deployment_id=deployment_id,
+                           status=status)
+
+    def blueprints_list(self, include=None):
+        return self._list(BLUEPRINTS, include=include)
+
+    def deployments_list(self, include=None):
+        return self._list(DEPLOYMENTS, include=include)
+
+    def executions_list(self, deployment_id=None, include=None,
+                        status=None):
+        return self._list(EXECUTIONS, include=include,
+                          deployment_id=deployment_id,
+                          status=status)
+
+    def get_blueprint_deployments(self, blueprint_id, include=None):
+        return self._list(DEPLOYMENTS, include=include,
+                          blueprint_id=blueprint_id)
+
+    def get_blueprint(self, blueprint_id, include=None):
+        return self._get(BLUEPRINTS, blueprint_id, include)
+
+    def get_deployment(self, deployment_id, include=None):
+        return self._get(DEPLOYMENTS, deployment_id, include)
+
+    def get_execution(self, execution_id, include=None):
+        return self._get(EXECUTIONS, execution_id, include)
+
+    def put_blueprint(self, blueprint_id, blueprint):
+        self._put(BLUEPRINTS, blueprint_id, blueprint)
+
+    def put_deployment(self, deployment_id, deployment):
+        self._put(DEPLOYMENTS, deployment_id, deployment)
+
+    def put_execution(self, execution_id, execution):
+        self._put(EXECUTIONS, execution_id, execution)
+
+    def delete_blueprint(self, blueprint_id):
+        return self._delete(BLUEPRINTS, blueprint_id)
+
+    def delete_deployment(self, deployment_id):
+        with self.transaction() as conn:
+            deployment = self._get(DEPLOYMENTS, deployment_id)
+            for storage_type in (NODE_INSTANCES, NODES, EXECUTIONS,
+                                 DEPLOYMENT_MODIFICATIONS):
+                conn.execute('DELETE FROM {0} WHERE "deployment_id" = ?'
+                             .format(storage_type), [deployment_id])
+            conn.execute('DELETE FROM {0} WHERE {1} = ?'.format(
+                DEPLOYMENTS, STORAGE_ID), [deployment_id])
+        return deployment
+
+    def delete_execution(self, execution_id):
+        return self._delete(EXECUTIONS, execution_id)
+
+    def delete_node(self, node_id):
+        return self._delete(NODES, node_id)
+
+    def delete_node_instance(self, node_instance_id):
+        return self._delete(NODE_INSTANCES, node_instance_id)
+
+    def put_provider_context(self, provider_context):
+        try:
+            self._put(PROVIDER_CONTEXT, PROVIDER_CONTEXT_ID, provider_context)
+        except manager_exceptions.ConflictError:
+            raise manager_exceptions.ConflictError(
+                'Provider context already set')
+
+    def update_provider_context(self, provider_context):
+        try:
+            self._update(PROVIDER_CONTEXT, PROVIDER_CONTEXT_ID,
+                         **provider_context.to_dict())
+        except manager_exceptions.NotFoundError:
+            raise manager_exceptions.NotFoundError(
+                'Provider Context not found')
+
+    def get_provider_context(self, include=None):
+        try:
+            return self._get(PROVIDER_CONTEXT, PROVIDER_CONTEXT_ID, include)
+        except manager_exceptions.NotFoundError:
+            raise manager_exceptions.NotFoundError('Provider context not set')
+
+    def put_deployment_modification(self, modification_id, modification):
+        self._put(DEPLOYMENT_MODIFICATIONS, modification_id, modification)
+
+    def get_deployment_modification(self, modification_id, include=None):
+        return self._get(DEPLOYMENT_MODIFICATIONS, modification_id, include)
+
+    def update_deployment_modification(self, modification):
+        self._update(DEPLOYMENT_MODIFICATIONS, modification.id,
+                     status=modification.status,
+                     ended_at=modification.ended_at,
+                     node_instances=modification.node_instances)
+
+    def deployment_modifications_list(self, deployment_id=None, include=None):
+        return self._list(DEPLOYMENT_MODIFICATIONS, include=include,
+                          deployment_id=deployment_id)
+
+    @staticmethod
+    def _storage_node_id(deployment_id, node_id):
+        return '{0}_{1}'.format(deployment_id, node_id)
+
+    def export_docs(self, storage_type, batch_size):
+        columns = self._columns(storage_type)
+        # the rows of a single query are read in batches; with the
+        # write-ahead log, the query reads a consistent state without
+        # blocking writers
+        cursor = self._connection.execute(
+            'SELECT {0} FROM {1} ORDER BY rowid'.format(
+                ', '.join(map(_quote, columns)), storage_type))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield [{column: value if column in PLAIN_COLUMNS[storage_type] or
+                    value is None else json.loads(value)
+                    for column, value in zip(columns, row)}
+                   for row in rows]
+
+    def import_docs(self, storage_type, docs):
+        columns = self._columns(storage_type)
+        try:
+            with self.transaction() as conn:
+                conn.executemany(
+                    'INSERT INTO {0} ({1}) VALUES ({2})'.format(
+                        storage_type,
+                        ', '.join([STORAGE_ID] + map(_quote, columns)),
+                        ', '.join('?' * (len(columns) + 1))),
+                    ([storage_doc_id(storage_type, doc)] +
+                     [self._serialize(storage_type, column, doc.get(column))
+                      for column in columns]
+                     for doc in docs))
+        except sqlite3.IntegrityError:
+            raise manager_exceptions.ConflictError(
+                '{0}s already exist'.format(TYPE_NAMES[storage_type]))
+
+    def delete_docs(self, storage_type, docs):
+        with self.transaction() as conn:
+            conn.executemany(
+                'DELETE FROM {0} WHERE {1} = ?'.format(storage_type,
+                                                       STORAGE_ID),
+                ([storage_doc_id(storage_type, doc)] for doc in docs))
+
+    def refresh(self):
+        # stored documents are visible right away
+        pass
+
+
+def create():
+    db_path = config.instance().sqlite_storage_path
+    if not db_path:
+        db_path = STORAGE_FILE_PATH
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.isfile(db_path + suffix):
+                os.remove(db_path + suffix)
+    return SQLiteStorageManager(db_path)
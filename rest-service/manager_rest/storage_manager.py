@@ -13,37 +13,45 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
+import os
 import imp
 import sys
 from os import path
 
 from flask import g, current_app
 
+from manager_rest import config
 from manager_rest.utils import maybe_register_teardown
 
+# default storage manager module; may be overridden by the
+# 'storage_manager_module_name' configuration property
 # storage_manager_module_name = 'file_storage_manager'
 storage_manager_module_name = 'es_storage_manager'
 
 _instance = None
+# the process which created the instance; storage managers hold
+# connections (and threads) which must not be shared with forked processes
+_instance_pid = None
 
 
 def _create_instance():
+    module_name = config.instance().storage_manager_module_name or \
+        storage_manager_module_name
     paths = sys.path
     paths.append(path.dirname(__file__))
-    return imp.load_module(storage_manager_module_name,
-                           *imp.find_module(
-                               storage_manager_module_name, paths)).create()
+    return imp.load_module(module_name,
+                           *imp.find_module(module_name, paths)).create()
 
 
 def reset():
-    global _instance
+    global _instance, _instance_pid
     _instance = _create_instance()
+    _instance_pid = os.getpid()
 
 
 def instance():
-    global _instance
-    if _instance is None:
-        _instance = _create_instance()
+    if _instance is None or _instance_pid != os.getpid():
+        reset()
     return _instance
 
 
@@ -82,6 +82,10 @@ class MockHTTPClient(HTTPClient):
 
 class BaseServerTestCase(unittest.TestCase):
 
+    # storage manager module used by the tested server; subclasses may
+    # override it in order to run against a different storage backend
+    storage_manager_module_name = STORAGE_MANAGER_MODULE_NAME
+
     def __init__(self, *args, **kwargs):
         super(BaseServerTestCase, self).__init__(*args, **kwargs)
 
@@ -110,7 +114,7 @@ class BaseServerTestCase(unittest.TestCase):
         self.addCleanup(self.cleanup)
         self.file_server.start()
         storage_manager.storage_manager_module_name = \
-            STORAGE_MANAGER_MODULE_NAME
+            self.storage_manager_module_name
 
         # workaround for setting the rest service log path, since it's
         # needed when 'server' module is imported.
@@ -0,0 +1,131 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import json
+import math
+import time
+import contextlib
+
+
+class Measurement(object):
+    """
+    Collects the latencies of the operations executed by a single workload.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self._started_at = None
+        self._elapsed = 0.0
+
+    def start(self):
+        self._started_at = time.time()
+
+    def stop(self):
+        self._elapsed += time.time() - self._started_at
+        self._started_at = None
+
+    @contextlib.contextmanager
+    def operation(self):
+        start = time.time()
+        yield
+        self.latencies.append(time.time() - start)
+
+    def add(self, latency):
+        self.latencies.append(latency)
+
+    @property
+    def elapsed(self):
+        if self._elapsed:
+            return self._elapsed
+        return sum(self.latencies)
+
+    def summary(self):
+        count = len(self.latencies)
+        elapsed = self.elapsed
+        return {
+            'operations': count,
+            'elapsed': elapsed,
+            'throughput': count / elapsed if elapsed else 0.0,
+            'mean': sum(self.latencies) / count if count else 0.0,
+            'p50': percentile(self.latencies, 50),
+            'p99': percentile(self.latencies, 99)
+        }
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of the given values (0.0 for no values).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = int(math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[max(rank, 1) - 1]
+
+
+def save_baseline(results, baseline_path):
+    with open(baseline_path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_baseline(baseline_path):
+    with open(baseline_path) as f:
+        return json.load(f)
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Compares benchmark results to a previously saved baseline.
+
+    :param results: dict of workload name to measurement summary.
+    :param baseline: dict of the same structure as results.
+    :param tolerance: allowed relative degradation (e.g. 0.2 for 20%).
+    :return: list of regression descriptions (empty if there are none).
+    """
+    regressions = []
+    for name, summary in sorted(results.items()):
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if base['throughput'] and summary['throughput'] < \
+                base['throughput'] * (1 - tolerance):
+            regressions.append(
+                '{0}: throughput {1:.2f} ops/sec is below baseline '
+                '{2:.2f} ops/sec'.format(name,
+                                         summary['throughput'],
+                                         base['throughput']))
+        for key in ('p50', 'p99'):
+            if base[key] and summary[key] > base[key] * (1 + tolerance):
+                regressions.append(
+                    '{0}: {1} latency {2:.2f}ms is above baseline '
+                    '{3:.2f}ms'.format(name,
+                                       key,
+                                       summary[key] * 1000,
+                                       base[key] * 1000))
+    return regressions
+
+
+def format_results(results):
+    lines = ['{0:<32}{1:>8}{2:>12}{3:>12}{4:>12}'.format(
+        'workload', 'ops', 'ops/sec', 'p50 (ms)', 'p99 (ms)')]
+    for name, summary in sorted(results.items()):
+        lines.append('{0:<32}{1:>8}{2:>12.2f}{3:>12.2f}{4:>12.2f}'.format(
+            name,
+            summary['operations'],
+            summary['throughput'],
+            summary['p50'] * 1000,
+            summary['p99'] * 1000))
+    return '\n'.join(lines)
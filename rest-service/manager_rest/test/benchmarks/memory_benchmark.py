@@ -0,0 +1,168 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Memory benchmark for listing node instances.
+
+Stores a large number of node instances (with non trivial runtime
+properties) in each storage backend, then measures the time and resident
+memory it takes to list all of them, and the additional memory taken
+once their (lazily decoded) runtime properties are accessed. Every
+backend is measured in a separate process.
+
+Usage example:
+
+    python -m manager_rest.test.benchmarks.memory_benchmark \\
+        --instances 10000 --backend sqlite_storage_manager
+"""
+
+import os
+import gc
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+from manager_rest import models
+from manager_rest.test.benchmarks import storage_benchmark
+
+RUNTIME_PROPERTIES_KEYS = 20
+
+
+def current_rss():
+    """
+    :return: the resident memory of the current process in bytes, or None
+             where /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError):
+        return None
+
+
+def _rss_delta(before, after):
+    if before is None or after is None:
+        return None
+    return after - before
+
+
+def _populate(sm, instances):
+    runtime_properties = {
+        'property_{0}'.format(i): 'value-{0}'.format(i) * 10
+        for i in range(RUNTIME_PROPERTIES_KEYS)}
+    for i in range(instances):
+        sm.put_node_instance(models.DeploymentNodeInstance(
+            id='vm_{0}'.format(i),
+            node_id='vm',
+            deployment_id='deployment-{0}'.format(i % 100),
+            runtime_properties=runtime_properties,
+            state='started',
+            relationships=[{'target_id': 'network', 'type': 'connected_to'}],
+            host_id='vm_{0}'.format(i),
+            version=None))
+
+
+def measure_backend(backend_name, instances):
+    work_dir = tempfile.mkdtemp()
+    try:
+        sm = storage_benchmark.BACKENDS[backend_name](work_dir)
+        _populate(sm, instances)
+        gc.collect()
+
+        rss_before = current_rss()
+        start = time.time()
+        node_instances = sm.node_instances_list()
+        elapsed = time.time() - start
+        rss_listed = current_rss()
+        for node_instance in node_instances:
+            node_instance.runtime_properties
+        rss_accessed = current_rss()
+
+        return {
+            'instances': len(node_instances),
+            'list_time': elapsed,
+            'list_rss': _rss_delta(rss_before, rss_listed),
+            'access_rss': _rss_delta(rss_listed, rss_accessed),
+            'object_size': sys.getsizeof(node_instances[0])
+        }
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def _measure_in_child(backend_name, instances, queue):
+    queue.put(measure_backend(backend_name, instances))
+
+
+def measure(backend_name, instances):
+    """
+    Measures the given backend in a fresh process, so measurements are not
+    affected by memory previously allocated by other backends.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_measure_in_child,
+                                      args=(backend_name, instances, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def _format_mb(value):
+    if value is None:
+        return 'n/a'
+    return '{0:.2f}'.format(value / (1024.0 * 1024))
+
+
+def format_results(results):
+    lines = ['{0:<28}{1:>10}{2:>12}{3:>14}{4:>16}{5:>12}'.format(
+        'backend', 'instances', 'list (ms)', 'list RSS (MB)',
+        'access RSS (MB)', 'object (B)')]
+    for backend_name, result in results:
+        lines.append('{0:<28}{1:>10}{2:>12.2f}{3:>14}{4:>16}{5:>12}'.format(
+            backend_name,
+            result['instances'],
+            result['list_time'] * 1000,
+            _format_mb(result['list_rss']),
+            _format_mb(result['access_rss']),
+            result['object_size']))
+    return '\n'.join(lines)
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description='Measure the memory taken by listing node instances')
+    parser.add_argument('--backend', action='append', dest='backends',
+                        choices=storage_benchmark.BACKENDS.keys(),
+                        help='backend to measure (may be repeated; default: '
+                             'all backends)')
+    parser.add_argument('--instances', type=int, default=10000,
+                        help='number of node instances to list')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv if argv is not None else sys.argv[1:])
+    results = [(backend_name, measure(backend_name, args.instances))
+               for backend_name in
+               args.backends or storage_benchmark.BACKENDS.keys()]
+    print format_results(results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
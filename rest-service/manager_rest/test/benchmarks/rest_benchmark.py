@@ -0,0 +1,379 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+REST service throughput benchmarks.
+
+Drives the rest service through a set of realistic workloads and reports
+throughput and p50/p99 latencies per workload. Executions are handled by
+the MockCeleryClient (the server runs in test mode), so the numbers reflect
+the cost of the rest service and its storage backend only.
+
+Usage example:
+
+    python -m manager_rest.test.benchmarks.rest_benchmark \\
+        --storage file_storage_manager --instances 50 --iterations 100 \\
+        --save-baseline /tmp/rest-baseline.json
+
+    python -m manager_rest.test.benchmarks.rest_benchmark \\
+        --baseline /tmp/rest-baseline.json --tolerance 0.2
+"""
+
+import os
+import sys
+import json
+import shutil
+import urllib
+import tempfile
+import argparse
+import threading
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+from manager_rest import archiving
+from manager_rest.test import base_test
+from manager_rest.test.benchmarks import harness
+
+BENCHMARK_SERVER_PORT = 53230
+
+SCALED_BLUEPRINT_TEMPLATE = """
+tosca_definitions_version: cloudify_dsl_1_0
+
+imports:
+    - hello_world.yaml
+
+node_templates:
+    vm:
+        type: cloudify.nodes.Compute
+        instances:
+            deploy: {0}
+
+    http_web_server:
+        type: cloudify.nodes.WebServer
+        properties:
+            port: 8080
+        relationships:
+            -   type: cloudify.relationships.contained_in
+                target: vm
+"""
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class TestClientTransport(object):
+    """
+    Sends requests through the flask test client (no network involved).
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def request(self, method, path, json_body=None, data=None,
+                query_params=None):
+        kwargs = {
+            'method': method,
+            'query_string': base_test.build_query_string(query_params)
+        }
+        if json_body is not None:
+            kwargs['content_type'] = 'application/json'
+            kwargs['data'] = json.dumps(json_body)
+        elif data is not None:
+            kwargs['data'] = data
+        response = self.client.open(urllib.quote(path), **kwargs)
+        return response.status_code, response.data
+
+
+class HttpTransport(object):
+    """
+    Sends requests over HTTP to a real WSGI server.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self._local = threading.local()
+
+    @property
+    def _session(self):
+        # requests sessions are not thread safe
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def request(self, method, path, json_body=None, data=None,
+                query_params=None):
+        headers = {}
+        if json_body is not None:
+            headers['Content-Type'] = 'application/json'
+            data = json.dumps(json_body)
+        response = self._session.request(method,
+                                         self.base_url + urllib.quote(path),
+                                         data=data,
+                                         params=query_params,
+                                         headers=headers)
+        return response.status_code, response.content
+
+
+class BenchmarkEnvironment(base_test.BaseServerTestCase):
+    """
+    Sets up a rest service (and a file server) exactly like the rest
+    service tests do, for the selected storage backend.
+    """
+
+    def __init__(self, storage_manager_module_name):
+        super(BenchmarkEnvironment, self).__init__('runTest')
+        self.storage_manager_module_name = storage_manager_module_name
+        self._wsgi_server = None
+
+    def runTest(self):
+        pass
+
+    def start(self):
+        self.setUp()
+
+    def stop(self):
+        if self._wsgi_server:
+            self._wsgi_server.shutdown()
+        self.doCleanups()
+
+    def start_wsgi_server(self, port=BENCHMARK_SERVER_PORT):
+        from werkzeug.serving import make_server
+        from manager_rest import server
+        self._wsgi_server = make_server('localhost', port, server.app,
+                                        threaded=True)
+        thread = threading.Thread(target=self._wsgi_server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return 'http://localhost:{0}'.format(port)
+
+    def archive_blueprint_dir(self, blueprint_dir):
+        archive_path = tempfile.mkstemp()[1]
+        archiving.make_targzfile(archive_path, blueprint_dir)
+        try:
+            with open(archive_path) as f:
+                return f.read()
+        finally:
+            os.remove(archive_path)
+
+    def archive_scaled_blueprint(self, instances):
+        source_dir = os.path.join(os.path.dirname(base_test.__file__),
+                                  'mock_blueprint')
+        work_dir = tempfile.mkdtemp()
+        try:
+            blueprint_dir = os.path.join(work_dir, 'scaled_blueprint')
+            shutil.copytree(source_dir, blueprint_dir)
+            with open(os.path.join(blueprint_dir, 'blueprint.yaml'),
+                      'w') as f:
+                f.write(SCALED_BLUEPRINT_TEMPLATE.format(instances))
+            return self.archive_blueprint_dir(blueprint_dir)
+        finally:
+            shutil.rmtree(work_dir)
+
+
+class RestBenchmark(object):
+
+    WORKLOADS = [
+        'blueprint_upload',
+        'deployment_create',
+        'node_instance_patch',
+        'outputs_evaluation',
+        'list_blueprints',
+        'list_deployments',
+        'list_executions',
+        'list_node_instances',
+    ]
+
+    def __init__(self, env, transport, iterations, instances, concurrency):
+        self.env = env
+        self.transport = transport
+        self.iterations = iterations
+        self.instances = instances
+        self.concurrency = concurrency
+
+    def run(self, workloads=None):
+        results = {}
+        for name in workloads or self.WORKLOADS:
+            operations = getattr(self, '_prepare_{0}'.format(name))()
+            results[name] = self._measure(name, operations).summary()
+        return results
+
+    def _measure(self, name, operations):
+        measurement = harness.Measurement(name)
+
+        def timed(operation):
+            with measurement.operation():
+                operation()
+
+        measurement.start()
+        if self.concurrency > 1:
+            pool = ThreadPool(self.concurrency)
+            try:
+                pool.map(timed, operations)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for operation in operations:
+                timed(operation)
+        measurement.stop()
+        return measurement
+
+    def _request(self, expected_status, method, path, **kwargs):
+        status, data = self.transport.request(method, path, **kwargs)
+        if status != expected_status:
+            raise BenchmarkError('{0} {1} returned {2} (expected {3}): {4}'
+                                 .format(method, path, status,
+                                         expected_status, data))
+        return json.loads(data)
+
+    def _operation(self, expected_status, method, path, **kwargs):
+        return lambda: self._request(expected_status, method, path, **kwargs)
+
+    def _prepare_blueprint_upload(self):
+        archive = self.env.archive_blueprint_dir(
+            os.path.join(os.path.dirname(base_test.__file__),
+                         'mock_blueprint'))
+        return [self._operation(201, 'PUT',
+                                '/blueprints/bench-bp-{0}'.format(i),
+                                data=archive)
+                for i in range(self.iterations)]
+
+    def _prepare_deployment_create(self):
+        self._request(201, 'PUT', '/blueprints/bench-scaled',
+                      data=self.env.archive_scaled_blueprint(self.instances))
+        return [self._operation(201, 'PUT',
+                                '/deployments/bench-dep-{0}'.format(i),
+                                json_body={'blueprint_id': 'bench-scaled'})
+                for i in range(self.iterations)]
+
+    def _prepare_node_instance_patch(self):
+        instances = self._request(200, 'GET', '/node-instances',
+                                  query_params={
+                                      'deployment_id': 'bench-dep-0'})
+        instance_ids = [instance['id'] for instance in instances]
+        if not instance_ids:
+            raise BenchmarkError('node_instance_patch requires the '
+                                 'deployment_create workload to run first')
+        operations = []
+        for i in range(self.iterations):
+            instance_id = instance_ids[i % len(instance_ids)]
+            patch = {'state': 'started',
+                     'runtime_properties': {'index': i},
+                     'version': 0}
+            operations.append(self._operation(
+                200, 'PATCH', '/node-instances/{0}'.format(instance_id),
+                json_body=patch))
+        return operations
+
+    def _prepare_outputs_evaluation(self):
+        archive = self.env.archive_blueprint_dir(
+            os.path.join(os.path.dirname(base_test.__file__),
+                         'mock_blueprint'))
+        self._request(201, 'PUT', '/blueprints/bench-outputs',
+                      data=archive,
+                      query_params={'application_file_name':
+                                    'blueprint_with_outputs.yaml'})
+        self._request(201, 'PUT', '/deployments/bench-outputs-dep',
+                      json_body={'blueprint_id': 'bench-outputs'})
+        return [self._operation(200, 'GET',
+                                '/deployments/bench-outputs-dep/outputs')
+                for _ in range(self.iterations)]
+
+    def _list_operations(self, path):
+        return [self._operation(200, 'GET', path)
+                for _ in range(self.iterations)]
+
+    def _prepare_list_blueprints(self):
+        return self._list_operations('/blueprints')
+
+    def _prepare_list_deployments(self):
+        return self._list_operations('/deployments')
+
+    def _prepare_list_executions(self):
+        return self._list_operations('/executions')
+
+    def _prepare_list_node_instances(self):
+        return self._list_operations('/node-instances')
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the rest service throughput and latency')
+    parser.add_argument('--storage', default='file_storage_manager',
+                        help='storage manager module to benchmark against')
+    parser.add_argument('--iterations', type=int, default=50,
+                        help='number of operations per workload')
+    parser.add_argument('--instances', type=int, default=10,
+                        help='number of "vm" node instances per deployment')
+    parser.add_argument('--workload', action='append', dest='workloads',
+                        choices=RestBenchmark.WORKLOADS,
+                        help='workload to run (may be repeated; default: '
+                             'all workloads, in order)')
+    parser.add_argument('--http', action='store_true',
+                        help='drive a real WSGI server over HTTP instead of '
+                             'the flask test client')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='number of concurrent clients (--http only; '
+                             'requires a thread safe storage backend)')
+    parser.add_argument('--save-baseline',
+                        help='save the results as a baseline to this path')
+    parser.add_argument('--baseline',
+                        help='compare the results to the baseline saved at '
+                             'this path; exits with a non-zero code on '
+                             'regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative degradation compared to the '
+                             'baseline (default: 0.2)')
+    args = parser.parse_args(argv)
+    if args.concurrency > 1 and not args.http:
+        parser.error('--concurrency requires --http')
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv if argv is not None else sys.argv[1:])
+
+    env = BenchmarkEnvironment(args.storage)
+    env.start()
+    try:
+        if args.http:
+            transport = HttpTransport(env.start_wsgi_server())
+        else:
+            transport = TestClientTransport(env.app)
+        benchmark = RestBenchmark(env, transport,
+                                  iterations=args.iterations,
+                                  instances=args.instances,
+                                  concurrency=args.concurrency)
+        results = benchmark.run(args.workloads)
+    finally:
+        env.stop()
+
+    print harness.format_results(results)
+    if args.save_baseline:
+        harness.save_baseline(results, args.save_baseline)
+    if args.baseline:
+        regressions = harness.compare_to_baseline(
+            results, harness.load_baseline(args.baseline), args.tolerance)
+        for regression in regressions:
+            print 'REGRESSION: {0}'.format(regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
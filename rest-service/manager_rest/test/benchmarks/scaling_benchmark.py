@@ -0,0 +1,263 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Multi-process serving scalability benchmark.
+
+Serves the rest service with gunicorn (using gunicorn_config.py, i.e.
+preloaded, pre-forked workers) for each of the given numbers of workers,
+and drives a read workload against it from concurrent client processes.
+Reports the throughput per number of workers and the scaling efficiency
+relative to the smallest number of workers (1.0 being linear scaling).
+
+The workers share an sqlite storage file, which is populated beforehand,
+and run in test mode (see rest_benchmark). Clients run in separate
+processes so that they do not become the bottleneck; the machine should
+have more cores than the largest number of workers.
+
+Usage example:
+
+    python -m manager_rest.test.benchmarks.scaling_benchmark \\
+        --workers 1 --workers 2 --workers 4 --clients 16 --requests 4000
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from multiprocessing import Pool
+
+import yaml
+import requests
+
+from manager_rest import config
+from manager_rest.test.benchmarks import harness
+from manager_rest.test.benchmarks import rest_benchmark
+
+BENCHMARK_SERVER_PORT = 53231
+SERVER_START_TIMEOUT = 30
+
+DEPLOYMENT_ID = 'bench-dep-0'
+READ_PATHS = [
+    ('/deployments', None),
+    ('/deployments/{0}'.format(DEPLOYMENT_ID), None),
+    ('/node-instances', {'deployment_id': DEPLOYMENT_ID}),
+    ('/executions', {'deployment_id': DEPLOYMENT_ID}),
+    ('/blueprints/bench-scaled', None),
+]
+
+
+class ScalingEnvironment(rest_benchmark.BenchmarkEnvironment):
+    """
+    Sets up the rest service configuration against an sqlite storage file
+    which outlives the in-process server, so it can be served by gunicorn
+    workers.
+    """
+
+    def __init__(self):
+        super(ScalingEnvironment, self).__init__('sqlite_storage_manager')
+        self.work_dir = tempfile.mkdtemp()
+
+    def create_configuration(self):
+        test_config = super(ScalingEnvironment, self).create_configuration()
+        test_config.storage_manager_module_name = 'sqlite_storage_manager'
+        test_config.sqlite_storage_path = os.path.join(self.work_dir,
+                                                       'storage.db')
+        test_config.rest_service_log_level = 'INFO'
+        test_config.rest_service_log_file_size_MB = 100
+        return test_config
+
+    def write_configuration(self):
+        """
+        :return: path of a yaml file holding the current configuration.
+        """
+        cfy_config = config.instance()
+        properties = dict(
+            (name, getattr(cfy_config, name))
+            for name, value in vars(config.Config).items()
+            if isinstance(value, property))
+        path = os.path.join(self.work_dir, 'manager-rest.yaml')
+        with open(path, 'w') as f:
+            yaml.safe_dump(properties, f)
+        return path
+
+
+class GunicornServer(object):
+
+    def __init__(self, workers, config_path, port=BENCHMARK_SERVER_PORT):
+        self.workers = workers
+        self.config_path = config_path
+        self.port = port
+        self.base_url = 'http://localhost:{0}'.format(port)
+        self.process = None
+
+    def start(self):
+        manager_rest_dir = os.path.dirname(os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__))))
+        env = os.environ.copy()
+        env['MANAGER_REST_CONFIG_PATH'] = self.config_path
+        self.process = subprocess.Popen(
+            [os.path.join(os.path.dirname(sys.executable), 'gunicorn'),
+             '-c', 'gunicorn_config.py',
+             '-w', str(self.workers),
+             '-b', 'localhost:{0}'.format(self.port),
+             'server:app'],
+            env=env,
+            cwd=manager_rest_dir)
+        deadline = time.time() + SERVER_START_TIMEOUT
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise rest_benchmark.BenchmarkError(
+                    'gunicorn exited with code {0}'.format(
+                        self.process.returncode))
+            try:
+                requests.get(self.base_url + '/blueprints')
+                return
+            except requests.ConnectionError:
+                time.sleep(0.2)
+        self.stop()
+        raise rest_benchmark.BenchmarkError('gunicorn did not start within '
+                                            '{0} seconds'.format(
+                                                SERVER_START_TIMEOUT))
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+
+
+def _run_client(args):
+    """
+    Issues the given number of read requests (in a client process).
+
+    :return: the latencies of the requests.
+    """
+    base_url, count, offset = args
+    session = requests.Session()
+    latencies = []
+    for i in range(count):
+        path, params = READ_PATHS[(offset + i) % len(READ_PATHS)]
+        start = time.time()
+        response = session.get(base_url + path, params=params)
+        latencies.append(time.time() - start)
+        if response.status_code != 200:
+            raise rest_benchmark.BenchmarkError(
+                'GET {0} returned {1}: {2}'.format(path,
+                                                   response.status_code,
+                                                   response.content))
+    return latencies
+
+
+def measure(base_url, clients, total_requests):
+    measurement = harness.Measurement('read')
+    per_client = total_requests // clients
+    pool = Pool(clients)
+    try:
+        # warm up every worker (and its connections) before measuring
+        pool.map(_run_client, [(base_url, len(READ_PATHS), c)
+                               for c in range(clients)])
+        measurement.start()
+        results = pool.map(_run_client, [(base_url, per_client, c)
+                                         for c in range(clients)])
+        measurement.stop()
+    finally:
+        pool.close()
+        pool.join()
+    for latencies in results:
+        for latency in latencies:
+            measurement.add(latency)
+    return measurement.summary()
+
+
+def scaling_efficiency(results):
+    """
+    :param results: dict of number of workers to measurement summary.
+    :return: dict of number of workers to its throughput per worker,
+             relative to that of the smallest number of workers.
+    """
+    base_workers = min(results)
+    base = results[base_workers]['throughput'] / base_workers
+    return dict((workers, summary['throughput'] / workers / base
+                 if base else 0.0)
+                for workers, summary in results.items())
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the rest service throughput scaling with the '
+                    'number of pre-forked workers')
+    parser.add_argument('--workers', action='append', type=int,
+                        help='number of workers to serve with (may be '
+                             'repeated; default: 1, 2 and 4)')
+    parser.add_argument('--clients', type=int, default=16,
+                        help='number of concurrent client processes')
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='number of requests per number of workers')
+    parser.add_argument('--deployments', type=int, default=10,
+                        help='number of deployments to populate the '
+                             'storage with')
+    parser.add_argument('--instances', type=int, default=10,
+                        help='number of "vm" node instances per deployment')
+    parser.add_argument('--min-efficiency', type=float,
+                        help='exit with a non-zero code if the scaling '
+                             'efficiency of any number of workers is below '
+                             'this value (e.g. 0.8)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv if argv is not None else sys.argv[1:])
+    worker_counts = sorted(set(args.workers or [1, 2, 4]))
+
+    env = ScalingEnvironment()
+    env.start()
+    try:
+        rest_benchmark.RestBenchmark(
+            env, rest_benchmark.TestClientTransport(env.app),
+            iterations=args.deployments,
+            instances=args.instances,
+            concurrency=1).run(['deployment_create'])
+        config_path = env.write_configuration()
+
+        results = {}
+        for workers in worker_counts:
+            server = GunicornServer(workers, config_path)
+            server.start()
+            try:
+                results[workers] = measure(server.base_url, args.clients,
+                                           args.requests)
+            finally:
+                server.stop()
+    finally:
+        env.stop()
+        shutil.rmtree(env.work_dir)
+
+    print harness.format_results(dict(
+        ('workers-{0}'.format(workers), summary)
+        for workers, summary in results.items()))
+    failed = False
+    for workers, efficiency in sorted(scaling_efficiency(results).items()):
+        print 'workers-{0} scaling efficiency: {1:.2f}'.format(workers,
+                                                               efficiency)
+        if args.min_efficiency and efficiency < args.min_efficiency:
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
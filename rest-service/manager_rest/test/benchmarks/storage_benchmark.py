@@ -0,0 +1,435 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Storage backend conformance and performance harness.
+
+Runs an identical scripted workload (create deployments, patch node
+instances, modify deployments, list, delete) directly against every
+registered storage backend, verifies all backends return the same
+results and reports ops/sec and p50/p99 latencies per storage method.
+Elasticsearch is replaced by an in-process stand-in, so the harness runs
+offline.
+
+Usage example:
+
+    python -m manager_rest.test.benchmarks.storage_benchmark \\
+        --deployments 20 --instances 50
+
+    python -m manager_rest.test.benchmarks.storage_benchmark \\
+        --backend sqlite_storage_manager --save-baseline /tmp/sqlite.json
+"""
+
+import sys
+import json
+import time
+import types
+import shutil
+import os.path
+import argparse
+import tempfile
+from collections import OrderedDict
+
+from manager_rest import models
+from manager_rest import manager_exceptions
+from manager_rest import snapshots
+from manager_rest.file_storage_manager import FileStorageManager
+from manager_rest.memory_storage_manager import MemoryStorageManager
+from manager_rest.sqlite_storage_manager import SQLiteStorageManager
+from manager_rest.test import mocks
+from manager_rest.test.benchmarks import harness
+
+# registered storage backends; each factory gets a scratch directory and
+# returns a fresh (empty) storage manager
+BACKENDS = OrderedDict([
+    ('memory_storage_manager',
+     lambda work_dir: MemoryStorageManager()),
+    ('file_storage_manager',
+     lambda work_dir: FileStorageManager(
+         os.path.join(work_dir, 'storage.json'))),
+    ('sqlite_storage_manager',
+     lambda work_dir: SQLiteStorageManager(
+         os.path.join(work_dir, 'storage.db'))),
+    ('es_storage_manager',
+     lambda work_dir: mocks.MockESStorageManager()),
+    ('es_storage_manager_index_per_type',
+     lambda work_dir: mocks.MockESStorageManager(index_per_type=True)),
+])
+
+# fields whose values legitimately differ between backends: only the ES
+# backend maintains node instance versions
+IGNORED_FIELDS = {'version'}
+
+
+def normalize(method_name, result):
+    """
+    Converts a storage method result to a backend independent form.
+    """
+    if isinstance(result, manager_exceptions.ManagerException):
+        return {'error': type(result).__name__}
+    if isinstance(result, tuple):
+        return [normalize(method_name, item) for item in result]
+    if isinstance(result, list):
+        return sorted((normalize(method_name, item) for item in result),
+                      key=lambda item: json.dumps(item, sort_keys=True))
+    if isinstance(result, models.SerializableObject):
+        if method_name.startswith('delete_'):
+            # only the id is guaranteed for objects returned by deletes
+            return {'id': result.id}
+        return {field: value for field, value in result.to_dict().items()
+                if field not in IGNORED_FIELDS}
+    if isinstance(result, dict):
+        # exported documents
+        return {field: value for field, value in result.items()
+                if field not in IGNORED_FIELDS}
+    return result
+
+
+class RecordingStorageManager(object):
+    """
+    Wraps a storage manager, timing every storage method call and
+    recording its normalized result (or the type of the error it raised).
+    """
+
+    def __init__(self, storage_manager):
+        self._storage_manager = storage_manager
+        self.measurements = {}
+        self.trace = []
+
+    def __getattr__(self, name):
+        method = getattr(self._storage_manager, name)
+        measurement = self.measurements.get(name)
+        if measurement is None:
+            measurement = self.measurements[name] = harness.Measurement(name)
+
+        def recorded(*args, **kwargs):
+            start = time.time()
+            try:
+                result = method(*args, **kwargs)
+                if isinstance(result, types.GeneratorType):
+                    result = list(result)
+            except manager_exceptions.ManagerException, e:
+                result = e
+            measurement.add(time.time() - start)
+            self.trace.append((name, normalize(name, result)))
+            if isinstance(result, Exception):
+                return None
+            return result
+        return recorded
+
+
+def _node(deployment_id, node_id, instances):
+    return models.DeploymentNode(id=node_id,
+                                 deployment_id=deployment_id,
+                                 blueprint_id='blueprint',
+                                 type='cloudify.nodes.Compute',
+                                 type_hierarchy=['cloudify.nodes.Root',
+                                                 'cloudify.nodes.Compute'],
+                                 number_of_instances=instances,
+                                 planned_number_of_instances=instances,
+                                 deploy_number_of_instances=instances,
+                                 host_id=node_id,
+                                 properties={'ip': '10.0.0.1'},
+                                 operations={},
+                                 plugins=[],
+                                 relationships=[],
+                                 plugins_to_install=None)
+
+
+def _node_instance(deployment_id, node_id, index, **kwargs):
+    instance = models.DeploymentNodeInstance(
+        id='{0}_{1}_{2}'.format(deployment_id, node_id, index),
+        node_id=node_id,
+        deployment_id=deployment_id,
+        runtime_properties={},
+        state='uninitialized',
+        relationships=[],
+        host_id=None,
+        version=None)
+    for field, value in kwargs.items():
+        setattr(instance, field, value)
+    return instance
+
+
+def run_workload(sm, deployments, instances):
+    """
+    Runs the scripted workload against the given (recording) storage
+    manager.
+    """
+    now = '2015-01-01 00:00:00.000000'
+    blueprint = models.BlueprintState(id='blueprint',
+                                      created_at=now,
+                                      updated_at=now,
+                                      plan={'nodes': ['vm', 'db']})
+    sm.put_blueprint('blueprint', blueprint)
+    sm.put_blueprint('blueprint', blueprint)
+    deployment_ids = ['deployment-{0}'.format(d) for d in range(deployments)]
+
+    for deployment_id in deployment_ids:
+        sm.put_deployment(deployment_id, models.Deployment(
+            id=deployment_id, created_at=now, updated_at=now,
+            blueprint_id='blueprint', workflows={'install': {}}, inputs={},
+            policy_types={}, policy_triggers={}, groups={}, outputs={}))
+        environment_execution_id = '{0}-environment'.format(deployment_id)
+        sm.put_execution(environment_execution_id, models.Execution(
+            id=environment_execution_id, status=models.Execution.PENDING,
+            deployment_id=deployment_id,
+            workflow_id=models.Execution.CREATE_DEPLOYMENT_ENVIRONMENT,
+            blueprint_id='blueprint', created_at=now, error='',
+            parameters={}))
+        sm.update_execution_status(environment_execution_id,
+                                   models.Execution.TERMINATED, '')
+        sm.put_node(_node(deployment_id, 'vm', instances))
+        sm.put_node(_node(deployment_id, 'db', 1))
+        for i in range(instances):
+            sm.put_node_instance(_node_instance(deployment_id, 'vm', i))
+        sm.put_node_instance(_node_instance(deployment_id, 'db', 0))
+        execution_id = '{0}-install'.format(deployment_id)
+        sm.put_execution(execution_id, models.Execution(
+            id=execution_id, status=models.Execution.QUEUED,
+            deployment_id=deployment_id, workflow_id='install',
+            blueprint_id='blueprint', created_at=now, error='',
+            parameters={}))
+        for _ in range(2):
+            sm.transition_execution_status(execution_id,
+                                           models.Execution.QUEUED,
+                                           models.Execution.PENDING)
+        # ended and missing executions are skipped
+        sm.update_executions_status([
+            (execution_id, models.Execution.STARTED, None),
+            (environment_execution_id, models.Execution.STARTED, None),
+            ('{0}-missing'.format(deployment_id),
+             models.Execution.STARTED, None)])
+        sm.get_execution(execution_id)
+        sm.get_execution(environment_execution_id)
+        sm.update_execution_status(execution_id,
+                                   models.Execution.TERMINATED, '')
+
+    sm.get_blueprint('blueprint')
+    sm.get_blueprint_deployments('blueprint')
+    sm.blueprints_list()
+    sm.deployments_list()
+    sm.executions_list()
+    sm.executions_list(status=models.Execution.TERMINATED,
+                       include=['id', 'deployment_id'])
+    for deployment_id in deployment_ids:
+        sm.get_deployment(deployment_id, include=['id', 'blueprint_id'])
+        sm.get_deployment(deployment_id)
+        sm.get_nodes(deployment_id)
+        sm.get_node(deployment_id, 'vm')
+        sm.get_node_instances(deployment_id)
+        sm.get_node_instances(deployment_id, node_id='db')
+        sm.executions_list(deployment_id=deployment_id)
+        sm.executions_list(deployment_id=deployment_id,
+                           status=models.Execution.QUEUED)
+
+    # node instance patches, the way the rest service applies them
+    for deployment_id in deployment_ids:
+        for i in range(instances):
+            instance = _node_instance(deployment_id, 'vm', i,
+                                      state='started',
+                                      runtime_properties={'index': i},
+                                      relationships=None,
+                                      version=0)
+            sm.update_node_instance(instance)
+            sm.get_node_instance(instance.id)
+    sm.get_node_instance('missing')
+    sm.node_instances_summary(['state'])
+    sm.node_instances_summary(['deployment_id', 'state'])
+    sm.node_instances_summary(['node_id', 'state'],
+                              deployment_id=deployment_ids[0])
+    sm.executions_summary(['status'], deployment_id=deployment_ids[0])
+    sm.executions_summary(['blueprint_id', 'status'])
+    sm.node_instances_count(deployment_id=deployment_ids[0],
+                            exclude_states=['uninitialized', 'deleted'],
+                            ids_limit=instances)
+    sm.node_instances_count(exclude_states=['started'])
+    sm.executions_count(deployment_id=deployment_ids[0],
+                        exclude_statuses=models.Execution.END_STATES,
+                        ids_limit=1)
+    sm.executions_count(status=models.Execution.TERMINATED)
+    sm.deployments_count(blueprint_id='blueprint', ids_limit=deployments)
+    sm.deployments_count(blueprint_id='missing', ids_limit=1)
+
+    # scale out every deployment's vm node by one instance
+    for deployment_id in deployment_ids:
+        modification_id = '{0}-modification'.format(deployment_id)
+        sm.put_deployment_modification(
+            modification_id, models.DeploymentModification(
+                id=modification_id, created_at=now, ended_at=None,
+                status=models.DeploymentModification.STARTED,
+                deployment_id=deployment_id,
+                modified_nodes={'vm': {'instances': instances + 1}},
+                node_instances={'added_and_related': []}, context={}))
+        sm.deployment_modifications_count(
+            deployment_id=deployment_id,
+            status=models.DeploymentModification.STARTED,
+            ids_limit=1)
+        sm.update_node(deployment_id, 'vm',
+                       planned_number_of_instances=instances + 1)
+        sm.put_node_instance(_node_instance(deployment_id, 'vm', instances))
+        sm.update_node(deployment_id, 'vm',
+                       number_of_instances=instances + 1)
+        sm.update_deployment_modification(models.DeploymentModification(
+            id=modification_id, created_at=None, ended_at=now,
+            status=models.DeploymentModification.FINISHED,
+            deployment_id=None, modified_nodes=None, node_instances=None,
+            context=None))
+        sm.get_deployment_modification(modification_id)
+        sm.deployment_modifications_list(deployment_id=deployment_id)
+        sm.deployment_modifications_count(
+            deployment_id=deployment_id,
+            status=models.DeploymentModification.STARTED)
+        sm.get_node(deployment_id, 'vm')
+
+    sm.put_provider_context(models.ProviderContext(name='provider',
+                                                   context={'a': 1}))
+    sm.put_provider_context(models.ProviderContext(name='provider',
+                                                   context={'a': 1}))
+    sm.update_provider_context(models.ProviderContext(name='provider',
+                                                      context={'a': 2}))
+    sm.get_provider_context()
+
+    # export every storage type, fail importing documents which exist,
+    # and import them once deleted
+    for storage_type in snapshots.STORAGE_TYPES:
+        docs = [doc for batch in sm.export_docs(storage_type, 1000)
+                for doc in batch]
+        sm.import_docs(storage_type, docs[-1:])
+        sm.delete_docs(storage_type, docs[-1:])
+        sm.import_docs(storage_type, docs[-1:])
+    sm.refresh()
+
+    for deployment_id in deployment_ids:
+        sm.delete_node_instance(
+            _node_instance(deployment_id, 'vm', instances).id)
+        sm.delete_deployment(deployment_id)
+        sm.get_deployment(deployment_id)
+    sm.node_instances_list()
+    sm.executions_list()
+    sm.delete_blueprint('blueprint')
+    sm.blueprints_list()
+
+
+def run_backend(backend_name, deployments, instances):
+    """
+    :return: a (trace, measurements) tuple for the given backend.
+    """
+    work_dir = tempfile.mkdtemp()
+    try:
+        sm = RecordingStorageManager(BACKENDS[backend_name](work_dir))
+        run_workload(sm, deployments, instances)
+        return sm.trace, sm.measurements
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def compare_traces(expected, actual):
+    """
+    :return: list of descriptions of the steps in which the traces differ.
+    """
+    mismatches = []
+    for step, (expected_step, actual_step) in enumerate(zip(expected,
+                                                            actual)):
+        if expected_step != actual_step:
+            mismatches.append('step {0} ({1}): expected {2}, got {3}'.format(
+                step, expected_step[0], expected_step[1], actual_step[1]))
+    if len(expected) != len(actual):
+        mismatches.append('expected {0} steps, got {1}'.format(
+            len(expected), len(actual)))
+    return mismatches
+
+
+def check_conformance(backend_names, deployments, instances):
+    """
+    Runs the workload against every given backend and compares the results
+    to those of the first one.
+
+    :return: a (mismatches, results) tuple; mismatches maps backend name
+             to a list of mismatch descriptions, results maps backend name
+             to a dict of storage method name to measurement summary.
+    """
+    mismatches = {}
+    results = {}
+    reference = None
+    for backend_name in backend_names:
+        trace, measurements = run_backend(backend_name, deployments,
+                                          instances)
+        results[backend_name] = {
+            name: measurement.summary()
+            for name, measurement in measurements.items()}
+        if reference is None:
+            reference = trace
+        else:
+            mismatches[backend_name] = compare_traces(reference, trace)
+    return mismatches, results
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description='Check storage backends conformance and benchmark them')
+    parser.add_argument('--backend', action='append', dest='backends',
+                        choices=BACKENDS.keys(),
+                        help='backend to run (may be repeated; default: all '
+                             'backends). Results are compared to those of '
+                             'the first backend')
+    parser.add_argument('--deployments', type=int, default=10,
+                        help='number of deployments to create')
+    parser.add_argument('--instances', type=int, default=20,
+                        help='number of "vm" node instances per deployment')
+    parser.add_argument('--save-baseline',
+                        help='save the results as a baseline to this path')
+    parser.add_argument('--baseline',
+                        help='compare the results to the baseline saved at '
+                             'this path; exits with a non-zero code on '
+                             'regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative degradation compared to the '
+                             'baseline (default: 0.2)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv if argv is not None else sys.argv[1:])
+    backend_names = args.backends or BACKENDS.keys()
+
+    mismatches, results = check_conformance(backend_names,
+                                            args.deployments,
+                                            args.instances)
+    for backend_name in backend_names:
+        print '\n{0}'.format(backend_name)
+        print harness.format_results(results[backend_name])
+
+    failed = False
+    for backend_name, backend_mismatches in sorted(mismatches.items()):
+        for mismatch in backend_mismatches:
+            print 'MISMATCH {0}: {1}'.format(backend_name, mismatch)
+            failed = True
+    if args.save_baseline:
+        harness.save_baseline(results, args.save_baseline)
+    if args.baseline:
+        baseline = harness.load_baseline(args.baseline)
+        for backend_name in backend_names:
+            regressions = harness.compare_to_baseline(
+                results[backend_name], baseline.get(backend_name, {}),
+                args.tolerance)
+            for regression in regressions:
+                print 'REGRESSION {0}: {1}'.format(backend_name, regression)
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
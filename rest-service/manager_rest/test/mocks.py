@@ -13,14 +13,33 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
+import copy
+import fnmatch
+from collections import OrderedDict
+
+import elasticsearch.exceptions
+
 from manager_rest.storage_manager import get_storage_manager
-from manager_rest.models import Execution
+from manager_rest.es_storage_manager import ESStorageManager
+from manager_rest.models import Execution, DeploymentNodeInstance
 
 
 def task_state():
     return Execution.TERMINATED
 
 
+def node_instance(instance_id, deployment_id='dep-1', node_id='vm',
+                  state='started', runtime_properties=None):
+    return DeploymentNodeInstance(id=instance_id,
+                                  node_id=node_id,
+                                  deployment_id=deployment_id,
+                                  runtime_properties=runtime_properties or {},
+                                  state=state,
+                                  relationships=[],
+                                  host_id=None,
+                                  version=None)
+
+
 class MockCeleryClient(object):
 
     def execute_task(self, task_name, task_queue, task_id=None, kwargs=None):
@@ -40,3 +59,384 @@ class MockAsyncResult(object):
 
     def get(self, timeout=300, propagate=True):
         return None
+
+
+class MockIndicesClient(object):
+    """
+    Stand-in for the elasticsearch indices client, see MockElasticsearch.
+    """
+
+    def __init__(self, es):
+        self._es = es
+
+    def exists(self, index, **_):
+        return all(name in self._es._indices or name in self._es._aliases
+                   for name in index.split(','))
+
+    def exists_alias(self, name, **_):
+        return name in self._es._aliases
+
+    def get_alias(self, name, **_):
+        if name not in self._es._aliases:
+            raise elasticsearch.exceptions.NotFoundError(
+                404, 'alias {0} not found'.format(name))
+        return {index: {'aliases': {name: {}}}
+                for index in self._es._aliases[name]}
+
+    def create(self, index, body=None, **_):
+        if index in self._es._indices or index in self._es._aliases:
+            raise elasticsearch.exceptions.RequestError(
+                400, 'IndexAlreadyExistsException[{0}]'.format(index))
+        self._es._create_index(index, body)
+        return {'acknowledged': True}
+
+    def put_template(self, name, body, **_):
+        self._es._templates[name] = copy.deepcopy(body)
+        return {'acknowledged': True}
+
+    def delete(self, index, **_):
+        for name in self._es._resolve(index):
+            del self._es._indices[name]
+            self._es._settings.pop(name, None)
+            self._es._mappings.pop(name, None)
+            for indices in self._es._aliases.values():
+                if name in indices:
+                    indices.remove(name)
+        for alias, indices in self._es._aliases.items():
+            if not indices:
+                del self._es._aliases[alias]
+        return {'acknowledged': True}
+
+    def update_aliases(self, body, **_):
+        # validate all actions first, as aliases are updated atomically
+        for action in body['actions']:
+            (op, spec), = action.items()
+            if spec['index'] not in self._es._indices:
+                raise elasticsearch.exceptions.NotFoundError(
+                    404, 'index {0} not found'.format(spec['index']))
+        for action in body['actions']:
+            (op, spec), = action.items()
+            indices = self._es._aliases.setdefault(spec['alias'], [])
+            if op == 'add' and spec['index'] not in indices:
+                indices.append(spec['index'])
+            elif op == 'remove' and spec['index'] in indices:
+                indices.remove(spec['index'])
+            if not indices:
+                del self._es._aliases[spec['alias']]
+        return {'acknowledged': True}
+
+    def put_settings(self, body, index=None, **_):
+        for name in self._es._resolve(index):
+            self._es._settings[name].update(copy.deepcopy(body))
+        return {'acknowledged': True}
+
+    def get_settings(self, index=None, **_):
+        return {name: {'settings': copy.deepcopy(self._es._settings[name])}
+                for name in self._es._resolve(index)}
+
+    def get_mapping(self, index=None, **_):
+        return {name: {'mappings': copy.deepcopy(self._es._mappings[name])}
+                for name in self._es._resolve(index)}
+
+    def refresh(self, index=None, **_):
+        return {}
+
+
+class MockElasticsearch(object):
+    """
+    In-process stand-in for the subset of the elasticsearch client API
+    used by the storage manager, so ES backed code may run offline.
+    Supports term, ids, bool/must and constant_score/filter/term queries,
+    terms aggregations, aliases, templates, scan/scroll searches and bulk
+    requests. Indices are created on first use, and searches are always up
+    to date (i.e. refreshing is a no-op).
+    """
+
+    def __init__(self):
+        self._indices = OrderedDict()
+        self._settings = {}
+        self._mappings = {}
+        self._aliases = {}
+        self._templates = {}
+        self._scrolls = {}
+        self.indices = MockIndicesClient(self)
+
+    def _create_index(self, index, body=None):
+        body = copy.deepcopy(body or {})
+        settings, mappings, aliases = {}, {}, []
+        for template in self._templates.values():
+            if fnmatch.fnmatch(index, template['template']):
+                settings.update(template.get('settings', {}))
+                mappings.update(template.get('mappings', {}))
+                aliases.extend(template.get('aliases', {}).keys())
+        for alias in aliases:
+            if alias in self._indices:
+                raise elasticsearch.exceptions.RequestError(
+                    400, 'InvalidAliasNameException[{0}]'.format(alias))
+        settings.update(body.get('settings', {}))
+        mappings.update(body.get('mappings', {}))
+        self._indices[index] = {}
+        self._settings[index] = settings
+        self._mappings[index] = mappings
+        for alias in aliases:
+            self._aliases.setdefault(alias, []).append(index)
+
+    def _resolve(self, index):
+        """
+        :return: the concrete index names for a (possibly comma separated)
+                 list of index names and aliases, or all indices for None.
+        """
+        if index is None or index == '_all':
+            return self._indices.keys()
+        names = []
+        for name in index.split(','):
+            if '*' in name:
+                names.extend(fnmatch.filter(self._indices.keys(), name))
+            elif name in self._aliases:
+                names.extend(self._aliases[name])
+            elif name in self._indices:
+                names.append(name)
+            else:
+                raise elasticsearch.exceptions.NotFoundError(
+                    404, 'IndexMissingException[{0}]'.format(name))
+        return names
+
+    def _index_for_write(self, index):
+        if index in self._aliases:
+            if len(self._aliases[index]) != 1:
+                raise elasticsearch.exceptions.RequestError(
+                    400, 'alias {0} points at more than one index'.format(
+                        index))
+            return self._aliases[index][0]
+        if index not in self._indices:
+            self._create_index(index)
+        return index
+
+    def _verify_writable(self, index):
+        name = self._index_for_write(index)
+        if self._settings.get(name, {}).get('index.blocks.write'):
+            raise elasticsearch.exceptions.TransportError(
+                403, 'ClusterBlockException[blocked by: [FORBIDDEN/8/index '
+                     'write (api)];]')
+
+    def _docs(self, index, doc_type):
+        return self._indices.setdefault(
+            self._index_for_write(index), {}).setdefault(doc_type,
+                                                         OrderedDict())
+
+    def _find(self, index, doc_type, id):
+        docs = self._docs(index, doc_type)
+        if id not in docs:
+            raise elasticsearch.exceptions.NotFoundError(
+                404, 'document {0} not found'.format(id))
+        return docs[id]
+
+    @staticmethod
+    def _project(source, _source):
+        if _source is True or _source is None:
+            return copy.deepcopy(source)
+        if _source is False:
+            return {}
+        return {field: copy.deepcopy(source[field])
+                for field in _source if field in source}
+
+    @classmethod
+    def _terms(cls, query):
+        """
+        :return: (field, values) pairs which a document must match, and
+                 (None, terms) pairs of must_not clauses.
+        """
+        if not query:
+            return []
+        if 'query' in query:
+            return cls._terms(query['query'])
+        if 'constant_score' in query:
+            return cls._terms(query['constant_score']['filter'])
+        if 'bool' in query:
+            terms = [term for clause in query['bool'].get('must', [])
+                     for term in cls._terms(clause)]
+            terms.extend((None, cls._terms(clause))
+                         for clause in query['bool'].get('must_not', []))
+            return terms
+        if 'term' in query:
+            return [(field, [value])
+                    for field, value in query['term'].items()]
+        if 'terms' in query:
+            return query['terms'].items()
+        if 'ids' in query:
+            return [('_id', query['ids']['values'])]
+        if 'match_all' in query:
+            return []
+        raise NotImplementedError('unsupported query: {0}'.format(query))
+
+    @classmethod
+    def _matches(cls, id, source, terms):
+        for field, values in terms:
+            if field is None:
+                if cls._matches(id, source, values):
+                    return False
+            elif (id if field == '_id' else source.get(field)) not in values:
+                return False
+        return True
+
+    def _hits(self, index, doc_type, body):
+        terms = self._terms(body.get('query') if body else None)
+        if index not in self._aliases and index is not None and \
+                ',' not in index and '*' not in index and \
+                index not in self._indices:
+            self._create_index(index)
+        hits = []
+        for index_name in self._resolve(index):
+            types = self._indices[index_name]
+            for type_name in ([doc_type] if doc_type else types.keys()):
+                for id, doc in types.get(type_name, {}).iteritems():
+                    if self._matches(id, doc['_source'], terms):
+                        hits.append((index_name, type_name, id, doc))
+        return hits
+
+    def _hit(self, index, doc_type, id, doc, _source, version=True):
+        hit = {'_index': index,
+               '_type': doc_type,
+               '_id': id,
+               '_source': self._project(doc['_source'], _source)}
+        if version:
+            hit['_version'] = doc['_version']
+        return hit
+
+    @classmethod
+    def _aggregate(cls, sources, aggregations):
+        result = {}
+        for name, aggregation in aggregations.items():
+            field = aggregation['terms']['field']
+            groups = {}
+            for source in sources:
+                if source.get(field) is not None:
+                    groups.setdefault(source[field], []).append(source)
+            buckets = []
+            for value, group in sorted(groups.items(),
+                                       key=lambda item: (-len(item[1]),
+                                                         item[0])):
+                bucket = {'key': value, 'doc_count': len(group)}
+                if 'aggs' in aggregation:
+                    bucket.update(cls._aggregate(group, aggregation['aggs']))
+                buckets.append(bucket)
+            result[name] = {'buckets': buckets}
+        return result
+
+    def search(self, index=None, doc_type=None, body=None, size=10,
+               _source=True, search_type=None, scroll=None, **_):
+        matching = self._hits(index, doc_type, body)
+        if search_type == 'count':
+            result = {'hits': {'total': len(matching), 'hits': []}}
+            if body and 'aggs' in body:
+                result['aggregations'] = self._aggregate(
+                    [hit[-1]['_source'] for hit in matching],
+                    body['aggs'])
+            return result
+        hits = [self._hit(*hit, _source=_source) for hit in matching]
+        if search_type == 'scan':
+            scroll_id = str(len(self._scrolls) + 1)
+            self._scrolls[scroll_id] = (hits, size)
+            return {'_scroll_id': scroll_id,
+                    'hits': {'total': len(hits), 'hits': []}}
+        return {'hits': {'total': len(hits), 'hits': hits[:size]}}
+
+    def scroll(self, scroll_id, scroll=None, **_):
+        hits, size = self._scrolls[scroll_id]
+        self._scrolls[scroll_id] = (hits[size:], size)
+        return {'_scroll_id': scroll_id,
+                'hits': {'total': len(hits), 'hits': hits[:size]}}
+
+    def count(self, index=None, doc_type=None, body=None, **_):
+        return {'count': len(self._hits(index, doc_type, body))}
+
+    def get(self, index, doc_type, id, _source=True, **_):
+        doc = self._find(index, doc_type, id)
+        return self._hit(self._index_for_write(index), doc_type, id, doc,
+                         _source)
+
+    def create(self, index, doc_type, id, body, **_):
+        self._verify_writable(index)
+        docs = self._docs(index, doc_type)
+        if id in docs:
+            raise elasticsearch.exceptions.ConflictError(
+                409, 'document {0} already exists'.format(id))
+        docs[id] = {'_version': 1, '_source': copy.deepcopy(body)}
+        return {'_id': id, '_version': 1, 'created': True}
+
+    def index(self, index, doc_type, id, body, version=None,
+              version_type=None, **_):
+        self._verify_writable(index)
+        docs = self._docs(index, doc_type)
+        if version_type == 'external':
+            if id in docs and docs[id]['_version'] >= version:
+                raise elasticsearch.exceptions.ConflictError(
+                    409, 'VersionConflictEngineException[{0}]'.format(id))
+        else:
+            version = docs[id]['_version'] + 1 if id in docs else 1
+        docs[id] = {'_version': version, '_source': copy.deepcopy(body)}
+        return {'_id': id, '_version': version}
+
+    def update(self, index, doc_type, id, body, version=None, **_):
+        self._verify_writable(index)
+        doc = self._find(index, doc_type, id)
+        if version is not None and doc['_version'] != version:
+            raise elasticsearch.exceptions.ConflictError(
+                409, 'VersionConflictEngineException[{0}]'.format(id))
+        doc['_source'].update(copy.deepcopy(body['doc']))
+        doc['_version'] += 1
+        return {'_id': id, '_version': doc['_version']}
+
+    def delete(self, index, doc_type, id, **_):
+        self._verify_writable(index)
+        doc = self._find(index, doc_type, id)
+        del self._docs(index, doc_type)[id]
+        return {'_id': id, '_version': doc['_version'], 'found': True}
+
+    def delete_by_query(self, index, doc_type, body, **_):
+        for index_name, type_name, id, _ in self._hits(index, doc_type,
+                                                       body):
+            del self._indices[index_name][type_name][id]
+        return {}
+
+    def bulk(self, body, index=None, doc_type=None, **_):
+        actions = iter(body)
+        items = []
+        for action in actions:
+            (op_type, meta), = action.items()
+            meta = dict(meta)
+            kwargs = {'index': meta.pop('_index', index),
+                      'doc_type': meta.pop('_type', doc_type),
+                      'id': meta.pop('_id')}
+            kwargs.update((key.lstrip('_'), value)
+                          for key, value in meta.iteritems())
+            if op_type != 'delete':
+                kwargs['body'] = next(actions)
+            item = {'_index': kwargs['index'],
+                    '_type': kwargs['doc_type'],
+                    '_id': kwargs['id']}
+            try:
+                result = getattr(self, op_type)(**kwargs)
+                item.update(status=201 if op_type == 'create' else 200,
+                            _version=result['_version'])
+            except elasticsearch.exceptions.TransportError, e:
+                item.update(status=e.status_code, error=str(e))
+            items.append({op_type: item})
+        return {'errors': any(item.values()[0]['status'] >= 300
+                              for item in items),
+                'items': items}
+
+
+class MockESStorageManager(ESStorageManager):
+    """
+    ES storage manager working against a MockElasticsearch instance.
+    """
+
+    def __init__(self, index_per_type=False):
+        super(MockESStorageManager, self).__init__(None, None,
+                                                   index_per_type)
+        self.es = MockElasticsearch()
+
+    @property
+    def _connection(self):
+        return self.es
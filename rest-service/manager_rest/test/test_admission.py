@@ -0,0 +1,148 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import unittest
+
+from manager_rest import admission
+from manager_rest import manager_exceptions
+from base_test import BaseServerTestCase
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_burst_and_refill(self):
+        clock = FakeClock()
+        bucket = admission.TokenBucket(rate=2, burst=3, clock=clock)
+        for _ in range(3):
+            self.assertEqual(0, bucket.take())
+        self.assertAlmostEqual(0.5, bucket.take())
+        clock.now += 0.5
+        self.assertEqual(0, bucket.take())
+        # refilling never exceeds the burst
+        clock.now += 100
+        for _ in range(3):
+            self.assertEqual(0, bucket.take())
+        self.assertNotEqual(0, bucket.take())
+
+
+class AdmissionControllerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def controller(self, rules, max_concurrent_requests=10):
+        return admission.AdmissionController(rules, max_concurrent_requests,
+                                             clock=self.clock)
+
+    def assert_rejected(self, controller, endpoint, method='GET',
+                        retry_after=None):
+        try:
+            controller.admit(endpoint, method)
+            self.fail('{0} {1} was admitted'.format(method, endpoint))
+        except manager_exceptions.TooManyRequestsError, e:
+            self.assertEqual(429, e.http_code)
+            if retry_after is not None:
+                self.assertAlmostEqual(retry_after, e.retry_after)
+
+    def test_concurrency_limit(self):
+        controller = self.controller([{'endpoint': 'search',
+                                       'concurrency': 2}])
+        first = controller.admit('search', 'GET')
+        controller.admit('search', 'POST')
+        self.assert_rejected(controller, 'search',
+                             retry_after=admission.DEFAULT_RETRY_AFTER)
+        # other endpoints are not affected
+        controller.admit('blueprints', 'GET')
+        controller.release(first)
+        controller.admit('search', 'GET')
+
+    def test_rate_limit(self):
+        controller = self.controller([{'endpoint': 'events',
+                                       'rate': 1, 'burst': 2}])
+        controller.release(controller.admit('events', 'GET'))
+        controller.release(controller.admit('events', 'GET'))
+        self.assert_rejected(controller, 'events', retry_after=1)
+        self.clock.now += 1
+        controller.release(controller.admit('events', 'GET'))
+
+    def test_rule_methods(self):
+        controller = self.controller([{'endpoint': 'deploymentsid',
+                                       'methods': ['delete'],
+                                       'concurrency': 1}])
+        controller.admit('deploymentsid', 'DELETE')
+        self.assert_rejected(controller, 'deploymentsid', 'DELETE')
+        controller.admit('deploymentsid', 'GET')
+        controller.admit('deploymentsid', 'GET')
+
+    def test_priority_classes(self):
+        controller = self.controller(
+            [{'endpoint': 'search', 'priority': admission.PRIORITY_LOW},
+             {'endpoint': 'nodeinstancesid',
+              'priority': admission.PRIORITY_CRITICAL}],
+            max_concurrent_requests=5)
+        for _ in range(3):
+            controller.admit('search', 'GET')
+        # low priority requests may use half of the capacity
+        self.assert_rejected(controller, 'search')
+        controller.admit('blueprints', 'GET')
+        # normal priority requests may use 80% of the capacity
+        self.assert_rejected(controller, 'blueprints')
+        controller.admit('nodeinstancesid', 'PATCH')
+        self.assert_rejected(controller, 'nodeinstancesid', 'PATCH')
+
+    def test_rejected_requests_do_not_take_capacity(self):
+        controller = self.controller([{'endpoint': 'search',
+                                       'concurrency': 1,
+                                       'rate': 1, 'burst': 1}])
+        ticket = controller.admit('search', 'GET')
+        self.assert_rejected(controller, 'search')
+        self.assertEqual(1, controller.in_progress)
+        controller.release(ticket)
+        self.assertEqual(0, controller.in_progress)
+        # the token is taken by the first request only
+        self.assert_rejected(controller, 'search', retry_after=1)
+
+    def test_unknown_priority_class(self):
+        self.assertRaises(ValueError, self.controller,
+                          [{'endpoint': 'search', 'priority': 'urgent'}])
+
+
+class AdmissionServerTest(BaseServerTestCase):
+
+    def create_configuration(self):
+        test_config = super(AdmissionServerTest, self).create_configuration()
+        test_config.admission_control = {
+            'rules': [{'endpoint': 'blueprints', 'rate': 0.1, 'burst': 1}]
+        }
+        return test_config
+
+    def test_too_many_requests(self):
+        self.assertEqual(200, self.get('/blueprints').status_code)
+        response = self.get('/blueprints')
+        self.assertEqual(429, response.status_code)
+        self.assertEqual('too_many_requests_error',
+                         response.json['error_code'])
+        self.assertEqual('10', response.headers['Retry-After'])
+        # other endpoints are not limited
+        self.assertEqual(200, self.get('/deployments').status_code)
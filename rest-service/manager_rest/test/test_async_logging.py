@@ -0,0 +1,141 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import sys
+import time
+import logging
+import threading
+import unittest
+
+from manager_rest.async_logging import AsyncHandler
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+        self.unblocked = threading.Event()
+        self.unblocked.set()
+
+    def emit(self, record):
+        self.unblocked.wait()
+        self.messages.append(self.format(record))
+
+
+class AsyncHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.target = RecordingHandler()
+        self.logger = logging.getLogger('test_async_logging')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+
+    def tearDown(self):
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+
+    def add_handler(self, **kwargs):
+        handler = AsyncHandler(self.target, **kwargs)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        self.logger.addHandler(handler)
+        return handler
+
+    def test_records_written_in_order(self):
+        handler = self.add_handler()
+        data = {'state': 'started'}
+        self.logger.info('first %s', data)
+        # the arguments are rendered when the record is logged
+        data['state'] = 'changed'
+        self.logger.debug('second')
+        handler.close()
+        self.assertEqual(["INFO first {'state': 'started'}", 'DEBUG second'],
+                         self.target.messages)
+
+    def test_exception_rendered(self):
+        handler = self.add_handler()
+        try:
+            raise RuntimeError('failed')
+        except RuntimeError:
+            self.logger.exception('error')
+        handler.close()
+        self.assertEqual(1, len(self.target.messages))
+        self.assertTrue(self.target.messages[0].startswith('ERROR error\n'))
+        self.assertIn('RuntimeError: failed', self.target.messages[0])
+
+    def test_records_dropped_when_queue_full(self):
+        handler = self.add_handler(max_queued_records=2)
+        self.target.unblocked.clear()
+        for i in range(10):
+            self.logger.info('message %d', i)
+        # the writer holds at most one record, and two more are queued
+        self.assertTrue(handler.dropped >= 7)
+        self.target.unblocked.set()
+        handler.close()
+        self.assertEqual(10 - handler.dropped + 1, len(self.target.messages))
+        self.assertEqual('INFO message 0', self.target.messages[0])
+        # reported once the writer caught up
+        self.assertEqual('WARNING Dropped {0} log records, logged faster '
+                         'than they could be written'.format(
+                             handler.dropped),
+                         self.target.messages[-1])
+
+    def test_records_dropped_concurrently_counted(self):
+        handler = self.add_handler(max_queued_records=1)
+        self.target.unblocked.clear()
+        self.logger.info('blocking')
+        # the writer holds the first record, and one more is queued
+        while not handler._queue.empty():
+            time.sleep(0.01)
+        self.logger.info('queued')
+        interval = sys.getcheckinterval()
+        # switching threads as often as possible
+        sys.setcheckinterval(1)
+        try:
+            threads = [threading.Thread(target=lambda: [
+                self.logger.info('dropped') for _ in range(1000)])
+                for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setcheckinterval(interval)
+        self.assertEqual(8000, handler.dropped)
+        self.target.unblocked.set()
+        handler.close()
+
+    def test_dropped_records_reports_rate_limited(self):
+        handler = self.add_handler(max_queued_records=1,
+                                   dropped_report_interval=3600)
+        for _ in range(2):
+            self.target.unblocked.clear()
+            for i in range(5):
+                self.logger.info('message %d', i)
+            self.target.unblocked.set()
+            # the writer catches up
+            while not handler._queue.empty():
+                time.sleep(0.01)
+            time.sleep(0.05)
+        reports = [message for message in self.target.messages
+                   if message.startswith('WARNING')]
+        self.assertEqual(1, len(reports))
+        handler.close()
+        reports = [message for message in self.target.messages
+                   if message.startswith('WARNING')]
+        # the remaining dropped records are reported on close
+        self.assertEqual(2, len(reports))
+        self.assertEqual(handler.dropped, sum(
+            int(report.split()[2]) for report in reports))
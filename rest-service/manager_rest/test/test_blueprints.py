@@ -46,7 +46,14 @@ class BlueprintsTestCase(BaseServerTestCase):
         self.assertEquals('hello_world', post_blueprints_response['id'])
         get_blueprints_response = self.get('/blueprints').json
         self.assertEquals(1, len(get_blueprints_response))
-        self.assertEquals(post_blueprints_response, get_blueprints_response[0])
+        # the plan is only listed when requested
+        self.assertEquals({field: post_blueprints_response[field]
+                           for field in ('id', 'created_at', 'updated_at')},
+                          get_blueprints_response[0])
+        get_blueprints_response = self.get(
+            '/blueprints', query_params={'_include': 'id,plan'}).json
+        self.assertEquals(post_blueprints_response['plan'],
+                          get_blueprints_response[0]['plan'])
 
     def test_post_blueprint_already_exists(self):
         self.put_file(*self.put_blueprint_args())
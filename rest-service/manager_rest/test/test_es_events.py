@@ -0,0 +1,168 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import datetime
+import unittest
+
+import mock
+import elasticsearch.helpers
+
+from manager_rest import es_events
+from manager_rest.es_events import EVENTS_ALIAS
+from manager_rest.test.mocks import MockElasticsearch
+
+NOW = datetime.datetime(2015, 6, 10, 12, 0, 0)
+
+
+def _day(day):
+    return datetime.date(2015, 6, day)
+
+
+def _range_query(**bounds):
+    return {'query': {'filtered': {
+        'query': {'match_all': {}},
+        'filter': {'and': [
+            {'term': {'context.deployment_id': 'deployment'}},
+            {'range': {'@timestamp': bounds}}]}}}}
+
+
+class EventsTimeRangeTests(unittest.TestCase):
+
+    def test_unbounded(self):
+        self.assertEquals((None, None), es_events.time_range(None))
+        self.assertEquals((None, None), es_events.time_range(
+            {'query': {'match_all': {}}}))
+
+    def test_iso_bounds(self):
+        # bounds are widened by a day, as they may be in another timezone
+        self.assertEquals(
+            (_day(1), _day(6)),
+            es_events.time_range(_range_query(gte='2015-06-02T10:00:00Z',
+                                              lt='2015-06-05'), NOW))
+
+    def test_now_and_epoch_bounds(self):
+        self.assertEquals(
+            (_day(2), None),
+            es_events.time_range(_range_query(gt='now-7d'), NOW))
+        epoch_millis = 1433851200000  # 2015-06-09 12:00 UTC
+        self.assertEquals(
+            (None, _day(10)),
+            es_events.time_range(_range_query(lte=epoch_millis), NOW))
+
+    def test_unrestricting_clauses_ignored(self):
+        query = {'query': {'bool': {
+            'should': [{'range': {'@timestamp': {'gte': '2015-06-09'}}}],
+            'must': [{'range': {'timestamp': {'lte': '2015-06-05'}}}]}}}
+        self.assertEquals((None, _day(6)), es_events.time_range(query, NOW))
+
+    def test_unparsable_bound_ignored(self):
+        self.assertEquals((None, None), es_events.time_range(
+            _range_query(gte='last tuesday'), NOW))
+
+
+class EventsIndicesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.es = MockElasticsearch()
+
+    def _index_event(self, day, event_id):
+        timestamp = '2015-06-{0:02d}T12:00:00.000Z'.format(day)
+        self.es.index(index=es_events.index_name(_day(day)),
+                      doc_type='cloudify_event',
+                      id=event_id,
+                      body={'@timestamp': timestamp,
+                            'message': {'text': event_id}})
+
+    def test_setup_moves_legacy_index(self):
+        for day, event_id in ((1, 'a'), (3, 'b'), (3, 'c')):
+            self.es.index(index=EVENTS_ALIAS, doc_type='cloudify_event',
+                          id=event_id, body={
+                              '@timestamp': '2015-06-0{0}T00:00:00Z'.format(
+                                  day)})
+        es_events.setup(self.es, number_of_shards=2)
+
+        self.assertEquals(
+            ['cloudify_events-2015.06.01', 'cloudify_events-2015.06.03'],
+            sorted(self.es.indices.get_alias(name=EVENTS_ALIAS)))
+        self.assertEquals(3, self.es.count(index=EVENTS_ALIAS)['count'])
+
+        # indices created by the events writer join the alias
+        self._index_event(4, 'd')
+        self.assertEquals(4, self.es.count(index=EVENTS_ALIAS)['count'])
+        settings = self.es.indices.get_settings(
+            index='cloudify_events-2015.06.04')
+        self.assertEquals(2, settings.values()[0]['settings'][
+            'number_of_shards'])
+
+    def test_setup_moves_events_written_during_migration(self):
+        self.es.index(index=EVENTS_ALIAS, doc_type='cloudify_event',
+                      id='a', body={'@timestamp': '2015-06-01T00:00:00Z'})
+        scan = elasticsearch.helpers.scan
+
+        def scan_and_write(*args, **kwargs):
+            for hit in scan(*args, **kwargs):
+                yield hit
+            if not self.es.indices.get_settings(index=EVENTS_ALIAS).values()[
+                    0]['settings'].get('index.blocks.write'):
+                self.es.index(index=EVENTS_ALIAS, doc_type='cloudify_event',
+                              id='b',
+                              body={'@timestamp': '2015-06-02T00:00:00Z'})
+
+        with mock.patch('elasticsearch.helpers.scan', scan_and_write):
+            es_events.setup(self.es)
+
+        self.assertEquals(2, self.es.count(index=EVENTS_ALIAS)['count'])
+        self.assertEquals(
+            ['cloudify_events-2015.06.01', 'cloudify_events-2015.06.02'],
+            sorted(self.es.indices.get_alias(name=EVENTS_ALIAS)))
+
+    def test_indices_for_query(self):
+        es_events.setup(self.es)
+        for day in (1, 4, 7, 9):
+            self._index_event(day, 'event-{0}'.format(day))
+
+        self.assertEquals([EVENTS_ALIAS], es_events.indices_for_query(
+            self.es, {'query': {'match_all': {}}}, NOW))
+        self.assertEquals(
+            ['cloudify_events-2015.06.07', 'cloudify_events-2015.06.09'],
+            es_events.indices_for_query(
+                self.es, _range_query(gte='now-4d'), NOW))
+        self.assertEquals(
+            ['cloudify_events-2015.06.04'],
+            es_events.indices_for_query(
+                self.es, _range_query(gte='2015-06-04', lte='2015-06-05'),
+                NOW))
+        self.assertEquals([], es_events.indices_for_query(
+            self.es, _range_query(gte='2015-06-20'), NOW))
+
+    def test_indices_for_query_legacy_index(self):
+        self.es.index(index=EVENTS_ALIAS, doc_type='cloudify_event',
+                      id='a', body={})
+        self.assertEquals([EVENTS_ALIAS], es_events.indices_for_query(
+            self.es, _range_query(gte='now-4d'), NOW))
+
+    def test_retention(self):
+        es_events.setup(self.es)
+        for day in (1, 4, 7, 9):
+            self._index_event(day, 'event-{0}'.format(day))
+
+        expired = es_events.apply_retention(self.es, 5, today=_day(10))
+
+        self.assertEquals(
+            ['cloudify_events-2015.06.01', 'cloudify_events-2015.06.04'],
+            expired)
+        self.assertEquals(
+            ['cloudify_events-2015.06.07', 'cloudify_events-2015.06.09'],
+            sorted(self.es.indices.get_alias(name=EVENTS_ALIAS)))
@@ -0,0 +1,183 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import unittest
+
+import mock
+import elasticsearch.exceptions
+
+from manager_rest import models
+from manager_rest import es_schema
+from manager_rest import es_storage_manager
+from manager_rest.es_storage_manager import (STORAGE_INDEX_NAME,
+                                             STORAGE_TYPES,
+                                             type_index_name)
+from manager_rest.test.mocks import MockESStorageManager
+
+MODELS = {
+    es_storage_manager.BLUEPRINT_TYPE: models.BlueprintState,
+    es_storage_manager.DEPLOYMENT_TYPE: models.Deployment,
+    es_storage_manager.EXECUTION_TYPE: models.Execution,
+    es_storage_manager.NODE_TYPE: models.DeploymentNode,
+    es_storage_manager.NODE_INSTANCE_TYPE: models.DeploymentNodeInstance,
+    es_storage_manager.DEPLOYMENT_MODIFICATION_TYPE:
+        models.DeploymentModification,
+    es_storage_manager.PROVIDER_CONTEXT_TYPE: models.ProviderContext,
+}
+
+
+class ESSchemaTests(unittest.TestCase):
+
+    def setUp(self):
+        self.sm = MockESStorageManager()
+        self.es = self.sm.es
+
+    def _index_of(self, alias):
+        return self.es.indices.get_alias(name=alias).keys()
+
+    def _put_blueprint(self, blueprint_id):
+        self.sm.put_blueprint(blueprint_id, models.BlueprintState(
+            id=blueprint_id, plan={'nodes': []},
+            created_at='now', updated_at='now'))
+
+    def test_mappings_cover_all_model_fields(self):
+        self.assertEquals(set(MODELS.keys()), set(es_schema.MAPPINGS.keys()))
+        for doc_type, model in MODELS.items():
+            # node instance versions are the documents' _version
+            expected = model.fields - {'version'}
+            self.assertEquals(
+                expected,
+                set(es_schema.MAPPINGS[doc_type]['properties'].keys()),
+                doc_type)
+
+    def test_create(self):
+        index = es_schema.create(self.es, number_of_shards=3)[
+            STORAGE_INDEX_NAME]
+        self.assertEquals({index: {'aliases': {STORAGE_INDEX_NAME: {}}}},
+                          self.es.indices.get_alias(name=STORAGE_INDEX_NAME))
+        settings = self.es.indices.get_settings(index=index)
+        self.assertEquals(3, settings[index]['settings']['number_of_shards'])
+        self._put_blueprint('blueprint')
+        self.assertEquals('blueprint', self.sm.get_blueprint('blueprint').id)
+
+    def test_migrate_creates_missing_storage(self):
+        index = es_schema.migrate(self.es)[STORAGE_INDEX_NAME]
+        self.assertEquals([index], self._index_of(STORAGE_INDEX_NAME))
+
+    def test_migrate_concrete_index(self):
+        # storage created by older versions is a concrete index named
+        # after the alias
+        self._put_blueprint('blueprint')
+        instance = models.DeploymentNodeInstance(
+            id='vm_1', node_id='vm', deployment_id='deployment',
+            runtime_properties={}, state='started', relationships=[],
+            host_id='vm_1', version=None)
+        self.sm.put_node_instance(instance)
+        self.sm.update_node_instance(models.DeploymentNodeInstance(
+            id='vm_1', node_id=None, deployment_id=None,
+            runtime_properties={'ip': '10.0.0.1'}, state=None,
+            relationships=None, host_id=None, version=1))
+
+        index = es_schema.migrate(self.es)[STORAGE_INDEX_NAME]
+
+        self.assertTrue(self.es.indices.exists_alias(name=STORAGE_INDEX_NAME))
+        self.assertEquals([index], self._index_of(STORAGE_INDEX_NAME))
+        self.assertEquals({'nodes': []},
+                          self.sm.get_blueprint('blueprint').plan)
+        migrated = self.sm.get_node_instance('vm_1')
+        self.assertEquals(2, migrated.version)
+        self.assertEquals({'ip': '10.0.0.1'}, migrated.runtime_properties)
+        settings = self.es.indices.get_settings(index=index)[index]
+        self.assertEquals(es_schema.DEFAULT_REFRESH_INTERVAL,
+                          settings['settings']['refresh_interval'])
+
+    def test_migrate_alias(self):
+        old_index = es_schema.create(self.es)[STORAGE_INDEX_NAME]
+        self._put_blueprint('blueprint')
+
+        new_index = es_schema.migrate(
+            self.es, keep_old_index=True)[STORAGE_INDEX_NAME]
+
+        self.assertNotEquals(old_index, new_index)
+        self.assertEquals([new_index], self._index_of(STORAGE_INDEX_NAME))
+        self.assertTrue(self.es.indices.exists(index=old_index))
+        self.assertEquals('blueprint', self.sm.get_blueprint('blueprint').id)
+
+    def test_migrate_blocks_writes_to_old_index(self):
+        old_index = es_schema.create(self.es)[STORAGE_INDEX_NAME]
+        es_schema.migrate(self.es, keep_old_index=True)
+        self.assertRaises(elasticsearch.exceptions.TransportError,
+                          self.es.index, index=old_index,
+                          doc_type='blueprint', id='blueprint', body={})
+        # the storage is writable through the alias
+        self._put_blueprint('blueprint')
+
+    def test_failed_migration_unblocks_old_index(self):
+        es_schema.create(self.es)
+        self._put_blueprint('blueprint')
+        with mock.patch.object(self.es.indices, 'update_aliases',
+                               side_effect=RuntimeError('failed')):
+            self.assertRaises(RuntimeError, es_schema.migrate, self.es)
+        self._put_blueprint('another-blueprint')
+        self.assertEquals('another-blueprint',
+                          self.sm.get_blueprint('another-blueprint').id)
+
+    def test_copy_documents_catches_up(self):
+        es_schema.create(self.es)
+        self._put_blueprint('kept')
+        self._put_blueprint('deleted')
+        source = self._index_of(STORAGE_INDEX_NAME)[0]
+        self.es.indices.create(index='target')
+        es_schema.copy_documents(self.es, source, 'target')
+
+        # modifications made while the first copy was running
+        self.sm.delete_blueprint('deleted')
+        self._put_blueprint('added')
+        source_ids = es_schema.copy_documents(self.es, source, 'target')
+        es_schema.delete_stale_documents(self.es, 'target', source_ids)
+
+        copied = self.es.search(index='target', doc_type='blueprint')
+        self.assertEquals({'kept', 'added'},
+                          set(hit['_id'] for hit in copied['hits']['hits']))
+
+    def test_migrate_to_index_per_type(self):
+        es_schema.create(self.es)
+        self._put_blueprint('blueprint')
+        self.sm.put_execution('execution', models.Execution(
+            id='execution', status='pending', deployment_id='deployment',
+            workflow_id='install', blueprint_id='blueprint',
+            created_at='now', error='', parameters={}))
+
+        targets = es_schema.migrate(self.es, index_per_type=True)
+
+        self.assertEquals(set(type_index_name(doc_type)
+                              for doc_type in STORAGE_TYPES),
+                          set(targets.keys()))
+        self.assertFalse(self.es.indices.exists_alias(
+            name=STORAGE_INDEX_NAME))
+        for alias, index in targets.items():
+            self.assertEquals([index], self._index_of(alias))
+        mappings = self.es.indices.get_mapping(
+            index=targets[type_index_name('execution')])
+        self.assertEquals({'required': True}, mappings.values()[0][
+            'mappings']['execution']['_routing'])
+
+        sm = MockESStorageManager(index_per_type=True)
+        sm.es = self.es
+        self.assertEquals('blueprint', sm.get_blueprint('blueprint').id)
+        self.assertEquals(['execution'],
+                          [e.id for e in sm.executions_list('deployment')])
+        sm.update_execution_status('execution', 'started', '')
+        self.assertEquals('started', sm.get_execution('execution').status)
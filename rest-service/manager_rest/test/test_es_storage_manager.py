@@ -0,0 +1,45 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import unittest
+
+from manager_rest.es_storage_manager import (STORAGE_INDEX_NAME,
+                                             DEPLOYMENT_TYPE)
+from manager_rest.test.mocks import MockESStorageManager
+
+NOW = '2015-01-01 00:00:00.000000'
+
+
+class ESStorageManagerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.sm = MockESStorageManager()
+
+    def test_get_older_document_with_include(self):
+        # deployments stored before environment_status was added
+        self.sm.es.index(index=STORAGE_INDEX_NAME, doc_type=DEPLOYMENT_TYPE,
+                         id='deployment', body={
+                             'id': 'deployment', 'created_at': NOW,
+                             'updated_at': NOW, 'blueprint_id': 'blueprint',
+                             'workflows': {}, 'inputs': {},
+                             'policy_types': {}, 'policy_triggers': {},
+                             'groups': {}, 'outputs': {}})
+
+        deployment = self.sm.get_deployment(
+            'deployment', include=['id', 'environment_status'])
+
+        self.assertEquals('deployment', deployment.id)
+        self.assertIsNone(deployment.environment_status)
+        self.assertIsNone(deployment.blueprint_id)
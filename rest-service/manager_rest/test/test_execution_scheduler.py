@@ -0,0 +1,155 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import unittest
+
+import mock
+from flask import Flask
+
+from manager_rest import config
+from manager_rest import models
+from manager_rest.execution_scheduler import ExecutionScheduler
+from manager_rest.memory_storage_manager import MemoryStorageManager
+
+NOW = '2015-01-01 00:00:00.000000'
+
+
+class ExecutionSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sm = mock.Mock(wraps=MemoryStorageManager())
+        blueprints_manager = mock.Mock(sm=self.sm)
+        blueprints_manager._merge_and_validate_execution_parameters.\
+            return_value = {}
+        self.scheduler = ExecutionScheduler(blueprints_manager)
+        self.workflow_client = mock.Mock()
+        patcher = mock.patch('manager_rest.execution_scheduler.'
+                             'workflow_client',
+                             return_value=self.workflow_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        context = Flask(__name__).app_context()
+        context.push()
+        self.addCleanup(context.pop)
+        self.addCleanup(setattr, config.instance(), 'execution_scheduling',
+                        config.instance().execution_scheduling)
+        config.instance().execution_scheduling = {
+            'max_running_executions': 2}
+
+    def _put_execution(self, deployment_id, status, created_at=NOW):
+        self.sm.put_deployment(deployment_id, models.Deployment(
+            id=deployment_id, created_at=NOW, updated_at=NOW,
+            blueprint_id='blueprint', workflows={'install': {}}, inputs={},
+            policy_types={}, policy_triggers={}, groups={}, outputs={}))
+        execution_id = '{0}-install'.format(deployment_id)
+        self.sm.put_execution(execution_id, models.Execution(
+            id=execution_id, status=status, deployment_id=deployment_id,
+            workflow_id='install', blueprint_id='blueprint',
+            created_at=created_at, error='', parameters={}))
+        return execution_id
+
+    def test_dispatch_starts_up_to_limit(self):
+        self._put_execution('running', models.Execution.STARTED)
+        queued = [self._put_execution(
+            'deployment-{0}'.format(i), models.Execution.QUEUED,
+            created_at='2015-01-01 00:00:0{0}.000000'.format(i))
+            for i in range(3)]
+        self.sm.executions_list.reset_mock()
+
+        started = self.scheduler.dispatch('running')
+
+        self.assertEqual([queued[0]], [e.id for e in started])
+        self.assertEqual(models.Execution.PENDING,
+                         self.sm.get_execution(queued[0]).status)
+        self.assertEqual(models.Execution.QUEUED,
+                         self.sm.get_execution(queued[1]).status)
+        self.assertEqual(1, self.workflow_client.execute_workflow.call_count)
+        # the executions in progress are counted off a single summary, and
+        # only the queued executions are listed
+        self.assertEqual(1, self.sm.executions_summary.call_count)
+        self.assertEqual(1, self.sm.executions_list.call_count)
+
+    def test_dispatch_at_capacity_does_not_list_queue(self):
+        self._put_execution('running-1', models.Execution.STARTED)
+        self._put_execution('running-2', models.Execution.PENDING)
+        queued = self._put_execution('queued', models.Execution.QUEUED)
+        self.sm.executions_list.reset_mock()
+
+        self.assertEqual([], self.scheduler.dispatch('running-1'))
+
+        self.assertEqual(models.Execution.QUEUED,
+                         self.sm.get_execution(queued).status)
+        self.assertFalse(self.sm.executions_list.called)
+
+    def test_dispatch_skips_busy_deployments(self):
+        config.instance().execution_scheduling = {
+            'max_running_executions': 3}
+        self._put_execution('busy', models.Execution.STARTED)
+        self.sm.put_execution('busy-update', models.Execution(
+            id='busy-update', status=models.Execution.QUEUED,
+            deployment_id='busy', workflow_id='update',
+            blueprint_id='blueprint', created_at=NOW, error='',
+            parameters={}))
+        queued = self._put_execution('idle', models.Execution.QUEUED,
+                                     created_at='2015-01-01 00:00:01.000000')
+
+        started = self.scheduler.dispatch('busy')
+
+        self.assertEqual([queued], [e.id for e in started])
+        self.assertEqual(models.Execution.QUEUED,
+                         self.sm.get_execution('busy-update').status)
+
+    def test_unlimited_dispatch_of_busy_deployment(self):
+        config.instance().execution_scheduling = None
+        self._put_execution('busy', models.Execution.STARTED)
+        self.sm.executions_list.reset_mock()
+
+        self.assertEqual([], self.scheduler.dispatch('busy'))
+
+        self.assertFalse(self.sm.executions_list.called)
+
+    def _end_without_dispatch(self, execution_id):
+        # e.g. the management worker died, or the status was written
+        # straight to the storage
+        self.sm.update_execution_status(execution_id,
+                                        models.Execution.TERMINATED, '')
+
+    def test_sweep_starts_execution_left_queued(self):
+        config.instance().execution_scheduling = None
+        running = self._put_execution('deployment', models.Execution.STARTED)
+        self.sm.put_execution('deployment-reinstall', models.Execution(
+            id='deployment-reinstall', status=models.Execution.QUEUED,
+            deployment_id='deployment', workflow_id='install',
+            blueprint_id='blueprint', created_at=NOW, error='',
+            parameters={}))
+        self.assertEqual([], self.scheduler.dispatch())
+
+        self._end_without_dispatch(running)
+
+        started = self.scheduler.dispatch()
+        self.assertEqual(['deployment-reinstall'], [e.id for e in started])
+        self.assertEqual(models.Execution.PENDING,
+                         self.sm.get_execution('deployment-reinstall').status)
+
+    def test_sweep_frees_the_slot_of_execution_ended_without_update(self):
+        running = [self._put_execution('running-{0}'.format(i),
+                                       models.Execution.STARTED)
+                   for i in range(2)]
+        queued = self._put_execution('queued', models.Execution.QUEUED)
+        self.assertEqual([], self.scheduler.dispatch())
+
+        self._end_without_dispatch(running[0])
+
+        self.assertEqual([queued], [e.id for e in self.scheduler.dispatch()])
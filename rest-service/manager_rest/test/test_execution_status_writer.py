@@ -0,0 +1,118 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import unittest
+
+from manager_rest import models
+from manager_rest.execution_status_writer import ExecutionStatusWriter
+
+
+class RecordingStorageManager(object):
+
+    def __init__(self):
+        self.writes = []
+        self.fail = False
+
+    def update_execution_status(self, execution_id, status, error):
+        self.writes.append([(execution_id, status, error)])
+
+    def update_executions_status(self, updates):
+        if self.fail:
+            raise RuntimeError('storage unavailable')
+        self.writes.append(list(updates))
+
+
+def _execution(execution_id, status=models.Execution.PENDING):
+    return models.Execution(id=execution_id, status=status,
+                            deployment_id='deployment',
+                            workflow_id='install', blueprint_id='blueprint',
+                            created_at='now', error='', parameters={})
+
+
+class ExecutionStatusWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sm = RecordingStorageManager()
+        # flushed explicitly by the tests
+        self.writer = ExecutionStatusWriter(lambda: self.sm,
+                                            flush_interval=3600)
+
+    def test_superseded_updates_coalesced(self):
+        self.assertTrue(self.writer.update('e1', models.Execution.PENDING,
+                                           None))
+        self.writer.update('e2', models.Execution.PENDING, None)
+        self.writer.update('e1', models.Execution.STARTED, None)
+        self.assertEqual([], self.sm.writes)
+        self.assertEqual(models.Execution.STARTED,
+                         self.writer.overlay(_execution('e1')).status)
+        self.assertEqual(2, self.writer.flush())
+        self.assertEqual([[('e1', models.Execution.STARTED, None),
+                           ('e2', models.Execution.PENDING, None)]],
+                         self.sm.writes)
+        self.assertEqual(1, self.writer.coalesced)
+        self.assertEqual(models.Execution.PENDING,
+                         self.writer.overlay(_execution('e1')).status)
+        self.assertEqual(0, self.writer.flush())
+        self.assertEqual(1, len(self.sm.writes))
+
+    def test_buffered_update_read_back(self):
+        self.writer.update('e1', models.Execution.STARTED, 'error')
+        execution = self.writer.overlay(_execution('e1'))
+        self.assertEqual(models.Execution.STARTED, execution.status)
+        self.assertEqual('error', execution.error)
+        # ended meanwhile (e.g. through another rest worker)
+        execution = self.writer.overlay(
+            _execution('e1', status=models.Execution.TERMINATED))
+        self.assertEqual(models.Execution.TERMINATED, execution.status)
+        self.assertEqual('', execution.error)
+
+    def test_terminal_status_written_synchronously(self):
+        self.writer.update('e1', models.Execution.STARTED, None)
+        self.writer.update('e2', models.Execution.STARTED, None)
+        self.assertFalse(self.writer.update(
+            'e1', models.Execution.FAILED, 'error'))
+        # the buffered update of e1 is superseded, and never written
+        self.assertEqual([[('e1', models.Execution.FAILED, 'error')]],
+                         self.sm.writes)
+        self.writer.flush()
+        self.assertEqual([('e2', models.Execution.STARTED, None)],
+                         self.sm.writes[-1])
+
+    def test_synchronous_write(self):
+        self.writer.update('e1', models.Execution.STARTED, None)
+        self.writer.write('e1', models.Execution.CANCELLING, '')
+        self.writer.flush()
+        self.assertEqual([[('e1', models.Execution.CANCELLING, '')]],
+                         self.sm.writes)
+
+    def test_disabled(self):
+        writer = ExecutionStatusWriter(lambda: self.sm, flush_interval=0)
+        self.assertFalse(writer.update('e1', models.Execution.STARTED,
+                                       None))
+        self.assertEqual([[('e1', models.Execution.STARTED, None)]],
+                         self.sm.writes)
+
+    def test_failed_flush_retried(self):
+        self.writer.update('e1', models.Execution.PENDING, None)
+        self.writer.update('e2', models.Execution.PENDING, None)
+        self.sm.fail = True
+        self.assertRaises(RuntimeError, self.writer.flush)
+        self.sm.fail = False
+        # the update received meanwhile supersedes the one not written
+        self.writer.update('e1', models.Execution.STARTED, None)
+        self.writer.flush()
+        self.assertEqual([[('e1', models.Execution.STARTED, None),
+                           ('e2', models.Execution.PENDING, None)]],
+                         self.sm.writes)
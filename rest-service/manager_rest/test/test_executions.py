@@ -20,6 +20,7 @@ from cloudify_rest_client import exceptions
 
 from manager_rest import manager_exceptions
 from manager_rest import models
+from manager_rest import storage_manager
 
 from base_test import BaseServerTestCase
 
@@ -383,6 +384,118 @@ class ExecutionsTestCase(BaseServerTestCase):
             except exceptions.CloudifyClientError, e:
                 self.assertEqual(expected_status_code, e.status_code)
 
+    def test_queued_executions_started_in_order(self):
+        _, deployment_id, _, _ = self.put_deployment(self.DEPLOYMENT_ID)
+        with mock.patch('manager_rest.test.mocks.task_state',
+                        return_value=models.Execution.STARTED):
+            running = self.client.executions.start(deployment_id, 'install')
+            first = self._queue_execution(deployment_id)
+            second = self._queue_execution(deployment_id)
+            self.assertEqual(models.Execution.QUEUED, first['status'])
+            self.assertEqual(models.Execution.QUEUED, second['status'])
+
+            self._modify_execution_status(running.id,
+                                          models.Execution.TERMINATED)
+            self.assertEqual(models.Execution.STARTED,
+                             self.client.executions.get(first['id']).status)
+            self.assertEqual(models.Execution.QUEUED,
+                             self.client.executions.get(second['id']).status)
+
+            self._modify_execution_status(first['id'],
+                                          models.Execution.FAILED)
+            self.assertEqual(models.Execution.STARTED,
+                             self.client.executions.get(second['id']).status)
+
+    def test_queued_execution_without_running_executions(self):
+        _, deployment_id, _, _ = self.put_deployment(self.DEPLOYMENT_ID)
+        execution = self._queue_execution(deployment_id)
+        # started right away rather than queued; the response holds the
+        # status the execution was started with
+        self.assertEqual(models.Execution.PENDING, execution['status'])
+        self.assertEqual(models.Execution.TERMINATED,
+                         self.client.executions.get(execution['id']).status)
+
+    def test_queued_execution_started_by_queue_summary(self):
+        _, deployment_id, _, _ = self.put_deployment(self.DEPLOYMENT_ID)
+        with mock.patch('manager_rest.test.mocks.task_state',
+                        return_value=models.Execution.STARTED):
+            running = self.client.executions.start(deployment_id, 'install')
+            queued = self._queue_execution(deployment_id)
+        # the execution ends without a status update through the rest
+        # service, so nothing dispatches the queued execution
+        storage_manager.get_storage_manager().update_execution_status(
+            running.id, models.Execution.TERMINATED, '')
+        self.assertEqual(models.Execution.QUEUED,
+                         self.client.executions.get(queued['id']).status)
+
+        self.get('/summary/execution-queue')
+
+        self.assertEqual(models.Execution.TERMINATED,
+                         self.client.executions.get(queued['id']).status)
+
+    def test_cancel_queued_execution(self):
+        _, deployment_id, _, _ = self.put_deployment(self.DEPLOYMENT_ID)
+        with mock.patch('manager_rest.test.mocks.task_state',
+                        return_value=models.Execution.STARTED):
+            running = self.client.executions.start(deployment_id, 'install')
+            queued = self._queue_execution(deployment_id)
+            response = self.post('/executions/{0}'.format(queued['id']),
+                                 {'action': 'cancel'})
+            self.assertEqual(models.Execution.CANCELLED,
+                             response.json['status'])
+            self._modify_execution_status(running.id,
+                                          models.Execution.TERMINATED)
+            self.assertEqual(models.Execution.CANCELLED,
+                             self.client.executions.get(queued['id']).status)
+
+    def _queue_execution(self, deployment_id, workflow_id='install'):
+        response = self.post('/executions', {'deployment_id': deployment_id,
+                                             'workflow_id': workflow_id,
+                                             'queue': True})
+        self.assertEqual(201, response.status_code)
+        return response.json
+
+    def test_execute_with_idempotency_key(self):
+        _, deployment_id, _, _ = self.put_deployment(self.DEPLOYMENT_ID)
+        request = {'deployment_id': deployment_id,
+                   'workflow_id': 'install',
+                   'idempotency_key': 'request-1'}
+        first = self.post('/executions', request)
+        self.assertEqual(201, first.status_code)
+        second = self.post('/executions', request)
+        self.assertEqual(201, second.status_code)
+        self.assertEqual(first.json['id'], second.json['id'])
+
+        request['idempotency_key'] = 'request-2'
+        third = self.post('/executions', request)
+        self.assertNotEqual(first.json['id'], third.json['id'])
+
+    def test_execute_with_dedup_window(self):
+        _, deployment_id, _, _ = self.put_deployment(self.DEPLOYMENT_ID)
+        with mock.patch('manager_rest.test.mocks.task_state',
+                        return_value=models.Execution.STARTED):
+            request = {'deployment_id': deployment_id,
+                       'workflow_id': 'install',
+                       'dedup_window': 60}
+            first = self.post('/executions', request)
+            # a duplicate is not rejected although the first one is running
+            duplicate = self.post('/executions', request)
+            self.assertEqual(201, duplicate.status_code)
+            self.assertEqual(first.json['id'], duplicate.json['id'])
+
+            request.update(parameters={'param': 'value'},
+                           allow_custom_parameters=True,
+                           force=True)
+            other = self.post('/executions', request)
+            self.assertNotEqual(first.json['id'], other.json['id'])
+
+    def test_execute_with_negative_dedup_window(self):
+        _, deployment_id, _, _ = self.put_deployment(self.DEPLOYMENT_ID)
+        response = self.post('/executions', {'deployment_id': deployment_id,
+                                             'workflow_id': 'install',
+                                             'dedup_window': -1})
+        self.assertEqual(400, response.status_code)
+
     def test_get_non_existent_execution(self):
         resource_path = '/executions/idonotexist'
         response = self.get(resource_path)
@@ -398,6 +511,15 @@ class ExecutionsTestCase(BaseServerTestCase):
             models.Execution.STARTED,
             exceptions.DeploymentEnvironmentCreationInProgressError)
 
+    def test_start_execution_after_dep_env_update(self):
+        with mock.patch('manager_rest.test.mocks.task_state',
+                        return_value=models.Execution.PENDING):
+            _, deployment_id, _, _ = self.put_deployment(self.DEPLOYMENT_ID)
+        env_creation, = self.client.executions.list(deployment_id)
+        self._modify_execution_status(env_creation.id,
+                                      models.Execution.TERMINATED)
+        self.client.executions.start(deployment_id, 'install')
+
     def _test_start_execution_dep_env(self, task_state, expected_ex):
         with mock.patch('manager_rest.test.mocks.task_state',
                         return_value=task_state):
@@ -409,3 +531,83 @@ class ExecutionsTestCase(BaseServerTestCase):
         execution = self.client.executions.update(execution_id, new_status)
         self.assertEquals(new_status, execution.status)
         return execution
+
+
+class ExecutionLimitsTestCase(BaseServerTestCase):
+
+    def create_configuration(self):
+        test_config = super(ExecutionLimitsTestCase,
+                            self).create_configuration()
+        test_config.execution_scheduling = {'max_running_executions': 2}
+        return test_config
+
+    def test_executions_queued_over_limit(self):
+        deployment_ids = ['deployment-{0}'.format(i) for i in range(3)]
+        for deployment_id in deployment_ids:
+            self.put_deployment(deployment_id,
+                                blueprint_id='blueprint-' + deployment_id)
+        with mock.patch('manager_rest.test.mocks.task_state',
+                        return_value=models.Execution.STARTED):
+            executions = [self.client.executions.start(deployment_id,
+                                                       'install')
+                          for deployment_id in deployment_ids]
+            self.assertEqual([models.Execution.STARTED,
+                              models.Execution.STARTED,
+                              models.Execution.QUEUED],
+                             [e.status for e in executions])
+
+            summary = self.get('/summary/execution-queue').json
+            self.assertEqual(2, summary['running'])
+            self.assertEqual(1, summary['queued'])
+            self.assertEqual({'install': 1}, summary['queued_per_workflow'])
+            self.assertIsInstance(summary['max_wait'], (int, float))
+            self.assertIsInstance(summary['mean_wait'], (int, float))
+
+            self.client.executions.update(executions[0].id,
+                                          models.Execution.TERMINATED)
+            self.assertEqual(
+                models.Execution.STARTED,
+                self.client.executions.get(executions[2].id).status)
+            self.assertEqual(
+                0, self.get('/summary/execution-queue').json['queued'])
+
+
+class BufferedExecutionStatusTestCase(BaseServerTestCase):
+
+    def create_configuration(self):
+        test_config = super(BufferedExecutionStatusTestCase,
+                            self).create_configuration()
+        # flushed explicitly by the test
+        test_config.execution_status_flush_interval = 3600
+        return test_config
+
+    def test_status_updates_buffered(self):
+        from manager_rest import server
+        self.put_deployment('deployment')
+        with mock.patch('manager_rest.test.mocks.task_state',
+                        return_value=models.Execution.STARTED):
+            execution = self.client.executions.start('deployment', 'install')
+        execution = self.client.executions.update(execution.id,
+                                                  'new-status')
+        self.assertEqual('new-status', execution.status)
+        # the buffered update is read back before it is written
+        self.assertEqual('new-status',
+                         self.client.executions.get(execution.id).status)
+        self.assertEqual(['new-status'], [
+            e.status for e in self.client.executions.list('deployment')
+            if e.id == execution.id])
+        self.assertEqual(models.Execution.STARTED,
+                         storage_manager.instance().get_execution(
+                             execution.id).status)
+
+        self.assertEqual(1, server.app.execution_status_writer.flush())
+        self.assertEqual('new-status',
+                         self.client.executions.get(execution.id).status)
+
+        # terminal statuses are written right away
+        self.client.executions.update(execution.id, 'other-status')
+        self.client.executions.update(execution.id,
+                                      models.Execution.TERMINATED)
+        self.assertEqual(models.Execution.TERMINATED,
+                         self.client.executions.get(execution.id).status)
+        self.assertEqual(0, server.app.execution_status_writer.flush())
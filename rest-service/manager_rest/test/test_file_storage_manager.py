@@ -0,0 +1,88 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from manager_rest.file_storage_manager import FileStorageManager
+from manager_rest.test.mocks import node_instance
+
+
+class FileStorageManagerJournalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.storage_path = os.path.join(self.tmpdir, 'storage.json')
+        self.journal_path = '{0}.journal'.format(self.storage_path)
+
+    def test_recover_from_journal(self):
+        sm = FileStorageManager(self.storage_path)
+        sm.put_node_instance(node_instance('vm_1'))
+        sm.put_node_instance(node_instance('vm_2'))
+        sm.update_node_instance(node_instance('vm_1', state='deleted'))
+        sm.delete_node_instance('vm_2')
+        # no compaction happened; all the state is in the journal
+        self.assertFalse(os.path.exists(self.storage_path))
+
+        recovered = FileStorageManager(self.storage_path, recover=True)
+        self.assertEquals(['vm_1'],
+                          [i.id for i in recovered.node_instances_list()])
+        self.assertEquals('deleted',
+                          recovered.get_node_instance('vm_1').state)
+
+    def test_recover_ignores_truncated_entry(self):
+        sm = FileStorageManager(self.storage_path)
+        sm.put_node_instance(node_instance('vm_1'))
+        with open(self.journal_path, 'a') as f:
+            f.write('{"op": "put", "type": "node_inst')
+
+        recovered = FileStorageManager(self.storage_path, recover=True)
+        self.assertEquals(['vm_1'],
+                          [i.id for i in recovered.node_instances_list()])
+
+    def test_entries_appended_after_truncated_entry(self):
+        sm = FileStorageManager(self.storage_path)
+        sm.put_node_instance(node_instance('vm_1'))
+        with open(self.journal_path, 'a') as f:
+            f.write('{"op": "put", "type": "node_inst')
+
+        recovered = FileStorageManager(self.storage_path, recover=True)
+        recovered.put_node_instance(node_instance('vm_2'))
+        recovered = FileStorageManager(self.storage_path, recover=True)
+        self.assertEquals(['vm_1', 'vm_2'],
+                          sorted(i.id for i in
+                                 recovered.node_instances_list()))
+
+    def test_compaction(self):
+        sm = FileStorageManager(self.storage_path, compaction_threshold=1)
+        sm.put_node_instance(node_instance('vm_1'))
+        sm.put_node_instance(node_instance('vm_2'))
+        self.assertTrue(os.path.exists(self.storage_path))
+        self.assertEquals(0, os.path.getsize(self.journal_path))
+
+        recovered = FileStorageManager(self.storage_path, recover=True)
+        self.assertEquals(['vm_1', 'vm_2'],
+                          sorted(i.id for i in
+                                 recovered.node_instances_list()))
+
+    def test_no_recovery_starts_empty(self):
+        sm = FileStorageManager(self.storage_path)
+        sm.put_node_instance(node_instance('vm_1'))
+        sm.close()
+        self.assertEquals([], FileStorageManager(
+            self.storage_path).node_instances_list())
@@ -46,6 +46,22 @@ class IncludeQueryParamTests(BaseServerTestCase):
             lambda: self.client.blueprints.get(blueprint_id,
                                                _include=['hello']))
 
+    def test_blueprints_list_default_fields(self):
+        blueprint = self.client.blueprints.list()[0]
+        self.assertEqual({'id', 'created_at', 'updated_at'},
+                         set(blueprint.keys()))
+        blueprint = self.client.blueprints.list(_include=['id', 'plan'])[0]
+        self.assertIsNotNone(blueprint.plan)
+
+    def test_deployments_list_default_fields(self):
+        deployment = self.client.deployments.list()[0]
+        self.assertNotIn('workflows', deployment)
+        self.assertNotIn('groups', deployment)
+        self.assertIn('blueprint_id', deployment)
+        deployment = self.client.deployments.list(
+            _include=['id', 'workflows'])[0]
+        self.assertTrue(deployment.workflows)
+
     def test_deployments(self):
         response = self.client.deployments.list(_include=['id'])
         for d in response:
@@ -0,0 +1,99 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import tempfile
+from datetime import datetime
+
+from manager_rest import models
+from manager_rest import manager_exceptions
+from manager_rest import memory_storage_manager
+from manager_rest.test.mocks import node_instance
+import test_storage_manager
+
+
+class MemoryStorageManagerTests(test_storage_manager.StorageManagerTests):
+
+    storage_manager_module_name = 'memory_storage_manager'
+
+
+class MemoryStorageManagerIndexesTests(test_storage_manager.base_test
+                                       .BaseServerTestCase):
+
+    def _execution(self, execution_id, deployment_id, status):
+        return models.Execution(id=execution_id,
+                                status=status,
+                                deployment_id=deployment_id,
+                                workflow_id='install',
+                                blueprint_id='blueprint-id',
+                                created_at=str(datetime.now()),
+                                error='',
+                                parameters={})
+
+    def test_indexed_lookups(self):
+        sm = memory_storage_manager.MemoryStorageManager()
+        sm.put_node_instance(node_instance('vm_1', 'dep-1', 'vm'))
+        sm.put_node_instance(node_instance('vm_2', 'dep-2', 'vm'))
+        sm.put_node_instance(node_instance('db_1', 'dep-1', 'db'))
+
+        self.assertEquals(
+            ['vm_1', 'db_1'],
+            [i.id for i in sm.get_node_instances('dep-1')])
+        self.assertEquals(
+            ['vm_1'],
+            [i.id for i in sm.get_node_instances('dep-1', node_id='vm')])
+        self.assertEquals(
+            [], sm.get_node_instances('dep-3'))
+
+    def test_index_updated_on_status_change(self):
+        sm = memory_storage_manager.MemoryStorageManager()
+        sm.put_execution('e1', self._execution('e1', 'dep-1', 'pending'))
+        sm.update_execution_status('e1', 'terminated', '')
+        self.assertEquals({'terminated': {'e1': True}},
+                          sm._indexes['executions']['status'])
+
+    def test_delete_deployment_cascades(self):
+        sm = memory_storage_manager.MemoryStorageManager()
+        now = str(datetime.now())
+        sm.put_deployment('dep-1', models.Deployment(
+            id='dep-1', created_at=now, updated_at=now,
+            blueprint_id='blueprint-id', plan={}, permalink=None,
+            workflows={}, inputs={}, policy_types={}, policy_triggers={},
+            groups={}, outputs={}))
+        sm.put_node_instance(node_instance('vm_1', 'dep-1', 'vm'))
+        sm.put_execution('e1', self._execution('e1', 'dep-1', 'pending'))
+        sm.delete_deployment('dep-1')
+        self.assertEquals([], sm.node_instances_list())
+        self.assertEquals([], sm.executions_list())
+        self.assertRaises(manager_exceptions.NotFoundError,
+                          sm.get_execution, 'e1')
+
+    def test_snapshot(self):
+        snapshot_path = tempfile.mkstemp()[1]
+        os.remove(snapshot_path)
+        self.addCleanup(lambda: os.path.exists(snapshot_path) and
+                        os.remove(snapshot_path))
+        sm = memory_storage_manager.MemoryStorageManager(
+            snapshot_path=snapshot_path)
+        sm.put_node_instance(node_instance('vm_1', 'dep-1', 'vm'))
+        sm.close()
+
+        restored = memory_storage_manager.MemoryStorageManager(
+            snapshot_path=snapshot_path)
+        self.assertEquals(
+            sm.get_node_instance('vm_1').to_dict(),
+            restored.get_node_instance('vm_1').to_dict())
+        self.assertEquals(
+            ['vm_1'], [i.id for i in restored.get_node_instances('dep-1')])
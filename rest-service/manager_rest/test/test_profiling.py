@@ -0,0 +1,78 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import pstats
+import unittest
+
+import mock
+from elasticsearch import Transport
+
+from manager_rest import profiling
+from base_test import BaseServerTestCase
+
+
+class TracingTransportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = profiling.TracingTransport([{'host': 'localhost'}])
+
+    def tearDown(self):
+        profiling._local.trace = None
+
+    @mock.patch.object(Transport, 'perform_request', return_value={})
+    def test_calls_traced(self, _):
+        trace = profiling._local.trace = profiling.StorageTrace()
+        self.transport.perform_request('GET', '/index/type/id')
+        self.transport.perform_request('POST', '/index/_search', body={})
+        self.assertEqual([('GET', '/index/type/id'),
+                          ('POST', '/index/_search')],
+                         [call[:2] for call in trace.calls])
+        self.assertEqual(sum(call[2] for call in trace.calls),
+                         trace.total_time)
+
+    @mock.patch.object(Transport, 'perform_request', return_value={})
+    def test_calls_not_traced_unless_profiling(self, _):
+        self.transport.perform_request('GET', '/index/type/id')
+        self.assertIsNone(profiling.current_trace())
+
+
+class ProfilingServerTest(BaseServerTestCase):
+
+    def create_configuration(self):
+        test_config = super(ProfilingServerTest, self).create_configuration()
+        test_config.request_profiling = {
+            'token': 'profiling-token',
+            'profiles_dir': os.path.join(self.tmpdir, 'profiles')
+        }
+        return test_config
+
+    def test_profiled_request(self):
+        response = self.get('/blueprints', headers={
+            profiling.PROFILE_HEADER: 'profiling-token'})
+        self.assertEqual(200, response.status_code)
+        self.assertIn(profiling.STORAGE_CALLS_HEADER, response.headers)
+        self.assertIn(profiling.STORAGE_TIME_HEADER, response.headers)
+        profile_file = os.path.join(
+            self.tmpdir, 'profiles',
+            response.headers[profiling.PROFILE_FILE_HEADER])
+        self.assertTrue(pstats.Stats(profile_file).total_calls > 0)
+
+    def test_invalid_token(self):
+        response = self.get('/blueprints', headers={
+            profiling.PROFILE_HEADER: 'guessed-token'})
+        self.assertEqual(200, response.status_code)
+        self.assertNotIn(profiling.PROFILE_FILE_HEADER, response.headers)
+        self.assertNotIn(profiling.STORAGE_CALLS_HEADER, response.headers)
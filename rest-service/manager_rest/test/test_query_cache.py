@@ -0,0 +1,145 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import time
+import threading
+import unittest
+
+from manager_rest.query_cache import QueryCache, canonical_key
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class QueryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.queries = 0
+
+    def query(self, result='result'):
+        def query():
+            self.queries += 1
+            return result
+        return query
+
+    def test_canonical_key(self):
+        self.assertEqual(
+            canonical_key('search', {'query': {'match_all': {}}, 'size': 1}),
+            canonical_key('search', {'size': 1, 'query': {'match_all': {}}}))
+        self.assertNotEqual(canonical_key('search', {'size': 1}),
+                            canonical_key('events', {'size': 1}))
+
+    def test_ttl(self):
+        cache = QueryCache(ttl=2, max_entries=10, clock=self.clock)
+        self.assertEqual('result', cache.get('key', self.query()))
+        self.clock.now += 1
+        self.assertEqual('result', cache.get('key', self.query()))
+        self.assertEqual(1, self.queries)
+        self.clock.now += 1
+        self.assertEqual('new', cache.get('key', self.query('new')))
+        self.assertEqual(2, self.queries)
+        self.assertEqual((1, 2), (cache.hits, cache.misses))
+
+    def test_disabled(self):
+        cache = QueryCache(ttl=0, max_entries=10, clock=self.clock)
+        cache.get('key', self.query())
+        cache.get('key', self.query())
+        self.assertEqual(2, self.queries)
+
+    def test_size_bound(self):
+        cache = QueryCache(ttl=10, max_entries=2, clock=self.clock)
+        cache.get('a', self.query())
+        cache.get('b', self.query())
+        # 'a' becomes the most recently used entry, so 'b' is evicted
+        cache.get('a', self.query())
+        cache.get('c', self.query())
+        self.assertEqual(3, self.queries)
+        cache.get('a', self.query())
+        cache.get('b', self.query())
+        self.assertEqual(4, self.queries)
+
+    def test_errors_are_not_cached(self):
+        cache = QueryCache(ttl=10, max_entries=10, clock=self.clock)
+
+        def failing_query():
+            raise RuntimeError('failed')
+        self.assertRaises(RuntimeError, cache.get, 'key', failing_query)
+        self.assertEqual('result', cache.get('key', self.query()))
+
+    def test_concurrent_queries_coalesced(self):
+        cache = QueryCache(ttl=0, max_entries=10, clock=self.clock)
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_query():
+            started.set()
+            release.wait()
+            return self.query()()
+
+        results = []
+
+        def get():
+            results.append(cache.get('key', slow_query))
+        leader = threading.Thread(target=get)
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=get) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        while cache.coalesced < len(followers):
+            time.sleep(0.01)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join()
+
+        self.assertEqual(['result'] * 4, results)
+        self.assertEqual(1, self.queries)
+        self.assertEqual(3, cache.coalesced)
+
+    def test_coalesced_error(self):
+        cache = QueryCache(ttl=10, max_entries=10, clock=self.clock)
+        started = threading.Event()
+        release = threading.Event()
+
+        def failing_query():
+            started.set()
+            release.wait()
+            raise RuntimeError('failed')
+
+        errors = []
+
+        def get():
+            try:
+                cache.get('key', failing_query)
+            except RuntimeError, e:
+                errors.append(e)
+        leader = threading.Thread(target=get)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=get)
+        follower.start()
+        while cache.coalesced < 1:
+            time.sleep(0.01)
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(2, len(errors))
@@ -0,0 +1,182 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import StringIO
+
+import mock
+
+from manager_rest import models
+from manager_rest import snapshots
+from manager_rest import manager_exceptions
+from manager_rest.memory_storage_manager import (MemoryStorageManager,
+                                                 NODE_INSTANCES,
+                                                 PROVIDER_CONTEXT)
+from manager_rest.test.benchmarks import storage_benchmark
+
+NOW = '2015-01-01 00:00:00.000000'
+
+
+def _populate(sm, deployments, instances):
+    sm.put_provider_context(models.ProviderContext(name='provider',
+                                                   context={'a': 1}))
+    sm.put_blueprint('blueprint', models.BlueprintState(
+        id='blueprint', created_at=NOW, updated_at=NOW,
+        plan={'nodes': ['vm']}))
+    for d in range(deployments):
+        deployment_id = 'deployment-{0}'.format(d)
+        sm.put_deployment(deployment_id, models.Deployment(
+            id=deployment_id, created_at=NOW, updated_at=NOW,
+            blueprint_id='blueprint', workflows={'install': {}}, inputs={},
+            policy_types={}, policy_triggers={}, groups={}, outputs={}))
+        sm.put_node(storage_benchmark._node(deployment_id, 'vm', instances))
+        for i in range(instances):
+            sm.put_node_instance(storage_benchmark._node_instance(
+                deployment_id, 'vm', i, runtime_properties={'index': i}))
+        execution_id = '{0}-install'.format(deployment_id)
+        sm.put_execution(execution_id, models.Execution(
+            id=execution_id, status=models.Execution.TERMINATED,
+            deployment_id=deployment_id, workflow_id='install',
+            blueprint_id='blueprint', created_at=NOW, error='',
+            parameters={}))
+        modification_id = '{0}-modification'.format(deployment_id)
+        sm.put_deployment_modification(
+            modification_id, models.DeploymentModification(
+                id=modification_id, created_at=NOW, ended_at=NOW,
+                status=models.DeploymentModification.FINISHED,
+                deployment_id=deployment_id,
+                modified_nodes={'vm': {'instances': instances}},
+                node_instances={'added_and_related': []}, context={}))
+
+
+def _exported(sm):
+    return {storage_type: storage_benchmark.normalize('export_docs', [
+        doc for batch in sm.export_docs(storage_type, 1000)
+        for doc in batch]) for storage_type in snapshots.STORAGE_TYPES}
+
+
+class SnapshotsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source_root = os.path.join(self.tmpdir, 'source')
+        self.target_root = os.path.join(self.tmpdir, 'target')
+        os.makedirs(os.path.join(self.source_root, 'blueprints', 'blueprint'))
+        os.makedirs(self.target_root)
+        with open(os.path.join(self.source_root, 'blueprints', 'blueprint',
+                               'blueprint.yaml'), 'w') as f:
+            f.write('nodes: {}\n')
+        self.source = MemoryStorageManager()
+        _populate(self.source, deployments=3, instances=4)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def create_snapshot(self, batch_size=2):
+        snapshot = StringIO.StringIO()
+        counts = snapshots.create_snapshot(
+            self.source, snapshot, self.source_root,
+            ['blueprints', 'uploaded-blueprints'], batch_size=batch_size)
+        snapshot.seek(0)
+        return snapshot, counts
+
+    def test_restore_into_every_backend(self):
+        snapshot, counts = self.create_snapshot()
+        self.assertEqual(12, counts['node_instances'])
+        for backend_name, factory in storage_benchmark.BACKENDS.items():
+            target_root = os.path.join(self.target_root, backend_name)
+            os.makedirs(target_root)
+            target = factory(self.tmpdir)
+            snapshot.seek(0)
+            restored = snapshots.restore_snapshot(target, snapshot,
+                                                  target_root, workers=3)
+            self.assertEqual(counts, restored)
+            self.assertEqual(_exported(self.source), _exported(target),
+                             backend_name)
+            self.assertTrue(os.path.isfile(os.path.join(
+                target_root, 'blueprints', 'blueprint', 'blueprint.yaml')))
+            for storage_file in ('storage.json', 'storage.db'):
+                path = os.path.join(self.tmpdir, storage_file)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def test_restore_into_manager_with_deployments(self):
+        snapshot, _ = self.create_snapshot()
+        target = MemoryStorageManager()
+        _populate(target, deployments=1, instances=1)
+        self.assertRaises(manager_exceptions.ConflictError,
+                          snapshots.restore_snapshot, target, snapshot,
+                          self.target_root)
+
+    def test_provider_context_kept(self):
+        snapshot, _ = self.create_snapshot()
+        target = MemoryStorageManager()
+        target.put_provider_context(models.ProviderContext(
+            name='target', context={}))
+        restored = snapshots.restore_snapshot(target, snapshot,
+                                              self.target_root)
+        self.assertEqual(1, restored[PROVIDER_CONTEXT])
+        self.assertEqual('target', target.get_provider_context().name)
+        self.assertEqual(3, len(target.deployments_list()))
+
+    def _incomplete_snapshot(self):
+        snapshot, _ = self.create_snapshot()
+        incomplete = StringIO.StringIO()
+        with tarfile.open(fileobj=snapshot, mode='r|gz') as source_tar:
+            with tarfile.open(fileobj=incomplete, mode='w|gz') as tar:
+                for member in source_tar:
+                    if member.name != snapshots.COUNTS_FILE:
+                        tar.addfile(member, source_tar.extractfile(member))
+        incomplete.seek(0)
+        return incomplete
+
+    def test_incomplete_snapshot(self):
+        self.assertRaises(ValueError, snapshots.restore_snapshot,
+                          MemoryStorageManager(), self._incomplete_snapshot(),
+                          self.target_root)
+
+    def test_failed_restore_rolled_back(self):
+        snapshot, _ = self.create_snapshot()
+        target = MemoryStorageManager()
+        import_docs = target.import_docs
+
+        def failing_import_docs(storage_type, docs):
+            if storage_type == NODE_INSTANCES:
+                raise RuntimeError('failed writing {0}'.format(storage_type))
+            import_docs(storage_type, docs)
+
+        with mock.patch.object(target, 'import_docs',
+                               side_effect=failing_import_docs):
+            self.assertRaises(RuntimeError, snapshots.restore_snapshot,
+                              target, snapshot, self.target_root, workers=1)
+        self.assertEqual(
+            dict((storage_type, []) for storage_type in
+                 snapshots.STORAGE_TYPES), _exported(target))
+        self.assertEqual([], os.listdir(self.target_root))
+
+        snapshot.seek(0)
+        snapshots.restore_snapshot(target, snapshot, self.target_root)
+        self.assertEqual(_exported(self.source), _exported(target))
+
+    def test_incomplete_snapshot_rolled_back(self):
+        target = MemoryStorageManager()
+        self.assertRaises(ValueError, snapshots.restore_snapshot, target,
+                          self._incomplete_snapshot(), self.target_root)
+        self.assertEqual([], target.deployments_list())
+        self.assertEqual([], os.listdir(self.target_root))
@@ -0,0 +1,67 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from manager_rest import storage_manager
+from manager_rest.sqlite_storage_manager import SQLiteStorageManager
+from manager_rest.test.mocks import node_instance
+import test_storage_manager
+
+
+class SQLiteStorageManagerTests(test_storage_manager.StorageManagerTests):
+
+    storage_manager_module_name = 'sqlite_storage_manager'
+
+    def test_transaction_rollback(self):
+        sm = storage_manager.instance()
+        try:
+            with sm.transaction():
+                sm.put_node_instance(node_instance('vm_1'))
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        self.assertEquals([], sm.node_instances_list())
+
+    def test_node_instances_lookup(self):
+        sm = storage_manager.instance()
+        sm.put_node_instance(node_instance('vm_1', 'dep-1'))
+        sm.put_node_instance(node_instance('vm_2', 'dep-2',
+                                           runtime_properties={'a': 1}))
+        instances = sm.get_node_instances('dep-2')
+        self.assertEquals(['vm_2'], [i.id for i in instances])
+        self.assertEquals({'a': 1}, instances[0].runtime_properties)
+
+    def test_columns_added_to_existing_table(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        db_path = os.path.join(tmp_dir, 'storage.db')
+        # a deployments table stored before the environment fields existed
+        conn = sqlite3.connect(db_path)
+        conn.execute('CREATE TABLE deployments (storage_id TEXT PRIMARY KEY, '
+                     '"id" TEXT, "blueprint_id" TEXT)')
+        conn.execute("INSERT INTO deployments VALUES ('dep-1', 'dep-1', "
+                     "'blueprint')")
+        conn.commit()
+        conn.close()
+
+        sm = SQLiteStorageManager(db_path)
+
+        deployment = sm.get_deployment('dep-1')
+        self.assertEquals('blueprint', deployment.blueprint_id)
+        self.assertIsNone(deployment.environment_status)
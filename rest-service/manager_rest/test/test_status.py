@@ -13,6 +13,9 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
+import unittest
+
+from manager_rest.service_status import ServiceStatusCache
 from base_test import BaseServerTestCase
 
 
@@ -25,3 +28,63 @@ class StatusTestCase(BaseServerTestCase):
     def test_get_services(self):
         result = self.get('/status')
         self.assertEqual(type(result.json['services']), list)
+
+    def test_get_fresh(self):
+        result = self.get('/status', query_params={'fresh': 'true'})
+        self.assertEqual(result.json['status'], 'running')
+        self.assertIsInstance(result.json['age'], (int, float))
+        self.assertTrue(result.json['age'] < 1)
+        result = self.get('/status', query_params={'fresh': 'yes'})
+        self.assertEqual(400, result.status_code)
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ServiceStatusCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.collected = 0
+
+    def collect(self):
+        self.collected += 1
+        return [{'display_name': 'Service {0}'.format(self.collected)}]
+
+    def cache(self, refresh_interval=3600):
+        # not refreshed in the background while the test runs
+        return ServiceStatusCache(refresh_interval, collect=self.collect,
+                                  clock=self.clock)
+
+    def test_cached(self):
+        cache = self.cache()
+        self.assertEqual(([{'display_name': 'Service 1'}], 0), cache.get())
+        self.clock.now += 5
+        self.assertEqual(([{'display_name': 'Service 1'}], 5), cache.get())
+        self.assertEqual(1, self.collected)
+
+    def test_fresh(self):
+        cache = self.cache()
+        cache.get()
+        self.clock.now += 5
+        self.assertEqual(([{'display_name': 'Service 2'}], 0),
+                         cache.get(fresh=True))
+
+    def test_refresh(self):
+        cache = self.cache()
+        cache.get()
+        self.clock.now += 5
+        cache.refresh()
+        self.assertEqual(([{'display_name': 'Service 2'}], 0), cache.get())
+
+    def test_disabled(self):
+        cache = self.cache(refresh_interval=0)
+        cache.get()
+        cache.get()
+        self.assertEqual(2, self.collected)
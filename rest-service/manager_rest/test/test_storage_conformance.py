@@ -0,0 +1,31 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import unittest
+
+from manager_rest.test.benchmarks import storage_benchmark
+
+
+class StorageConformanceTests(unittest.TestCase):
+
+    def test_backends_conform(self):
+        mismatches, results = storage_benchmark.check_conformance(
+            storage_benchmark.BACKENDS.keys(), deployments=2, instances=3)
+        self.assertEquals(set(storage_benchmark.BACKENDS.keys()),
+                          set(results.keys()))
+        for backend_name, backend_mismatches in mismatches.items():
+            self.assertEquals([], backend_mismatches,
+                              '{0} does not conform: {1}'.format(
+                                  backend_name, backend_mismatches))
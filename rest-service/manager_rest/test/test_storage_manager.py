@@ -33,8 +33,8 @@ class StorageManagerTests(base_test.BaseServerTestCase):
             storage_manager.instance().get_blueprint('blueprint-id')
         bp_from_delete = storage_manager.instance().delete_blueprint(
             'blueprint-id')
-        self.assertEquals(blueprint.__dict__, blueprint_from_list.__dict__)
-        self.assertEquals(blueprint.__dict__, blueprint_restored.__dict__)
+        self.assertEquals(blueprint.to_dict(), blueprint_from_list.to_dict())
+        self.assertEquals(blueprint.to_dict(), blueprint_restored.to_dict())
         # in bp returned from delete operation only 'id' is guaranteed to
         # return
         self.assertEquals(blueprint.id, bp_from_delete.id)
@@ -97,10 +97,10 @@ class StorageManagerTests(base_test.BaseServerTestCase):
                 'blueprint-id')
 
         self.assertEquals(2, len(blueprint_deployments))
-        self.assertEquals(deployment1.__dict__,
-                          blueprint_deployments[0].__dict__)
-        self.assertEquals(deployment2.__dict__,
-                          blueprint_deployments[1].__dict__)
+        self.assertEquals(deployment1.to_dict(),
+                          blueprint_deployments[0].to_dict())
+        self.assertEquals(deployment2.to_dict(),
+                          blueprint_deployments[1].to_dict())
 
     def test_model_serialization(self):
         dep = models.Deployment(id='dep-id',
@@ -114,15 +114,19 @@ class StorageManagerTests(base_test.BaseServerTestCase):
                                 policy_types={},
                                 policy_triggers={},
                                 groups={},
-                                outputs={})
+                                outputs={},
+                                environment_status='terminated',
+                                environment_error='')
 
         serialized_dep = dep.to_dict()
-        self.assertEquals(11, len(serialized_dep))
+        self.assertEquals(13, len(serialized_dep))
         self.assertEquals(dep.id, serialized_dep['id'])
         self.assertEquals(dep.created_at, serialized_dep['created_at'])
         self.assertEquals(dep.updated_at, serialized_dep['updated_at'])
         self.assertEquals(dep.blueprint_id, serialized_dep['blueprint_id'])
         self.assertEquals(dep.permalink, serialized_dep['permalink'])
+        self.assertEquals('terminated', serialized_dep['environment_status'])
+        self.assertEquals('', serialized_dep['environment_error'])
 
         deserialized_dep = models.Deployment(**serialized_dep)
         self.assertEquals(dep.id, deserialized_dep.id)
@@ -130,6 +134,10 @@ class StorageManagerTests(base_test.BaseServerTestCase):
         self.assertEquals(dep.updated_at, deserialized_dep.updated_at)
         self.assertEquals(dep.blueprint_id, deserialized_dep.blueprint_id)
         self.assertEquals(dep.permalink, deserialized_dep.permalink)
+        self.assertEquals(dep.environment_status,
+                          deserialized_dep.environment_status)
+        self.assertEquals(dep.environment_error,
+                          deserialized_dep.environment_error)
 
     def test_fields_query(self):
         now = str(datetime.now())
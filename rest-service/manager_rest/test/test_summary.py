@@ -0,0 +1,82 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+from manager_rest import storage_manager
+from base_test import BaseServerTestCase
+
+
+class SummaryTest(BaseServerTestCase):
+
+    def test_deployment_summary(self):
+        _, deployment_id, _, _ = self.put_deployment('deployment')
+        node_instances = storage_manager.instance().get_node_instances(
+            deployment_id)
+
+        response = self.get('/deployments/deployment/summary')
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('deployment', response.json['deployment_id'])
+        self.assertEqual({'uninitialized': len(node_instances)},
+                         response.json['node_instances'])
+        self.assertEqual({'terminated': 1}, response.json['executions'])
+
+    def test_nonexisting_deployment_summary(self):
+        response = self.get('/deployments/missing/summary')
+        self.assertEqual(404, response.status_code)
+
+    def test_node_instances_summary(self):
+        self.put_deployment('deployment-1', blueprint_id='blueprint-1')
+        self.put_deployment('deployment-2', blueprint_id='blueprint-2')
+        total = len(storage_manager.instance().node_instances_list())
+
+        response = self.get('/summary/node-instances')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['state'], response.json['group_by'])
+        self.assertEqual([{'state': 'uninitialized', 'count': total}],
+                         response.json['items'])
+
+        response = self.get('/summary/node-instances',
+                            query_params={'group_by': 'state,deployment_id'})
+        self.assertEqual(['state', 'deployment_id'],
+                         response.json['group_by'])
+        self.assertEqual(['deployment-1', 'deployment-2'],
+                         sorted(item['deployment_id']
+                                for item in response.json['items']))
+        self.assertEqual(total, sum(item['count']
+                                    for item in response.json['items']))
+
+        response = self.get('/summary/node-instances',
+                            query_params={'group_by': 'state',
+                                          'deployment_id': 'deployment-1'})
+        self.assertEqual(
+            len(storage_manager.instance().get_node_instances(
+                'deployment-1')),
+            response.json['items'][0]['count'])
+
+    def test_executions_summary(self):
+        self.put_deployment('deployment')
+        response = self.get('/summary/executions',
+                            query_params={'group_by': 'workflow_id,status'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([{'workflow_id': 'create_deployment_environment',
+                           'status': 'terminated',
+                           'count': 1}],
+                         response.json['items'])
+
+    def test_summary_bad_group_by(self):
+        for group_by in ('runtime_properties', 'state,state', ''):
+            response = self.get('/summary/node-instances',
+                                query_params={'group_by': group_by})
+            self.assertEqual(400, response.status_code)
@@ -0,0 +1,46 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import sys
+import unittest
+import subprocess
+
+from manager_rest import utils
+
+try:
+    import gevent
+except ImportError:
+    gevent = None
+
+
+@unittest.skipIf(gevent is None, 'gevent is not installed')
+class CooperativeModeTest(unittest.TestCase):
+
+    def _cooperative_mode(self, patch):
+        # monkey patching can not be undone, so it is done in a separate
+        # process
+        script = 'from manager_rest import utils\n'
+        if patch:
+            script = 'from gevent import monkey\n' \
+                     'monkey.patch_all()\n' + script
+        script += 'print utils.cooperative_mode()\n'
+        return subprocess.check_output([sys.executable, '-c', script])
+
+    def test_not_patched(self):
+        self.assertFalse(utils.cooperative_mode())
+        self.assertEqual('False\n', self._cooperative_mode(patch=False))
+
+    def test_patched(self):
+        self.assertEqual('True\n', self._cooperative_mode(patch=True))
@@ -72,6 +72,21 @@ def copy_resources(file_server_root, resources_path=None):
                                                   'cloudify'))
 
 
+def cooperative_mode():
+    """
+    Whether the rest service runs in cooperative mode, i.e. served by
+    gevent workers with a monkey patched standard library (see
+    gunicorn_config.py).
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    # the originals of the patched items are saved by module name
+    # (monkey.is_module_patched is only available as of gevent 1.1)
+    return 'socket' in monkey.saved
+
+
 def maybe_register_teardown(app, f):
     """
     A way to add a cleanup hook on a given appcontext - but only do it once
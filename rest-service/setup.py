@@ -40,5 +40,9 @@ setup(
         'elasticsearch==1.0.0',
         'celery==3.1.17',
         'flask-securest==0.6',
-    ]
+    ],
+    extras_require={
+        # cooperative serving (see manager_rest/gunicorn_config.py)
+        'gevent': ['gevent==1.0.1'],
+    }
 )
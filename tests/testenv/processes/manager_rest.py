@@ -101,6 +101,7 @@ class ManagerRestProcess(object):
 
         manager_rest_command = [
             '{0}/gunicorn'.format(dirname(python_path)),
+            '-c', 'gunicorn_config.py',
             '-w', '2',
             '-b', '0.0.0.0:{0}'.format(self.port),
             '--timeout', '300',
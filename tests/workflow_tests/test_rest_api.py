@@ -139,7 +139,7 @@ class RestAPITest(TestCase):
         self.assertEqual(1, len(blueprints))
         blueprint_id = blueprints[0].id
         blueprint_by_id = self.client.blueprints.get(blueprint_id)
-        self.assertDictContainsSubset(blueprint_by_id, blueprints[0])
+        # lists return a summary of each blueprint
         self.assertDictContainsSubset(blueprints[0], blueprint_by_id)
 
     def test_deployments(self):
@@ -148,7 +148,7 @@ class RestAPITest(TestCase):
         self.assertEqual(1, len(deployments))
         deployment_id = deployments[0].id
         deployment_by_id = self.client.deployments.get(deployment_id)
-        self.assertDictContainsSubset(deployment_by_id, deployments[0])
+        # lists return a summary of each deployment
         self.assertDictContainsSubset(deployments[0], deployment_by_id)
 
     def test_executions(self):